@@ -1,6 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import CustomUser, Route, Station, Bus, Seat, Booking
+from django.db.models.expressions import RawSQL
+from . import search
+from .caching import bump
+from .models import (
+    CustomUser, Route, Station, Bus, Seat, Booking, HotDeparture, BookingRequest,
+    Schedule, ScheduleException, Trip, BookingEvent, ArchivedBooking, Ticket,
+)
 
 @admin.register(CustomUser)
 class CustomUserAdmin(BaseUserAdmin):
@@ -9,7 +15,9 @@ class CustomUserAdmin(BaseUserAdmin):
     )
     list_display = ('username', 'email', 'role', 'is_staff', 'is_superuser')
     list_filter = ('role',)
-    search_fields = ('username', 'email')
+    # Prefix and exact matches can use the indexes; bookings are searched
+    # by customer through the booking search instead.
+    search_fields = ('^username', '=email')
 
 @admin.register(Route)
 class RouteAdmin(admin.ModelAdmin):
@@ -25,23 +33,151 @@ class StationAdmin(admin.ModelAdmin):
     search_fields = ('name', 'route__name')
     ordering = ('route', 'order')
 
+class ScheduleInline(admin.TabularInline):
+    model = Schedule
+    # A new bus does not run until it is given a schedule.
+    extra = 1
+
 @admin.register(Bus)
 class BusAdmin(admin.ModelAdmin):
-    list_display = ('plate_number', 'route', 'capacity', 'price_per_seat', 'student_discount', 'departure_time', 'arrival_time', 'status')
+    list_display = ('plate_number', 'route', 'capacity', 'seat_layout', 'price_per_seat', 'student_discount', 'status')
     list_filter = ('route', 'status')
     search_fields = ('plate_number',)
     ordering = ('plate_number',)
+    inlines = [ScheduleInline]
+
+class ScheduleExceptionInline(admin.TabularInline):
+    model = ScheduleException
+    extra = 0
+
+@admin.register(Schedule)
+class ScheduleAdmin(admin.ModelAdmin):
+    list_display = ('bus', 'departure_time', 'arrival_time', 'days_of_week', 'valid_from', 'valid_until', 'is_active')
+    list_filter = ('is_active', 'bus__route')
+    search_fields = ('bus__plate_number',)
+    ordering = ('bus', 'departure_time')
+    inlines = [ScheduleExceptionInline]
+
+@admin.register(Trip)
+class TripAdmin(admin.ModelAdmin):
+    list_display = ('bus', 'route', 'travel_date', 'departure_time', 'arrival_time')
+    list_filter = ('route', 'travel_date')
+    search_fields = ('bus__plate_number',)
+    ordering = ('-travel_date', 'departure_time')
 
 @admin.register(Seat)
 class SeatAdmin(admin.ModelAdmin):
-    list_display = ('seat_number', 'bus', 'is_available', 'is_reserved')
-    list_filter = ('bus', 'is_available', 'is_reserved')
+    list_display = ('seat_number', 'bus', 'deck', 'row', 'column', 'position', 'is_available', 'is_reserved')
+    list_filter = ('bus', 'position', 'is_available', 'is_reserved')
     search_fields = ('seat_number', 'bus__plate_number')
-    ordering = ('bus', 'seat_number')
+    ordering = ('bus', 'deck', 'row', 'column', 'seat_number')
+
+def bump_ticket_buses(buses):
+    """
+    Invalidate the seat maps and availability of (bus_id, route_id) pairs.
+    """
+    tags = {tag for bus_id, route_id in buses for tag in (f'bus:{bus_id}', f'route:{route_id}')}
+    if tags:
+        bump(*tags)
+
+
+class BookingSearchMixin:
+    """
+    Admin search through the booking search index (api.search) instead of
+    LIKE scans over `search_fields`, which only enable the search box.
+    """
+    booking_lookup = 'id'
+
+    def get_search_results(self, request, queryset, search_term):
+        matched = search.matches(search_term)
+        if matched is None:
+            return queryset, False
+        # Every match, as a subquery; the changelist paginates.
+        return queryset.filter(**{f'{self.booking_lookup}__in': RawSQL(*matched)}), False
+
+class TicketInline(admin.TabularInline):
+    model = Ticket
+    extra = 0
+    raw_id_fields = ('seat',)
 
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(BookingSearchMixin, admin.ModelAdmin):
     list_display = ('receipt_id', 'user', 'bus', 'travel_date', 'total_price', 'status', 'booking_date')
+    raw_id_fields = ('trip',)
+    inlines = [TicketInline]
     list_filter = ('bus', 'travel_date', 'status')
     search_fields = ('user__username', 'receipt_id', 'bus__plate_number')
     ordering = ('-booking_date',)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Once for all the inline tickets (see api.search), and for the
+        # tickets deleted inline, which send no signals.
+        search.index_bookings([form.instance.pk])
+        bump_ticket_buses([(form.instance.bus_id, form.instance.bus.route_id)])
+
+@admin.register(Ticket)
+class TicketAdmin(BookingSearchMixin, admin.ModelAdmin):
+    booking_lookup = 'booking_id'
+    list_display = ('booking', 'seat', 'travel_date', 'passenger_name', 'passenger_phone', 'passenger_type', 'price')
+    list_filter = ('travel_date', 'passenger_type')
+    raw_id_fields = ('booking', 'seat')
+    search_fields = ('=passenger_phone', 'passenger_name', 'booking__receipt_id')
+    ordering = ('-travel_date',)
+
+    # Tickets send no signals for the search index (see api.search), nor
+    # any when deleted.
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        search.index_bookings({obj.booking_id, form.initial.get('booking', obj.booking_id)})
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        search.index_bookings([obj.booking_id])
+        bump_ticket_buses([(obj.booking.bus_id, obj.booking.bus.route_id)])
+
+    def delete_queryset(self, request, queryset):
+        booking_ids = set(queryset.values_list('booking_id', flat=True))
+        buses = set(queryset.values_list('booking__bus_id', 'booking__bus__route_id'))
+        super().delete_queryset(request, queryset)
+        search.index_bookings(booking_ids)
+        bump_ticket_buses(buses)
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(admin.ModelAdmin):
+    list_display = ('receipt_id', 'user', 'bus', 'travel_date', 'total_price', 'status', 'archived_at')
+    list_filter = ('status',)
+    raw_id_fields = ('user', 'bus')
+    search_fields = ('user__username', 'receipt_id')
+    ordering = ('-travel_date',)
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(BookingEvent)
+class BookingEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'booking_id', 'bus_id', 'previous_status', 'status', 'created_at')
+    list_filter = ('event_type', 'status')
+    search_fields = ('=booking_id',)
+    ordering = ('-id',)
+
+    # The log is append-only.
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(HotDeparture)
+class HotDepartureAdmin(admin.ModelAdmin):
+    list_display = ('bus', 'travel_date', 'created_at')
+    list_filter = ('travel_date',)
+    search_fields = ('bus__plate_number',)
+    ordering = ('-travel_date',)
+
+@admin.register(BookingRequest)
+class BookingRequestAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'bus', 'travel_date', 'status', 'created_at', 'processed_at')
+    list_filter = ('status', 'travel_date')
+    raw_id_fields = ('user', 'bus', 'booking')
+    ordering = ('-id',)
@@ -0,0 +1,246 @@
+"""
+Queued booking admission for hot departures.
+
+While a bus/date is marked as a HotDeparture, BookingCreateAPIView only
+records a BookingRequest and answers 202. A worker (`manage.py
+process_booking_queue`) drains each bus/date queue in FIFO batches: one
+transaction locks the bus row, loads the taken seats once, allocates seats
+for the whole batch in memory (picking them for requests that only give a
+seat count) and bulk-inserts the bookings. Requests for
+the same departure therefore never contend with each other on the database.
+
+A batch that fails is rolled back and decided again a request at a time;
+a request that fails on its own is rejected, so one bad request (say, a
+passenger name too long for the column) cannot stop the queue behind it.
+Operational errors (a lost connection, a lock timeout) reject nothing:
+the departure is retried on the worker's next pass.
+"""
+import logging
+import time
+
+from django.db import OperationalError, transaction
+from django.utils import timezone
+
+from . import events, search
+from .caching import bump
+from .models import Booking, BookingRequest, Bus, HotDeparture, Seat, Ticket
+from .routers import use_primary
+from .schedules import trips_for
+from .seatmap import assign, sort_seats
+from .segments import route_indexes, seat_masks, segment_count, segment_span, span_mask
+from .serializers import build_tickets, generate_receipt_ids, price_seats
+
+
+BATCH_SIZE = 200
+POLL_INTERVAL = 0.25
+# Long-poll re-reads: the first after WAIT_POLL_FIRST seconds, then at
+# doubling intervals up to WAIT_POLL_MAX.
+WAIT_POLL_FIRST = 0.05
+WAIT_POLL_MAX = 1.0
+FAILED_ERROR = "This booking could not be processed."
+
+logger = logging.getLogger(__name__)
+
+
+def is_hot(bus_id, travel_date):
+    return HotDeparture.objects.filter(bus_id=bus_id, travel_date=travel_date).exists()
+
+
+def pending_keys():
+    return list(
+        BookingRequest.objects
+        .filter(status='queued')
+        .values_list('bus_id', 'travel_date')
+        .distinct()
+    )
+
+
+def process_batch(bus_id, travel_date, batch_size=BATCH_SIZE):
+    """
+    Decide up to `batch_size` queued requests for one departure, oldest
+    first. Returns the number of requests processed.
+    """
+    with transaction.atomic():
+        # Serializes workers on the same departure.
+        bus = Bus.objects.select_for_update().get(pk=bus_id)
+        requests = list(
+            BookingRequest.objects
+            .select_for_update()
+            .filter(status='queued', bus_id=bus_id, travel_date=travel_date)
+            .order_by('id')[:batch_size]
+        )
+        if not requests:
+            return 0
+
+        if all(request.seat_ids for request in requests):
+            seats = Seat.objects.in_bulk(
+                [seat_id for request in requests for seat_id in request.seat_ids]
+            )
+            layout = []
+        else:
+            # Some requests leave the seats to us (see api.seatmap).
+            seats = Seat.objects.filter(bus_id=bus_id).in_bulk()
+            layout = [(seat.id, seat.deck, seat.row, seat.column) for seat in sort_seats(seats.values())]
+        trips = {trip.id: trip for trip in trips_for(travel_date, bus_id=bus_id)}
+        indexes = route_indexes({bus.route_id} | {trip.route_id for trip in trips.values()})
+        # Per trip, the route segments each seat is sold on (see api.segments).
+        masks = seat_masks(
+            ((trip.id, trip.bus_id, trip.travel_date, trip.route_id) for trip in trips.values()), indexes,
+        )
+        index = indexes[bus.route_id]
+
+        accepted = []
+        now = timezone.now()
+        for request in requests:
+            request.processed_at = now
+            request_seats = [seats.get(seat_id) for seat_id in request.seat_ids]
+            trip = trips.get(request.trip_id) if request.trip_id else (
+                next(iter(trips.values())) if len(trips) == 1 else None
+            )
+            start, end = segment_span(index, request.board_station_id, request.alight_station_id)
+            error = None
+            if trip is None:
+                error = f"Bus {bus.plate_number} has no single matching departure on {travel_date}"
+            elif any(
+                station_id is not None and station_id not in index
+                for station_id in (request.board_station_id, request.alight_station_id)
+            ):
+                error = f"Station is not on the route of bus {bus.plate_number}"
+            elif (request.board_station_id and request.alight_station_id
+                  and index[request.board_station_id] >= index[request.alight_station_id]):
+                error = "The alighting station must come after the boarding station."
+            elif not request.seat_ids and request.seat_count:
+                seat_ids = assign(layout, masks[trip.id], start, end, request.seat_count, segment_count(index))
+                if seat_ids is None:
+                    error = f"Bus {bus.plate_number} has fewer than {request.seat_count} free seats on {travel_date}"
+                else:
+                    request.seat_ids = seat_ids
+                    request_seats = [seats[seat_id] for seat_id in seat_ids]
+            elif not request_seats:
+                error = "No seats requested."
+            elif len(set(request.seat_ids)) != len(request.seat_ids):
+                error = "The same seat was requested twice."
+            else:
+                for seat_id, seat in zip(request.seat_ids, request_seats):
+                    if seat is None or seat.bus_id != bus.id:
+                        error = f"Seat {seat.seat_number if seat else seat_id} does not belong to bus {bus.plate_number}"
+                        break
+                    if masks[trip.id][seat.id] & span_mask(start, end):
+                        error = f"Seat {seat.seat_number} is already booked for {travel_date}"
+                        break
+            if error:
+                request.status = 'rejected'
+                request.error = error
+                continue
+            for seat_id in request.seat_ids:
+                masks[trip.id][seat_id] |= span_mask(start, end)
+            accepted.append((request, request_seats, trip))
+
+        receipt_ids = generate_receipt_ids(len(accepted))
+        bookings = Booking.objects.bulk_create([
+            Booking(
+                user_id=request.user_id,
+                bus=bus,
+                travel_date=travel_date,
+                trip=trip,
+                board_station_id=request.board_station_id,
+                alight_station_id=request.alight_station_id,
+                total_price=price_seats(bus, request_seats, request.passenger_info),
+                receipt_id=receipt_id,
+            )
+            for (request, request_seats, trip), receipt_id in zip(accepted, receipt_ids)
+        ])
+        Ticket.objects.bulk_create([
+            ticket
+            for booking, (request, request_seats, _) in zip(bookings, accepted)
+            for ticket in build_tickets(booking, request_seats, request.passenger_info)
+        ])
+        search.index_bookings([booking.id for booking in bookings])
+        events.record_created(bookings, ([seat.id for seat in request_seats] for _, request_seats, _ in accepted))
+        for booking, (request, _, _) in zip(bookings, accepted):
+            request.status = 'completed'
+            request.booking = booking
+        BookingRequest.objects.bulk_update(requests, ['seat_ids', 'status', 'error', 'booking', 'processed_at'])
+
+        if bookings:
+            # bulk_create sends no signals.
+            transaction.on_commit(lambda: bump(f'bus:{bus.id}', f'route:{bus.route_id}'))
+    return len(requests)
+
+
+def reject_oldest(bus_id, travel_date):
+    """
+    Reject the request at the head of a departure's queue. Returns the
+    number of requests rejected.
+    """
+    oldest = (
+        BookingRequest.objects.filter(status='queued', bus_id=bus_id, travel_date=travel_date)
+        .order_by('id').values_list('id', flat=True).first()
+    )
+    if oldest is None:
+        return 0
+    return BookingRequest.objects.filter(pk=oldest, status='queued').update(
+        status='rejected', error=FAILED_ERROR, processed_at=timezone.now(),
+    )
+
+
+def drain(bus_id, travel_date, batch_size=BATCH_SIZE):
+    """
+    process_batch() that rejects the requests it fails on instead of
+    raising (see the module docstring). Returns the number of requests
+    decided.
+    """
+    try:
+        return process_batch(bus_id, travel_date, batch_size)
+    except OperationalError:
+        logger.exception("Booking queue of bus %s on %s failed; retrying later", bus_id, travel_date)
+        return 0
+    except Exception:
+        logger.exception("Booking batch of bus %s on %s failed; deciding it a request at a time",
+                         bus_id, travel_date)
+    processed = 0
+    for _ in range(batch_size):
+        try:
+            count = process_batch(bus_id, travel_date, 1)
+        except OperationalError:
+            logger.exception("Booking queue of bus %s on %s failed; retrying later", bus_id, travel_date)
+            break
+        except Exception:
+            logger.exception("Rejecting the oldest booking request of bus %s on %s", bus_id, travel_date)
+            count = reject_oldest(bus_id, travel_date)
+        if not count:
+            break
+        processed += count
+    return processed
+
+
+def run_worker(batch_size=BATCH_SIZE, idle_sleep=POLL_INTERVAL, once=False):
+    """
+    Drain every departure's queue, then wait for more (or return if `once`).
+    """
+    while True:
+        processed = 0
+        for bus_id, travel_date in pending_keys():
+            processed += drain(bus_id, travel_date, batch_size)
+        if once and not processed:
+            return
+        if not processed:
+            time.sleep(idle_sleep)
+
+
+def wait_for_result(booking_request, timeout):
+    """
+    Long-poll helper: the BookingRequest once it is decided, or as it stands
+    after `timeout` seconds. Reads from the primary, where the worker writes.
+    """
+    deadline = time.monotonic() + timeout
+    interval = WAIT_POLL_FIRST
+    with use_primary():
+        while booking_request.status == 'queued':
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, WAIT_POLL_MAX)
+            booking_request.refresh_from_db(fields=['status', 'error', 'booking', 'processed_at'])
+    return booking_request
@@ -0,0 +1,351 @@
+"""
+Occupancy and demand analytics.
+
+Sold seats are kept in DailyLoad (one row per bus, travel date and
+departure hour, the hour of the booked trip). A full rebuild folds in
+every booking; an incremental run folds in only the
+booking events (api.events) logged since the previous run, so new
+bookings, cancellations and deletions are all accounted for without
+rescanning Booking.
+Load factors and forecasts are then computed with NumPy over a columnar
+snapshot of DailyLoad and stored on an AnalyticsRun, which the admin
+endpoint serves without further work.
+
+Seats offered come from the schedules (api.schedules.running): a bus
+offers its capacity once per departure its schedules run in the window,
+whether or not anything was sold, and a departure that sold seats counts
+as run even if no schedule shows it any more.
+"""
+from collections import Counter
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Max
+
+from . import events, sequencing
+from .models import AnalyticsRun, ArchivedBooking, Booking, BookingEvent, Bus, DailyLoad, Trip
+from .schedules import running, with_times
+
+
+HISTORY_DAYS = 56
+FORECAST_DAYS = 14
+EPOCH = date(1970, 1, 1)
+SOLD_STATUSES = Booking.SOLD_STATUSES
+
+
+def _to_days(dates):
+    return np.array([(d - EPOCH).days for d in dates], dtype=np.int64)
+
+
+def _weekday(days):
+    # 1970-01-01 was a Thursday (weekday 3).
+    return (days + 3) % 7
+
+
+# ----- Folding bookings and events into DailyLoad -----
+
+def booking_columns(since_id=0, until_id=None):
+    """
+    Columnar snapshot of sold bookings with since_id < id <= until_id,
+    archived ones included: (bus_ids, travel_days, trip_ids, seats) as NumPy
+    arrays, trip id 0 for bookings without one.
+    """
+    bookings = Booking.objects.filter(id__gt=since_id, status__in=SOLD_STATUSES)
+    archived = ArchivedBooking.objects.filter(id__gt=since_id, status__in=SOLD_STATUSES)
+    if until_id is not None:
+        bookings = bookings.filter(id__lte=until_id)
+        archived = archived.filter(id__lte=until_id)
+    rows = list(
+        bookings.annotate(seat_count=Count('seats'))
+        .values_list('bus_id', 'travel_date', 'trip_id', 'seat_count')
+    )
+    rows += [
+        (bus_id, travel_date, trip_id, len(seats))
+        for bus_id, travel_date, trip_id, seats in archived.values_list('bus_id', 'travel_date', 'trip', 'seats')
+    ]
+    bus_ids, travel_dates, trip_ids, seats = zip(*rows) if rows else ((), (), (), ())
+    return (
+        np.array(bus_ids, dtype=np.int64),
+        _to_days(travel_dates),
+        np.array([trip_id or 0 for trip_id in trip_ids], dtype=np.int64),
+        np.array(seats, dtype=np.int64),
+    )
+
+
+def event_columns(page):
+    """
+    (bus_ids, travel_days, trip_ids, seat changes) for a page of
+    BookingEvents: each event adds or removes the booking's seats when it
+    moves the booking into or out of a sold status.
+    """
+    bus_ids, days, trip_ids, seats = [], [], [], []
+    for event in page:
+        sold_before = (
+            event.previous_status in SOLD_STATUSES if event.event_type == BookingEvent.STATUS_CHANGED
+            else event.event_type == BookingEvent.DELETED and event.status in SOLD_STATUSES
+        )
+        sold_after = event.event_type != BookingEvent.DELETED and event.status in SOLD_STATUSES
+        if sold_before != sold_after:
+            bus_ids.append(event.bus_id)
+            days.append(date.fromisoformat(event.payload['travel_date']))
+            trip_ids.append(event.payload.get('trip') or 0)
+            seats.append(len(event.payload['seats']) * (1 if sold_after else -1))
+    return (
+        np.array(bus_ids, dtype=np.int64),
+        _to_days(days),
+        np.array(trip_ids, dtype=np.int64),
+        np.array(seats, dtype=np.int64),
+    )
+
+
+def fold_bookings(since_id, until_id):
+    """
+    Add the seats of bookings (since_id, until_id] to DailyLoad.
+    Returns the number of bookings processed.
+    """
+    columns = booking_columns(since_id, until_id)
+    add_loads(*columns)
+    return len(columns[0])
+
+
+def fold_events(since, until):
+    """
+    Apply the events with sequence numbers (since, until] to DailyLoad, a
+    page at a time. Returns (events processed, sequence of the last one).
+    """
+    processed, last = 0, since
+    while True:
+        page = events.stream(last, until=until)
+        if not page:
+            return processed, last
+        add_loads(*event_columns(page))
+        processed += len(page)
+        last = page[-1].sequence
+
+
+def departure_hour(departure_time):
+    # Buses without an active schedule are counted at midnight.
+    return departure_time.hour if departure_time else 0
+
+
+def add_loads(bus_ids, days, trip_ids, seats):
+    """
+    Add `seats` (which may be negative) to the DailyLoad of each
+    (bus, travel day, departure hour), creating the rows that do not exist
+    yet. The hour is the booked trip's; bookings without a trip (or whose
+    trip is gone) count at the bus's first departure of the day.
+    """
+    if not len(bus_ids):
+        return
+
+    buses = {
+        bus['id']: bus
+        for bus in with_times(Bus.objects.filter(id__in=np.unique(bus_ids).tolist()))
+        .values('id', 'route_id', 'capacity', 'departure_time')
+    }
+    trips = dict(
+        Trip.objects.filter(id__in=np.unique(trip_ids[trip_ids > 0]).tolist()).values_list('id', 'departure_time')
+    )
+    hours = np.array([
+        departure_hour(trips.get(trip_id) or buses.get(bus_id, {}).get('departure_time'))
+        for bus_id, trip_id in zip(bus_ids.tolist(), trip_ids.tolist())
+    ], dtype=np.int64)
+
+    keys, inverse = np.unique(np.stack([bus_ids, days, hours], axis=1), axis=0, return_inverse=True)
+    totals = np.bincount(inverse.ravel(), weights=seats, minlength=len(keys)).astype(np.int64)
+
+    travel_dates = [EPOCH + timedelta(days=int(day)) for day in keys[:, 1]]
+    existing = {
+        (load.bus_id, load.travel_date, load.departure_hour): load
+        for load in DailyLoad.objects.filter(
+            bus_id__in=list(buses), travel_date__in=set(travel_dates)
+        )
+    }
+
+    to_create, to_update = [], []
+    for (bus_id, _, hour), travel_date, total in zip(keys.tolist(), travel_dates, totals.tolist()):
+        bus = buses.get(bus_id)
+        if bus is None:
+            continue
+        load = existing.get((bus_id, travel_date, hour))
+        if load is None:
+            to_create.append(DailyLoad(
+                bus_id=bus_id, route_id=bus['route_id'], travel_date=travel_date,
+                weekday=travel_date.weekday(), departure_hour=hour,
+                seats_booked=max(0, total), capacity=bus['capacity'],
+            ))
+        else:
+            load.seats_booked = max(0, load.seats_booked + total)
+            load.capacity = bus['capacity']
+            to_update.append(load)
+
+    DailyLoad.objects.bulk_create(to_create, batch_size=500)
+    DailyLoad.objects.bulk_update(to_update, ['seats_booked', 'capacity'], batch_size=500)
+
+
+# ----- Load factors -----
+
+def _grouped(keys, sold, capacity):
+    """
+    Sum sold seats and offered capacity per key, returning
+    [{'key': k, 'load_factor': f, 'seats_sold': s, 'seats_offered': c}].
+    """
+    if not len(keys):
+        return []
+    unique, inverse = np.unique(keys, return_inverse=True)
+    sold_sum = np.bincount(inverse, weights=sold, minlength=len(unique))
+    cap_sum = np.bincount(inverse, weights=capacity, minlength=len(unique))
+    factor = np.divide(sold_sum, cap_sum, out=np.zeros_like(sold_sum), where=cap_sum > 0)
+    return [
+        {
+            'key': key,
+            'load_factor': round(f, 4),
+            'seats_sold': int(s),
+            'seats_offered': int(c),
+        }
+        for key, f, s, c in zip(unique.tolist(), factor.tolist(), sold_sum.tolist(), cap_sum.tolist())
+    ]
+
+
+def load_factors(today, history_days=HISTORY_DAYS):
+    """
+    Load factor per bus, route, weekday and departure hour over the last
+    `history_days` days before `today`.
+    """
+    start = today - timedelta(days=history_days)
+    fleet = {
+        bus_id: (route_id, capacity)
+        for bus_id, route_id, capacity in Bus.objects.filter(status='active').values_list('id', 'route_id', 'capacity')
+    }
+
+    # Departures per (bus, day, hour) in the window, as scheduled.
+    departures = Counter(
+        (schedule.bus_id, travel_date, schedule.departure_time.hour)
+        for schedule, travel_date in running(start, today - timedelta(days=1))
+    )
+    sold = {}
+    for bus_id, travel_date, hour, seats in (
+        DailyLoad.objects
+        .filter(bus_id__in=list(fleet), travel_date__gte=start, travel_date__lt=today)
+        .values_list('bus_id', 'travel_date', 'departure_hour', 'seats_booked')
+    ):
+        sold[bus_id, travel_date, hour] = seats
+        if (bus_id, travel_date, hour) not in departures:
+            departures[bus_id, travel_date, hour] = 1
+    if not departures:
+        return {'bus': [], 'route': [], 'weekday': [], 'departure_hour': []}
+
+    # One slot per (bus, day, hour) that ran: sold seats default to 0.
+    slots = list(departures)
+    slot_bus = np.array([bus_id for bus_id, _, _ in slots], dtype=np.int64)
+    slot_day = _to_days([travel_date for _, travel_date, _ in slots])
+    slot_hour = np.array([hour for _, _, hour in slots], dtype=np.int64)
+    slot_route = np.array([fleet[bus_id][0] for bus_id in slot_bus.tolist()], dtype=np.int64)
+    capacity = np.array([fleet[slot[0]][1] * departures[slot] for slot in slots], dtype=np.float64)
+    sold = np.array([sold.get(slot, 0) for slot in slots], dtype=np.float64)
+    return {
+        'bus': _grouped(slot_bus, sold, capacity),
+        'route': _grouped(slot_route, sold, capacity),
+        'weekday': _grouped(_weekday(slot_day), sold, capacity),
+        'departure_hour': _grouped(slot_hour, sold, capacity),
+    }
+
+
+# ----- Forecasts -----
+
+def forecast_demand(today, horizon_days=FORECAST_DAYS, history_days=HISTORY_DAYS):
+    """
+    Expected seats per active bus for each of the next `horizon_days` days:
+    the average sold on the same weekday over the history window, and never
+    less than what is already booked for that date nor more than the seats
+    its scheduled departures offer.
+    """
+    fleet = list(Bus.objects.filter(status='active').values_list('id', 'capacity'))
+    if not fleet:
+        return []
+    fleet_ids = np.array([bus[0] for bus in fleet], dtype=np.int64)
+    fleet_cap = np.array([bus[1] for bus in fleet], dtype=np.float64)
+    index = {bus_id: i for i, bus_id in enumerate(fleet_ids.tolist())}
+    weeks = max(1, history_days // 7)
+
+    # Seats sold per (bus, weekday) in the window, averaged per week.
+    history = np.zeros((len(fleet), 7))
+    start = today - timedelta(days=weeks * 7)
+    past = DailyLoad.objects.filter(bus_id__in=list(index), travel_date__gte=start, travel_date__lt=today)
+    rows = list(past.values_list('bus_id', 'weekday', 'seats_booked'))
+    if rows:
+        bus_col, weekday_col, sold_col = (np.array(column, dtype=np.int64) for column in zip(*rows))
+        rows_index = np.array([index[bus_id] for bus_id in bus_col.tolist()], dtype=np.int64)
+        np.add.at(history, (rows_index, weekday_col), sold_col)
+    expected = history / weeks
+
+    # Seats offered on the upcoming dates.
+    end = today + timedelta(days=horizon_days)
+    departures = np.zeros((len(fleet), horizon_days))
+    for schedule, travel_date in running(today, end - timedelta(days=1)):
+        if schedule.bus_id in index:
+            departures[index[schedule.bus_id], (travel_date - today).days] += 1
+    offered = fleet_cap[:, None] * departures
+
+    # Already sold for the upcoming dates.
+    booked = np.zeros((len(fleet), horizon_days))
+    upcoming = DailyLoad.objects.filter(bus_id__in=list(index), travel_date__gte=today, travel_date__lt=end)
+    rows = list(upcoming.values_list('bus_id', 'travel_date', 'seats_booked'))
+    if rows:
+        rows_index = np.array([index[bus_id] for bus_id, _, _ in rows], dtype=np.int64)
+        offsets = np.array([(travel_date - today).days for _, travel_date, _ in rows], dtype=np.int64)
+        np.add.at(booked, (rows_index, offsets), [sold for _, _, sold in rows])
+
+    dates = [today + timedelta(days=offset) for offset in range(horizon_days)]
+    weekdays = np.array([d.weekday() for d in dates], dtype=np.int64)
+    # What is booked has been offered, whatever the schedules say now.
+    offered = np.maximum(offered, booked)
+    demand = np.minimum(np.maximum(expected[:, weekdays], booked), offered)
+    load = np.divide(demand, offered, out=np.zeros_like(demand), where=offered > 0)
+
+    return [
+        {
+            'bus': bus_id,
+            'travel_date': d.isoformat(),
+            'seats_offered': int(offered[i, j]),
+            'booked_seats': int(booked[i, j]),
+            'expected_seats': round(float(demand[i, j]), 2),
+            'expected_load_factor': round(float(load[i, j]), 4),
+        }
+        for i, bus_id in enumerate(fleet_ids.tolist())
+        for j, d in enumerate(dates)
+    ]
+
+
+# ----- Refresh job -----
+
+def refresh(full=False, today=None):
+    """
+    Fold the booking events since the previous run into DailyLoad and store
+    fresh load factors and forecasts. `full=True` rebuilds DailyLoad from
+    the bookings themselves; that is also what happens when there is no
+    previous run or it predates the event log.
+    """
+    today = today or date.today()
+    # Number the latest events before the transaction (see events.stream).
+    sequencing.stamp()
+    with transaction.atomic():
+        previous = AnalyticsRun.objects.order_by('-id').first()
+        full = full or previous is None or previous.last_sequence is None
+        last_booking_id = Booking.objects.aggregate(last=Max('id'))['last'] or 0
+        if full:
+            # Everything logged so far is reflected in the bookings read below.
+            last_sequence = BookingEvent.objects.aggregate(last=Max('sequence'))['last'] or 0
+            DailyLoad.objects.all().delete()
+            processed = fold_bookings(0, last_booking_id)
+        else:
+            processed, last_sequence = fold_events(previous.last_sequence, None)
+        return AnalyticsRun.objects.create(
+            full_rebuild=full,
+            last_booking_id=last_booking_id,
+            last_sequence=last_sequence,
+            bookings_processed=processed,
+            load_factors=load_factors(today),
+            forecasts=forecast_demand(today),
+        )
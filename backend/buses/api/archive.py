@@ -0,0 +1,108 @@
+"""
+Archival of past bookings.
+
+Booking and its tickets only need to hold departures that can still
+change: availability, admission and manifest sync all look at today and
+later. `archive()` moves bookings whose travel date is older than
+ARCHIVE_AFTER into ArchivedBooking, one batch per transaction, keeping
+each booking's id and receipt and folding its tickets into the seat ids
+and passenger JSON of the cold row. The hot tables then stay the size of
+the bookable window however long the history grows, and the history is
+read from the cold table only when a caller asks for it.
+
+Archiving is not a change to the booking, so the delete signals
+(event log, sync tombstones, cache invalidation, search index) stand
+down while a batch is moved; the batch leaves the search index at once.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.db import transaction
+
+from . import search
+from .fast_serializers import booking_tickets
+from .models import ArchivedBooking, Booking, BookingRequest, Ticket
+
+
+ARCHIVE_AFTER = timedelta(days=90)
+ARCHIVE_BATCH = 500
+
+_archiving = ContextVar('archiving', default=False)
+
+
+def archiving():
+    """
+    True while bookings are being moved to the archive.
+    """
+    return _archiving.get()
+
+
+@contextmanager
+def _moving():
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+def archive_batch(before, batch_size=ARCHIVE_BATCH):
+    """
+    Move up to `batch_size` bookings travelling before `before` into the
+    archive. Returns the number of bookings moved.
+    """
+    with transaction.atomic(), _moving():
+        rows = list(
+            Booking.objects
+            .filter(travel_date__lt=before)
+            .order_by('id')
+            .values(
+                'id', 'user_id', 'bus_id', 'travel_date', 'trip_id', 'board_station_id',
+                'alight_station_id', 'total_price', 'status', 'booking_date',
+                'receipt_id', 'updated_at', 'version',
+            )[:batch_size]
+        )
+        if not rows:
+            return 0
+        ids = [row['id'] for row in rows]
+        tickets = booking_tickets([{'pk': booking_id} for booking_id in ids])
+
+        ArchivedBooking.objects.bulk_create([
+            ArchivedBooking(
+                id=row['id'],
+                user_id=row['user_id'],
+                bus_id=row['bus_id'],
+                travel_date=row['travel_date'],
+                trip=row['trip_id'],
+                board_station=row['board_station_id'],
+                alight_station=row['alight_station_id'],
+                seats=tickets[row['id']][0],
+                total_price=row['total_price'],
+                passenger_info=tickets[row['id']][1],
+                status=row['status'],
+                booking_date=row['booking_date'],
+                receipt_id=row['receipt_id'],
+                updated_at=row['updated_at'],
+                version=row['version'],
+            )
+            for row in rows
+        ])
+        BookingRequest.objects.filter(booking_id__in=ids).update(booking=None)
+        Ticket.objects.filter(booking_id__in=ids).delete()
+        Booking.objects.filter(id__in=ids).delete()
+        search.remove(ids)
+    return len(rows)
+
+
+def archive(before, batch_size=ARCHIVE_BATCH):
+    """
+    Move every booking travelling before `before`, a batch at a time.
+    Returns the number of bookings moved.
+    """
+    moved = 0
+    while True:
+        count = archive_batch(before, batch_size)
+        if not count:
+            return moved
+        moved += count
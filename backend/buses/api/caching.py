@@ -0,0 +1,140 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+
+VERSION_PREFIX = 'httpcache:version:'
+RESPONSE_PREFIX = 'httpcache:response:'
+STATS_PREFIX = 'httpcache:stats:'
+STATS_EVENTS = ('hits', 'misses', 'not_modified')
+
+
+# ----- Version keys -----
+
+def get_versions(tags):
+    """
+    Current version (a timestamp of the last change) for each tag.
+    A tag that is not in the cache yet, or was evicted, starts a new version
+    now, which can only make cached responses look older than they are.
+    """
+    keys = {tag: VERSION_PREFIX + tag for tag in tags}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for tag, key in keys.items():
+        if key not in found:
+            cache.add(key, time.time(), timeout=None)
+            found[key] = cache.get(key)
+        versions[tag] = found[key]
+    return versions
+
+
+def bump(*tags):
+    """
+    Invalidate every cached response that depends on any of `tags`.
+    """
+    now = time.time()
+    cache.set_many({VERSION_PREFIX + tag: now for tag in tags}, timeout=None)
+
+
+# ----- Hit-rate stats -----
+
+def record(event):
+    key = STATS_PREFIX + event
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_stats():
+    found = cache.get_many([STATS_PREFIX + event for event in STATS_EVENTS])
+    stats = {event: found.get(STATS_PREFIX + event, 0) for event in STATS_EVENTS}
+    # A 304 is served without touching the ORM, so it counts as a hit.
+    served = stats['hits'] + stats['not_modified']
+    total = served + stats['misses']
+    stats['hit_rate'] = round(served / total, 4) if total else 0.0
+    return stats
+
+
+def reset_stats():
+    cache.delete_many([STATS_PREFIX + event for event in STATS_EVENTS])
+
+
+# ----- Views -----
+
+class CachedResponseMixin:
+    """
+    Caches the full response of a public GET endpoint and answers
+    conditional requests with 304.
+
+    Views set `cache_policy` to a key of settings.HTTP_CACHE_POLICIES and
+    return the version tags their data depends on from `get_cache_tags()`.
+    The ETag is derived from those versions, so a bump (see api.signals)
+    invalidates both the server-side copy and any client validators.
+    Views whose data depends on who asks set `vary_on_user`, which keys the
+    cached copy on the user as well.
+    """
+    cache_policy = None
+    vary_on_user = False
+
+    def get_cache_tags(self):
+        return []
+
+    def get(self, request, *args, **kwargs):
+        policy = settings.HTTP_CACHE_POLICIES[self.cache_policy]
+        versions = get_versions(self.get_cache_tags())
+        last_modified = max(versions.values(), default=None)
+
+        fingerprint = '|'.join([
+            request.path,
+            request.GET.urlencode(),
+            request.accepted_renderer.format,
+            f"user={request.user.pk}" if self.vary_on_user else '',
+            *(f"{tag}={version!r}" for tag, version in sorted(versions.items())),
+        ])
+        digest = hashlib.md5(fingerprint.encode(), usedforsecurity=False).hexdigest()
+        etag = f'"{digest}"'
+
+        if self._not_modified(request, etag, last_modified):
+            record('not_modified')
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            return self._add_headers(response, policy, etag, last_modified)
+
+        key = RESPONSE_PREFIX + digest
+        data = cache.get(key)
+        if data is not None:
+            record('hits')
+            response = Response(data)
+        else:
+            record('misses')
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cache.set(key, response.data, timeout=policy['store_timeout'])
+        return self._add_headers(response, policy, etag, last_modified)
+
+    def _not_modified(self, request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            # Compression middleware weakens the ETag; compare weakly.
+            tags = [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]
+            return etag in tags or if_none_match.strip() == '*'
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if if_modified_since and last_modified is not None:
+            return int(last_modified) <= if_modified_since
+        return False
+
+    def _add_headers(self, response, policy, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, **policy['cache_control'])
+        patch_vary_headers(response, ['Accept', 'Authorization'] if self.vary_on_user else ['Accept'])
+        return response
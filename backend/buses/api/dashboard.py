@@ -0,0 +1,155 @@
+"""
+Conductor dashboard summary.
+
+One grouped query over the tickets of the conductor's buses gives, per
+bus and travel date, how many bookings and passengers are on the
+manifest, how many seats are sold and the revenue, and one over the
+trips how many departures (and so seats) each bus offers that day; two
+more find the next departures and count their sold seats. The dashboard no longer needs
+the full booking lists to add these up itself.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from collections import Counter, defaultdict
+
+from django.db.models import Count, Q, Sum
+
+from .models import Booking, Bus, Ticket, Trip
+from .schedules import ensure_expanded
+
+
+NEXT_DEPARTURES = 5
+MAX_SUMMARY_DAYS = 14
+
+
+def manifest_counts(bus_ids, start, end):
+    """
+    {(bus_id, travel_date): counts} for the dates in [start, end).
+    Cancelled bookings only show up in `cancelled`. Seats are counted per
+    departure: a seat sold on two trips of the day fills two.
+    """
+    active = ~Q(booking__status='cancelled')
+    sold = Q(booking__status__in=Booking.SOLD_STATUSES)
+    rows = (
+        Ticket.objects
+        .filter(booking__bus_id__in=bus_ids, travel_date__gte=start, travel_date__lt=end)
+        # Per trip, so distinct seats are distinct per departure; a booking
+        # belongs to one trip, so the per-trip counts add up.
+        .values('booking__bus_id', 'travel_date', 'booking__trip_id')
+        .annotate(
+            bookings=Count('booking', distinct=True, filter=active),
+            passengers=Count('id', filter=active),
+            seats_filled=Count('seat', distinct=True, filter=sold),
+            revenue=Sum('price', filter=sold),
+            pending=Count('booking', distinct=True, filter=Q(booking__status='pending')),
+            cancelled=Count('booking', distinct=True, filter=Q(booking__status='cancelled')),
+        )
+    )
+    counts = defaultdict(Counter)
+    for row in rows:
+        key = (row.pop('booking__bus_id'), row.pop('travel_date'))
+        del row['booking__trip_id']
+        # Counter.update adds; revenue is None without sold tickets.
+        counts[key].update({name: value for name, value in row.items() if value is not None})
+    return {key: dict(values) for key, values in counts.items()}
+
+
+def departure_counts(bus_ids, dates):
+    """
+    {(bus_id, travel_date): number of trips} for `dates`.
+    """
+    for travel_date in dates:
+        ensure_expanded(travel_date)
+    return {
+        (bus_id, travel_date): count
+        for bus_id, travel_date, count in (
+            Trip.objects
+            .filter(bus_id__in=bus_ids, travel_date__in=dates)
+            .values('bus_id', 'travel_date')
+            .annotate(count=Count('id'))
+            .values_list('bus_id', 'travel_date', 'count')
+        )
+    }
+
+
+def next_departures(bus_ids, now, limit=NEXT_DEPARTURES):
+    """
+    The next `limit` trips of `bus_ids` from `now` (today and tomorrow),
+    with their sold seats.
+    """
+    today = now.date()
+    tomorrow = today + timedelta(days=1)
+    ensure_expanded(today)
+    ensure_expanded(tomorrow)
+    trips = list(
+        Trip.objects
+        .filter(
+            Q(travel_date=today, departure_time__gte=now.time()) | Q(travel_date=tomorrow),
+            bus_id__in=bus_ids,
+        )
+        .select_related('bus')
+        .order_by('travel_date', 'departure_time', 'id')[:limit]
+    )
+    sold = dict(
+        Ticket.objects
+        .filter(booking__trip_id__in=[trip.id for trip in trips], booking__status__in=Booking.SOLD_STATUSES)
+        .values('booking__trip_id')
+        .annotate(seats=Count('seat', distinct=True))
+        .values_list('booking__trip_id', 'seats')
+    )
+    return [
+        {
+            'trip': trip.id,
+            'bus': trip.bus_id,
+            'plate_number': trip.bus.plate_number,
+            'travel_date': trip.travel_date,
+            'departure_time': trip.departure_time,
+            'arrival_time': trip.arrival_time,
+            'seats_filled': sold.get(trip.id, 0),
+            'capacity': trip.bus.capacity,
+        }
+        for trip in trips
+    ]
+
+
+def conductor_summary(conductor, start, days, now):
+    buses = list(
+        Bus.objects.filter(conductor=conductor).order_by('plate_number')
+        .values('id', 'plate_number', 'route_id', 'capacity', 'status')
+    )
+    bus_ids = [bus['id'] for bus in buses]
+    dates = [start + timedelta(days=offset) for offset in range(days)]
+    counts = manifest_counts(bus_ids, start, start + timedelta(days=days))
+    departures = departure_counts(bus_ids, dates)
+    empty = {'bookings': 0, 'passengers': 0, 'seats_filled': 0, 'revenue': None, 'pending': 0, 'cancelled': 0}
+
+    rows = []
+    for bus in buses:
+        for travel_date in dates:
+            row = {**empty, **counts.get((bus['id'], travel_date), {})}
+            row['revenue'] = row['revenue'] or Decimal('0.00')
+            trips = departures.get((bus['id'], travel_date), 0)
+            rows.append({
+                'bus': bus['id'],
+                'plate_number': bus['plate_number'],
+                'route': bus['route_id'],
+                'status': bus['status'],
+                'travel_date': travel_date,
+                'departures': trips,
+                # Seats offered that day, over all its departures.
+                'capacity': bus['capacity'] * trips,
+                **row,
+            })
+    totals = {name: sum(row[name] for row in rows) for name in empty if name != 'revenue'}
+    totals['revenue'] = sum((row['revenue'] for row in rows), Decimal('0.00'))
+    # Money as strings, like the booking API.
+    for row in rows + [totals]:
+        row['revenue'] = str(row['revenue'].quantize(Decimal('0.01')))
+    return {
+        'from': start,
+        'days': days,
+        'buses': rows,
+        'totals': totals,
+        'next_departures': next_departures(bus_ids, now),
+    }
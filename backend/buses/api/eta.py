@@ -0,0 +1,238 @@
+"""
+Arrival time predictions.
+
+Each route's stations form a polyline whose cumulative distances are
+computed once per catalogue version and cached. A bus's last position is
+projected onto that polyline to find how far along the route it is, and
+its recent speed comes from the location history (api.tracks). The time
+to every downstream station is then remaining distance / speed.
+
+`refresh()` computes the ETAs of all active buses at once, with the
+projection and speed estimates vectorized per route, and stores the
+result per bus in BusETA, where every web worker reads it. Only
+`manage.py refresh_etas` computes; the ETA endpoint reads one BusETA row
+and answers 404 when there is no recent prediction.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+
+from .caching import get_versions
+from .models import Bus, BusETA, LocationPoint, Route, Station
+from .tracks import EARTH_RADIUS
+
+
+# Stored predictions older than this are not served.
+ETA_TIMEOUT = timedelta(seconds=120)
+GEOMETRY_TIMEOUT = 24 * 3600
+# Window of location history the current speed is estimated over.
+SPEED_WINDOW = timedelta(minutes=10)
+# Buses that have not reported for longer get no ETA.
+STALE_AFTER = timedelta(minutes=15)
+# Recent speed is kept within these multiples of the timetabled speed, so
+# a bus waiting at a stop does not get an ETA of hours.
+MIN_SPEED_FACTOR = 0.25
+MAX_SPEED_FACTOR = 2.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in metres; works elementwise on arrays.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+# ----- Route geometry -----
+
+def route_geometry(route_ids):
+    """
+    {route_id: geometry} with the ordered stations of each route and their
+    cumulative distance along it, from the cache when the catalogue has not
+    changed.
+    """
+    version = get_versions(['catalogue'])['catalogue']
+    keys = {route_id: f"eta:geometry:{route_id}:{version!r}" for route_id in route_ids}
+    cached = cache.get_many(list(keys.values()))
+    geometries = {route_id: cached[key] for route_id, key in keys.items() if key in cached}
+
+    missing = [route_id for route_id in route_ids if route_id not in geometries]
+    if missing:
+        stations = defaultdict(list)
+        for station in (
+            Station.objects
+            .filter(route_id__in=missing)
+            .order_by('route_id', 'order', 'id')
+            .values('id', 'route_id', 'name', 'latitude', 'longitude')
+        ):
+            stations[station['route_id']].append(station)
+        computed = {}
+        for route_id in missing:
+            route_stations = stations[route_id]
+            latitudes = np.array([s['latitude'] for s in route_stations], dtype=np.float64)
+            longitudes = np.array([s['longitude'] for s in route_stations], dtype=np.float64)
+            legs = haversine(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+            computed[route_id] = {
+                'stations': [s['id'] for s in route_stations],
+                'names': [s['name'] for s in route_stations],
+                'latitudes': latitudes.tolist(),
+                'longitudes': longitudes.tolist(),
+                'cumulative': np.concatenate([[0.0], np.cumsum(legs)]).tolist(),
+            }
+        cache.set_many({keys[route_id]: geometry for route_id, geometry in computed.items()}, GEOMETRY_TIMEOUT)
+        geometries.update(computed)
+    return geometries
+
+
+def project_onto_route(geometry, latitudes, longitudes):
+    """
+    Distance along the route of each position (metres from the first
+    station), projecting onto the nearest leg of the station polyline. All
+    positions are projected against all legs at once.
+    """
+    station_lat = np.array(geometry['latitudes'])
+    station_lon = np.array(geometry['longitudes'])
+    cumulative = np.array(geometry['cumulative'])
+    if len(station_lat) < 2:
+        return np.zeros(len(latitudes))
+
+    # Local metre projection around the route.
+    scale = np.cos(np.radians(station_lat.mean())) * np.pi / 180 * EARTH_RADIUS
+    to_metres = np.pi / 180 * EARTH_RADIUS
+    sx, sy = station_lon * scale, station_lat * to_metres
+    px = np.asarray(longitudes, dtype=np.float64)[:, None] * scale
+    py = np.asarray(latitudes, dtype=np.float64)[:, None] * to_metres
+
+    ax, ay = sx[:-1], sy[:-1]
+    dx, dy = sx[1:] - ax, sy[1:] - ay
+    length_sq = dx * dx + dy * dy
+    t = np.clip(
+        np.divide((px - ax) * dx + (py - ay) * dy, length_sq, out=np.zeros((len(px), len(ax))), where=length_sq > 0),
+        0, 1,
+    )
+    offset = np.hypot(ax + t * dx - px, ay + t * dy - py)
+    leg = offset.argmin(axis=1)
+    rows = np.arange(len(px))
+    return cumulative[leg] + t[rows, leg] * (cumulative[leg + 1] - cumulative[leg])
+
+
+# ----- Speeds -----
+
+def recent_speeds(bus_ids, now):
+    """
+    ({bus_id: metres per second over SPEED_WINDOW}, {bus_id: last report})
+    from the location history. Buses with fewer than two recent points
+    have no speed.
+    """
+    rows = list(
+        LocationPoint.objects
+        .filter(bus_id__in=bus_ids, recorded_at__gte=now - SPEED_WINDOW)
+        .order_by('bus_id', 'recorded_at', 'id')
+        .values_list('bus_id', 'recorded_at', 'latitude', 'longitude')
+    )
+    if not rows:
+        return {}, {}
+    bus_col = np.array([row[0] for row in rows], dtype=np.int64)
+    time_col = np.array([row[1].timestamp() for row in rows], dtype=np.float64)
+    lat_col = np.array([row[2] for row in rows], dtype=np.float64)
+    lon_col = np.array([row[3] for row in rows], dtype=np.float64)
+
+    same_bus = bus_col[1:] == bus_col[:-1]
+    distance = haversine(lat_col[:-1], lon_col[:-1], lat_col[1:], lon_col[1:]) * same_bus
+    elapsed = (time_col[1:] - time_col[:-1]) * same_bus
+    buses, inverse = np.unique(bus_col[1:], return_inverse=True)
+    total_distance = np.bincount(inverse, weights=distance, minlength=len(buses))
+    total_time = np.bincount(inverse, weights=elapsed, minlength=len(buses))
+
+    speeds = {
+        bus_id: total_distance[i] / total_time[i]
+        for i, bus_id in enumerate(buses.tolist()) if total_time[i] > 0
+    }
+    last_seen = {bus_id: recorded_at for bus_id, recorded_at, _, _ in rows}
+    return speeds, last_seen
+
+
+# ----- Predictions -----
+
+def refresh(now, bus_ids=None):
+    """
+    Compute and store the ETAs of the active buses (or just `bus_ids`).
+    Returns {bus_id: eta} for the buses that could be predicted.
+    """
+    buses = Bus.objects.filter(status='active', latitude__isnull=False, longitude__isnull=False)
+    if bus_ids is not None:
+        buses = buses.filter(id__in=bus_ids)
+    buses = list(buses.values('id', 'route_id', 'latitude', 'longitude'))
+    if not buses:
+        return {}
+
+    speeds, last_seen = recent_speeds([bus['id'] for bus in buses], now)
+    routes = {
+        route['id']: route
+        for route in Route.objects.filter(id__in={bus['route_id'] for bus in buses})
+        .values('id', 'distance', 'estimated_duration')
+    }
+    geometries = route_geometry(list(routes))
+
+    by_route = defaultdict(list)
+    for bus in buses:
+        # A position nobody has reported recently is not worth predicting from.
+        if bus['id'] in last_seen and now - last_seen[bus['id']] <= STALE_AFTER:
+            by_route[bus['route_id']].append(bus)
+
+    etas = {}
+    for route_id, route_buses in by_route.items():
+        geometry = geometries[route_id]
+        if len(geometry['stations']) < 2:
+            continue
+        route = routes[route_id]
+        timetabled = route['distance'] * 1000 / max(route['estimated_duration'] * 60, 1)
+        positions = project_onto_route(
+            geometry, [bus['latitude'] for bus in route_buses], [bus['longitude'] for bus in route_buses],
+        )
+        speed = np.array([speeds.get(bus['id'], timetabled) for bus in route_buses])
+        speed = np.clip(speed, timetabled * MIN_SPEED_FACTOR, timetabled * MAX_SPEED_FACTOR)
+        cumulative = np.array(geometry['cumulative'])
+        # seconds[bus, station]; negative for stations already passed.
+        seconds = (cumulative[None, :] - positions[:, None]) / speed[:, None]
+
+        for i, bus in enumerate(route_buses):
+            etas[bus['id']] = {
+                'bus': bus['id'],
+                'route': route_id,
+                'computed_at': now,
+                'last_seen': last_seen[bus['id']],
+                'distance_along_route': round(float(positions[i]), 1),
+                'speed': round(float(speed[i]), 2),
+                'stations': [
+                    {
+                        'station': station_id,
+                        'name': name,
+                        'seconds': int(remaining),
+                        'eta': now + timedelta(seconds=float(remaining)),
+                    }
+                    for station_id, name, remaining in zip(
+                        geometry['stations'], geometry['names'], seconds[i].tolist()
+                    )
+                    if remaining >= 0
+                ],
+            }
+    BusETA.objects.bulk_create(
+        [BusETA(bus_id=bus_id, computed_at=now, prediction=eta) for bus_id, eta in etas.items()],
+        update_conflicts=True, unique_fields=['bus'], update_fields=['computed_at', 'prediction'],
+    )
+    return etas
+
+
+def get_eta(bus_id, now):
+    """
+    The stored prediction of `bus_id`, or None if there is none from the
+    last ETA_TIMEOUT.
+    """
+    return (
+        BusETA.objects.filter(bus_id=bus_id, computed_at__gt=now - ETA_TIMEOUT)
+        .values_list('prediction', flat=True).first()
+    )
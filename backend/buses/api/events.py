@@ -0,0 +1,83 @@
+"""
+Booking event log (a transactional outbox).
+
+Every booking creation, status change and deletion appends a BookingEvent
+in the same transaction as the change, so the log never disagrees with
+the bookings. Events are numbered in commit order once committed (see
+api.sequencing) and consumers read them in that order, either directly
+with `stream()` or with `consume()`, which also remembers how far a named
+consumer has got (EventCursor) and advances it in the same transaction as
+the consumer's own writes.
+"""
+from django.db import transaction
+
+from . import sequencing
+from .models import BookingEvent, EventCursor
+
+
+STREAM_PAGE_SIZE = 500
+
+
+def record(events):
+    """
+    Bulk-insert unsaved BookingEvents.
+    """
+    created = BookingEvent.objects.bulk_create(events)
+    sequencing.stamp_on_commit()
+    return created
+
+
+def record_created(bookings, seat_ids):
+    """
+    Log the creation of `bookings`; `seat_ids` holds the seat ids of each.
+    """
+    return record([
+        BookingEvent.for_booking(booking, BookingEvent.CREATED, seat_ids=list(ids))
+        for booking, ids in zip(bookings, seat_ids)
+    ])
+
+
+def stream(after=0, limit=STREAM_PAGE_SIZE, until=None):
+    """
+    Up to `limit` events with sequence numbers above `after` (and at most
+    `until`), in commit order. Call sequencing.stamp() first to include
+    the latest events; readers inside a transaction should do so before
+    opening it, as stamping holds the counter's lock until commit.
+    """
+    events = BookingEvent.objects.filter(sequence__gt=after).order_by('sequence')
+    if until is not None:
+        events = events.filter(sequence__lte=until)
+    return list(events[:limit])
+
+
+def consume(name, handler, limit=STREAM_PAGE_SIZE):
+    """
+    Pass the next events after consumer `name`'s cursor to `handler` and
+    move the cursor past them, all in one transaction: if the handler
+    fails, the same events are delivered again. Returns how many were
+    handled.
+    """
+    sequencing.stamp()
+    with transaction.atomic():
+        cursor, _ = EventCursor.objects.select_for_update().get_or_create(name=name)
+        events = stream(cursor.last_sequence, limit)
+        if not events:
+            return 0
+        handler(events)
+        cursor.last_sequence = events[-1].sequence
+        cursor.save(update_fields=['last_sequence', 'updated_at'])
+    return len(events)
+
+
+def serialize(event):
+    return {
+        'id': event.id,
+        'sequence': event.sequence,
+        'type': event.event_type,
+        'booking': event.booking_id,
+        'bus': event.bus_id,
+        'status': event.status,
+        'previous_status': event.previous_status,
+        'payload': event.payload,
+        'created_at': event.created_at,
+    }
@@ -0,0 +1,146 @@
+"""
+Read-only list serialization straight from `.values()` rows.
+
+The output is identical to the matching ModelSerializer (the serializer's
+own field objects format every value), but rows are plain dicts: no model
+instances, no per-instance attribute lookup and no per-row serializer, and
+related data is fetched with one query for the whole list instead of one
+per object.
+"""
+from rest_framework.relations import RelatedField
+
+from .models import Ticket, passenger_entry
+from .segments import route_indexes, seat_masks, segment_span, taken_count
+from .serializers import ArchivedBookingSerializer, BookingSerializer, BusSerializer, TripSerializer
+
+
+def _output_fields(serializer_class, fields):
+    serializer = serializer_class(context={'fields': fields})
+    return {
+        name: field
+        for name, field in serializer.fields.items()
+        if not field.write_only
+    }
+
+
+def serialize_values(serializer_class, queryset, fields=None, computed=None, extra=()):
+    """
+    Serialize `queryset` like `serializer_class(queryset, many=True).data`.
+
+    `computed` maps field names that are not plain columns (M2M fields,
+    SerializerMethodFields) to a function taking the list of raw rows and
+    returning {pk: value}. `extra` names further columns those functions
+    need in the rows.
+    """
+    computed = computed or {}
+    out_fields = _output_fields(serializer_class, fields)
+    columns = {
+        name: field.source.replace('.', '__')
+        for name, field in out_fields.items() if name not in computed
+    }
+    rows = list(queryset.values('pk', *set(columns.values()), *extra))
+
+    computed_values = {
+        name: function(rows) for name, function in computed.items() if name in out_fields
+    }
+
+    converters = []
+    for name, field in out_fields.items():
+        if name in computed_values:
+            converters.append((name, None, None))
+        elif isinstance(field, RelatedField):
+            # values() already yields the primary key of a FK.
+            converters.append((name, columns[name], None))
+        else:
+            converters.append((name, columns[name], field.to_representation))
+
+    data = []
+    for row in rows:
+        item = {}
+        for name, column, to_representation in converters:
+            if column is None:
+                item[name] = computed_values[name].get(row['pk'])
+                continue
+            value = row[column]
+            item[name] = value if value is None or to_representation is None else to_representation(value)
+        data.append(item)
+    return data
+
+
+# Keeps `__in` lists under the bound-parameter limit of SQLite.
+ID_BATCH_SIZE = 900
+
+
+def booking_tickets(rows):
+    """
+    {pk: (seat ids, passenger dicts)} of the bookings in `rows`, read from
+    their tickets in one query per ID_BATCH_SIZE bookings.
+    """
+    ids = [row['pk'] for row in rows]
+    tickets = {pk: ([], []) for pk in ids}
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        for booking_id, seat_id, seat_number, name, phone, email, passenger_type in (
+            Ticket.objects
+            .filter(booking_id__in=ids[start:start + ID_BATCH_SIZE])
+            .order_by('id')
+            .values_list(
+                'booking_id', 'seat_id', 'seat__seat_number', 'passenger_name',
+                'passenger_phone', 'passenger_email', 'passenger_type',
+            )
+        ):
+            seats, passengers = tickets[booking_id]
+            seats.append(seat_id)
+            passenger = passenger_entry(name, phone, email, passenger_type, seat_id, seat_number)
+            if passenger is not None:
+                passengers.append(passenger)
+    return tickets
+
+
+def serialize_bookings(queryset, fields=None):
+    # Seats and passengers both come from the same ticket rows.
+    loaded = {}
+
+    def tickets(rows):
+        if 'tickets' not in loaded:
+            loaded['tickets'] = booking_tickets(rows)
+        return loaded['tickets']
+
+    return serialize_values(
+        BookingSerializer, queryset, fields,
+        computed={
+            'seats': lambda rows: {pk: seats for pk, (seats, _) in tickets(rows).items()},
+            'passenger_info': lambda rows: {pk: passengers for pk, (_, passengers) in tickets(rows).items()},
+        },
+    )
+
+
+def serialize_archived_bookings(queryset, fields=None):
+    return serialize_values(ArchivedBookingSerializer, queryset, fields)
+
+
+def serialize_buses(queryset, fields=None):
+    return serialize_values(BusSerializer, queryset, fields)
+
+
+def serialize_trips(queryset, fields=None, board_station=None, alight_station=None):
+    """
+    Like TripSerializer(many=True). Available seats between the two stations
+    (the whole route by default) come from the segment occupancy of all
+    listed trips, built with one query.
+    """
+    def available_seats(rows):
+        masks = seat_masks(
+            (row['pk'], row['bus_id'], row['travel_date'], row['route_id']) for row in rows
+        )
+        indexes = route_indexes({row['route_id'] for row in rows})
+        available = {}
+        for row in rows:
+            start, end = segment_span(indexes[row['route_id']], board_station, alight_station)
+            available[row['pk']] = max(0, row['bus__capacity'] - taken_count(masks[row['pk']], start, end))
+        return available
+
+    return serialize_values(
+        TripSerializer, queryset, fields,
+        computed={'available_seats': available_seats},
+        extra=['bus_id', 'route_id', 'bus__capacity', 'travel_date'],
+    )
@@ -0,0 +1,215 @@
+"""
+Idempotent request submission.
+
+A client may send an `Idempotency-Key` header with a POST; retries with
+the same key get the response of the first attempt instead of running the
+request again. The first request claims the key by inserting an
+IdempotencyKey row before it runs and stores its response there when it
+finishes. A retry that finds:
+
+- a stored response gets it replayed, with its headers and
+  `Idempotent-Replayed: true`;
+- the first request still running waits for it up to
+  settings.IDEMPOTENCY_WAIT seconds, then gets 409 and Retry-After. At
+  most CONCURRENCY_LIMITS['idempotency_wait'] retries per process wait;
+  beyond that they get the 409 at once, so a retry storm cannot tie up
+  the worker threads that load shedding keeps free;
+- the key used for a different request body gets 422.
+
+This is settled in `initial()`, after authentication and throttling but
+before a ConcurrencyLimitMixin listed ahead of the mixin takes a slot, so
+replays and waiting duplicates do not hold one. Server errors (including
+a 503 for want of a slot) are not stored: the key is released so a retry
+runs again.
+A claim whose request died without releasing it is taken over after
+IN_FLIGHT_TIMEOUT. Rows live for settings.IDEMPOTENCY_KEY_TTL and are
+deleted by `manage.py purge_idempotency_keys`; an expired key that is used
+again is simply claimed anew.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+from .routers import use_primary
+from .throttling import get_semaphore
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+IN_FLIGHT_TIMEOUT = timedelta(seconds=60)
+POLL_INTERVAL = 0.1
+# Rows per statement; also keeps `__in` lists under SQLite's parameter limit.
+PURGE_CHUNK = 900
+
+
+def _sha256(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def key_digest(user_id, key):
+    return _sha256(f"{user_id}:{key}")
+
+
+def request_digest(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    return _sha256(json.dumps([request.method, request.path, data], sort_keys=True, default=str))
+
+
+def claim(digest, fingerprint, now):
+    """
+    (record, claimed): the IdempotencyKey of `digest`, and whether this
+    request owns it and should run.
+    """
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    while True:
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    key=digest, request_hash=fingerprint, locked_at=now, expires_at=expires_at,
+                )
+            return record, True
+        except IntegrityError:
+            pass
+        with use_primary():
+            record = IdempotencyKey.objects.filter(key=digest).first()
+        if record is None:
+            # Released or purged in the meantime.
+            continue
+        abandoned = record.response_status is None and record.locked_at <= now - IN_FLIGHT_TIMEOUT
+        if record.expires_at > now and not abandoned:
+            return record, False
+        # Expired or abandoned: take it over, unless another request just did.
+        taken = IdempotencyKey.objects.filter(pk=record.pk, locked_at=record.locked_at).update(
+            request_hash=fingerprint, response_status=None, response_body=None, response_headers={},
+            locked_at=now, expires_at=expires_at,
+        )
+        if taken:
+            record.request_hash, record.response_status, record.response_body = fingerprint, None, None
+            record.response_headers = {}
+            record.locked_at, record.expires_at = now, expires_at
+            return record, True
+
+
+def wait(record, timeout):
+    """
+    The record once its request has finished, as it stands after `timeout`
+    seconds, or None if the request released it.
+    """
+    deadline = time.monotonic() + timeout
+    with use_primary():
+        while record.response_status is None and time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            record = IdempotencyKey.objects.filter(pk=record.pk).first()
+            if record is None:
+                return None
+    return record
+
+
+def complete(record, response):
+    """
+    Store `response` (before rendering: the headers the view set) on `record`.
+    """
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        response_status=response.status_code, response_body=response.data,
+        response_headers=dict(response.items()),
+    )
+
+
+def release(record):
+    IdempotencyKey.objects.filter(pk=record.pk).delete()
+
+
+def purge(now, chunk_size=PURGE_CHUNK):
+    """
+    Delete the expired keys. Returns the number deleted.
+    """
+    deleted = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+
+class Answered(Exception):
+    """
+    Ends a request in `initial()` with `response`.
+    """
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class IdempotentPostMixin:
+    """
+    Honours an Idempotency-Key header on POST (see the module docstring).
+    Requests without the header are handled as usual. List it after
+    ConcurrencyLimitMixin.
+    """
+    _idempotency_record = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        key = request.headers.get(HEADER)
+        if request.method != 'POST' or key is None:
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ParseError(f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters.")
+
+        fingerprint = request_digest(request)
+        record, claimed = claim(key_digest(request.user.pk, key), fingerprint, timezone.now())
+        if not claimed:
+            raise Answered(self.replay(record, fingerprint))
+        self._idempotency_record = record
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Answered):
+            return exc.response
+        try:
+            # Validation errors and the like become responses, stored by
+            # finalize_response; anything else is re-raised here.
+            return super().handle_exception(exc)
+        except BaseException:
+            self.settle(None)
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        self.settle(response)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def settle(self, response):
+        record, self._idempotency_record = self._idempotency_record, None
+        if record is None:
+            return
+        if response is None or response.status_code >= 500:
+            release(record)
+        else:
+            complete(record, response)
+
+    def replay(self, record, fingerprint):
+        if record.request_hash != fingerprint:
+            return Response({"detail": f"{HEADER} was already used for a different request."},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        semaphore = get_semaphore('idempotency_wait')
+        if semaphore.acquire(blocking=False):
+            try:
+                record = wait(record, settings.IDEMPOTENCY_WAIT)
+            finally:
+                semaphore.release()
+        if record is None or record.response_status is None:
+            return Response({"detail": f"A request with this {HEADER} is still in progress."},
+                            status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+        return Response(record.response_body, status=record.response_status,
+                        headers={**record.response_headers, 'Idempotent-Replayed': 'true'})
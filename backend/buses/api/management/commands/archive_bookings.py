@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves bookings whose travel date is more than --days in the past into the "
+        "archive table, --batch-size bookings per transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=archive.ARCHIVE_AFTER.days)
+        parser.add_argument('--batch-size', type=int, default=archive.ARCHIVE_BATCH)
+
+    def handle(self, *args, **options):
+        before = timezone.localdate() - timedelta(days=options['days'])
+        moved = archive.archive(before, batch_size=options['batch_size'])
+        self.stdout.write(f"Archived {moved} bookings travelling before {before}.")
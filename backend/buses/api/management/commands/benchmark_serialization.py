@@ -0,0 +1,73 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.fast_serializers import serialize_bookings
+from api.models import Booking, Bus, CustomUser, Route, Seat, Ticket
+from api.serializers import BookingSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Times BookingSerializer against the .values() fast path on a batch of "
+        "generated bookings. Everything runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--fields', default='', help='Comma-separated sparse fieldset to time as well')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            queryset = self.seed(options['bookings'])
+            results = [
+                ('BookingSerializer(many=True)', lambda: BookingSerializer(queryset, many=True).data),
+                ('serialize_bookings', lambda: serialize_bookings(queryset)),
+            ]
+            if options['fields']:
+                fields = set(options['fields'].split(','))
+                results.append((
+                    f'serialize_bookings(fields={options["fields"]})',
+                    lambda: serialize_bookings(queryset, fields=fields),
+                ))
+
+            assert list(map(dict, results[0][1]())) == results[1][1](), 'fast path output differs'
+            for label, run in results:
+                best = min(self.timed(run) for _ in range(options['repeat']))
+                self.stdout.write(f"{label:<50} {best * 1000:9.1f} ms")
+            transaction.set_rollback(True)
+
+    def timed(self, run):
+        start = time.perf_counter()
+        run()
+        return time.perf_counter() - start
+
+    def seed(self, count):
+        user = CustomUser.objects.create(username='benchmark-serialization')
+        route = Route.objects.create(
+            name='Benchmark', start_location='A', end_location='B',
+            distance=100, estimated_duration=120,
+        )
+        bus = Bus.objects.create(
+            plate_number='BENCH-SER', route=route, capacity=60, price_per_seat='15000.00',
+        )
+        seats = Seat.objects.bulk_create(Seat(bus=bus, seat_number=str(n)) for n in range(1, 61))
+        start = date.today()
+        bookings = Booking.objects.bulk_create(
+            Booking(
+                user=user, bus=bus, travel_date=start + timedelta(days=n // 60),
+                total_price='15000.00', receipt_id=f'BENCH-{n}',
+            )
+            for n in range(count)
+        )
+        Ticket.objects.bulk_create(
+            Ticket(
+                booking=booking, seat=seats[n % 60], travel_date=booking.travel_date, price='15000.00',
+                passenger_name=f'Passenger {n}', passenger_phone='0700000000', passenger_type='adult',
+            )
+            for n, booking in enumerate(bookings)
+        )
+        return Booking.objects.filter(user=user).order_by('-travel_date')
@@ -0,0 +1,87 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Runs in a fresh interpreter, like a newly booted worker.
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module} as entry
+imported = time.perf_counter()
+path, host = sys.argv[1], sys.argv[2]
+if {asgi}:
+    import asyncio
+    messages = []
+    pending = [{{'type': 'http.request', 'body': b'', 'more_body': False}}]
+    async def receive():
+        if pending:
+            return pending.pop()
+        # After the request body, only the client going away once the
+        # response is complete.
+        while not messages or messages[-1]['type'] != 'http.response.body' or messages[-1].get('more_body'):
+            await asyncio.sleep(0.001)
+        return {{'type': 'http.disconnect'}}
+    async def send(message):
+        messages.append(message)
+    asyncio.run(entry.application({{
+        'type': 'http', 'asgi': {{'version': '3.0'}}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'headers': [(b'host', host.encode())],
+        'server': (host, 80), 'client': ('127.0.0.1', 0),
+    }}, receive, send))
+    status = messages[0]['status']
+else:
+    import io
+    statuses = []
+    environ = {{
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host,
+        'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr,
+    }}
+    b''.join(entry.application(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+    status = int(statuses[0].split()[0])
+done = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'first_request': done - imported, 'status': status}}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures worker boot: the time to import buses.wsgi / buses.asgi in a fresh "
+        "interpreter and the latency of the first request it serves. Pass "
+        "--settings to compare settings profiles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--path', default='/api/routes/')
+        parser.add_argument('--host', default=None, help='Host header (default: first of ALLOWED_HOSTS)')
+
+    def handle(self, *args, **options):
+        host = options['host'] or next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'buses.settings')}
+        self.stdout.write(f"settings {env['DJANGO_SETTINGS_MODULE']}, GET {options['path']}, {options['runs']} runs (median)")
+        for module, asgi in (('buses.wsgi', False), ('buses.asgi', True)):
+            samples = [
+                self.probe(module, asgi, options['path'], host, env)
+                for _ in range(options['runs'])
+            ]
+            statuses = sorted({sample['status'] for sample in samples})
+            self.stdout.write(
+                f"{module:<12} import {statistics.median(s['import'] for s in samples) * 1000:8.1f} ms   "
+                f"first request {statistics.median(s['first_request'] for s in samples) * 1000:8.1f} ms   "
+                f"status {','.join(map(str, statuses))}"
+            )
+
+    def probe(self, module, asgi, path, host, env):
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module, asgi=asgi), path, host],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1])
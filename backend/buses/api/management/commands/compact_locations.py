@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import tracks
+
+
+class Command(BaseCommand):
+    help = (
+        "Applies location history retention: downsamples raw GPS points older than "
+        "--raw-hours to one per --interval seconds and deletes days older than "
+        "--retention-days. Works in chunks, so it can run against a large table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--raw-hours', type=int, default=int(tracks.RAW_RETENTION.total_seconds() // 3600))
+        parser.add_argument('--interval', type=int, default=tracks.DOWNSAMPLE_INTERVAL)
+        parser.add_argument('--retention-days', type=int, default=tracks.HISTORY_RETENTION.days)
+        parser.add_argument('--chunk-size', type=int, default=tracks.COMPACTION_CHUNK)
+
+    def handle(self, *args, **options):
+        result = tracks.compact(
+            timezone.now(),
+            chunk_size=options['chunk_size'],
+            raw_retention=timedelta(hours=options['raw_hours']),
+            history_retention=timedelta(days=options['retention_days']),
+            interval=options['interval'],
+        )
+        self.stdout.write(
+            f"Deleted {result['expired']} expired and {result['downsampled']} downsampled points."
+        )
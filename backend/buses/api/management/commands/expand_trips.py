@@ -0,0 +1,22 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.schedules import expand
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the trips of the coming days ahead of time. Requests expand "
+        "missing dates of the booking horizon lazily, so this only warms up the trip table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.BOOKING_HORIZON_DAYS)
+
+    def handle(self, *args, **options):
+        start = date.today()
+        end = start + timedelta(days=options['days'] - 1)
+        expand(start, end)
+        self.stdout.write(f"Expanded trips from {start} to {end}.")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Bus
+from api.seatmap import generate_layout
+
+
+class Command(BaseCommand):
+    help = "Lays out the seats of buses and adds seats up to their capacity."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bus', type=int, action='append', dest='buses', help="Bus id (repeatable); all buses by default.")
+
+    def handle(self, *args, **options):
+        buses = Bus.objects.order_by('id')
+        if options['buses']:
+            buses = buses.filter(id__in=options['buses'])
+        for bus in buses:
+            created = generate_layout(bus)
+            self.stdout.write(f"{bus.plate_number}: laid out {bus.seat_layout} on {bus.decks} deck(s), {created} seats added.")
@@ -0,0 +1,91 @@
+import json
+import statistics
+import threading
+import time
+from collections import Counter
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures read latency of a running server on its own and while it is "
+        "flooded with failing logins, to check that load shedding keeps reads fast."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--read-path', default='/api/routes/')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per phase')
+        parser.add_argument('--read-threads', type=int, default=2)
+        parser.add_argument('--flood-threads', type=int, default=32)
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        read_url = base_url + options['read_path']
+        login_url = base_url + '/api/login/'
+
+        baseline, _ = self.run_phase(read_url, login_url, options, flood=False)
+        flooded, login_statuses = self.run_phase(read_url, login_url, options, flood=True)
+
+        self.report('reads only', baseline)
+        self.report('reads during login flood', flooded)
+        self.stdout.write(f"login responses: {dict(sorted(login_statuses.items()))}")
+
+    def run_phase(self, read_url, login_url, options, flood):
+        stop = threading.Event()
+        latencies = []
+        login_statuses = Counter()
+        lock = threading.Lock()
+
+        def reader():
+            while not stop.is_set():
+                start = time.perf_counter()
+                status = self.fetch(Request(read_url))
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append((elapsed, status))
+
+        def flooder(n):
+            body = json.dumps({'username': f'flood-{n}', 'password': 'not-the-password'}).encode()
+            while not stop.is_set():
+                request = Request(login_url, data=body, headers={'Content-Type': 'application/json'})
+                status = self.fetch(request)
+                with lock:
+                    login_statuses[status] += 1
+
+        threads = [threading.Thread(target=reader) for _ in range(options['read_threads'])]
+        if flood:
+            threads += [threading.Thread(target=flooder, args=(n,)) for n in range(options['flood_threads'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return latencies, login_statuses
+
+    def fetch(self, request):
+        try:
+            with urlopen(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except HTTPError as exc:
+            exc.read()
+            return exc.code
+        except (URLError, OSError):
+            return 'error'
+
+    def report(self, label, latencies):
+        if not latencies:
+            self.stdout.write(f"{label}: no requests completed")
+            return
+        times = sorted(elapsed * 1000 for elapsed, _ in latencies)
+        quantiles = statistics.quantiles(times, n=100) if len(times) > 1 else times * 99
+        errors = sum(1 for _, status in latencies if status != 200)
+        self.stdout.write(
+            f"{label:<28} n={len(times):<6} p50={quantiles[49]:7.1f} ms  "
+            f"p95={quantiles[94]:7.1f} ms  p99={quantiles[98]:7.1f} ms  errors={errors}"
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.admission import BATCH_SIZE, run_worker
+
+
+class Command(BaseCommand):
+    help = "Decides queued booking requests for hot departures, one batch per departure at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--once', action='store_true', help='Exit when the queues are empty')
+
+    def handle(self, *args, **options):
+        run_worker(batch_size=options['batch_size'], once=options['once'])
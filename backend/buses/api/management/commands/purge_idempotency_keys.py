@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import idempotency
+
+
+class Command(BaseCommand):
+    help = "Deletes Idempotency-Key records whose retry window has passed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=idempotency.PURGE_CHUNK)
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge(timezone.now(), chunk_size=options['chunk_size'])
+        self.stdout.write(f"Deleted {deleted} expired idempotency keys.")
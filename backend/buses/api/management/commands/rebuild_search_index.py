@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the booking search index from the bookings, --chunk-size bookings "
+        "at a time. Only needed if the index was lost or writes bypassed it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=search.INDEX_CHUNK)
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(f"Indexed {indexed} bookings.")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api.analytics import refresh
+
+
+class Command(BaseCommand):
+    help = (
+        "Folds booking events logged since the last run into the daily load table and "
+        "recomputes load factors and demand forecasts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Rebuild the daily load table from the bookings instead of the event log',
+        )
+
+    def handle(self, *args, **options):
+        run = refresh(full=options['full'])
+        source = 'bookings' if run.full_rebuild else 'events'
+        self.stdout.write(
+            f"Processed {run.bookings_processed} {source} up to event {run.last_sequence}; "
+            f"{len(run.forecasts)} forecasts stored."
+        )
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.eta import refresh
+
+
+class Command(BaseCommand):
+    help = (
+        "Predicts arrival times at the downstream stations of every active bus and "
+        "stores them for the ETA endpoint. Repeats every --interval seconds unless --once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=15)
+        parser.add_argument('--once', action='store_true', help='Refresh once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            etas = refresh(timezone.now())
+            self.stdout.write(f"Predicted {len(etas)} buses in {time.monotonic() - started:.3f}s.")
+            if options['once']:
+                return
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
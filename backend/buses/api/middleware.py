@@ -0,0 +1,100 @@
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from rest_framework.throttling import BaseThrottle
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+from .routers import pin_to_primary, replica_aliases, unpin
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def client_key(request):
+    """
+    Identify the client without touching the database: the user id from the
+    JWT access token when present, otherwise the client address as the
+    throttles see it (trusting only NUM_PROXIES X-Forwarded-For hops).
+    """
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    parts = header.split()
+    if len(parts) == 2 and parts[0] in settings.SIMPLE_JWT['AUTH_HEADER_TYPES']:
+        from rest_framework_simplejwt.exceptions import TokenError
+        from rest_framework_simplejwt.settings import api_settings
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        try:
+            token = AccessToken(parts[1])
+            return f"user:{token[api_settings.USER_ID_CLAIM]}"
+        except (TokenError, KeyError):
+            pass
+    return f"ip:{BaseThrottle().get_ident(request)}"
+
+
+class ReplicaPinningMiddleware:
+    """
+    Keeps a client's reads on the primary for REPLICA_STICKY_SECONDS after it
+    performed a write, so e.g. a new booking shows up in the user's booking
+    list straight away even if the replicas lag behind.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+
+        key = f"replica-pin:{client_key(request)}"
+        unpin()
+        if request.method not in SAFE_METHODS or cache.get(key):
+            pin_to_primary()
+        try:
+            response = self.get_response(request)
+        finally:
+            unpin()
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            cache.set(key, True, timeout=settings.REPLICA_STICKY_SECONDS)
+        return response
+
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compresses responses when RESPONSE_COMPRESSION is on: brotli if the
+    `brotli` package is installed and the client accepts it, gzip otherwise.
+    """
+
+    def process_response(self, request, response):
+        if not settings.RESPONSE_COMPRESSION:
+            return response
+        if (
+            brotli is None
+            or response.streaming
+            or len(response.content) < settings.RESPONSE_COMPRESSION_MIN_LENGTH
+            or response.has_header('Content-Encoding')
+            or not re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed = brotli.compress(response.content, quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
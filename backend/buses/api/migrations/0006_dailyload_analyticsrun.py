@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_bus_conductor_bus_latitude_bus_longitude'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('full_rebuild', models.BooleanField(default=False)),
+                ('last_booking_id', models.BigIntegerField(default=0, help_text='Highest booking id folded into DailyLoad; the next incremental run starts after it')),
+                ('bookings_processed', models.PositiveIntegerField(default=0)),
+                ('load_factors', models.JSONField(default=dict)),
+                ('forecasts', models.JSONField(default=list)),
+            ],
+            options={
+                'get_latest_by': 'created_at',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('travel_date', models.DateField()),
+                ('weekday', models.PositiveSmallIntegerField(help_text='0 = Monday')),
+                ('departure_hour', models.PositiveSmallIntegerField()),
+                ('seats_booked', models.PositiveIntegerField(default=0)),
+                ('capacity', models.PositiveIntegerField()),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_loads', to='api.bus')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_loads', to='api.route')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['travel_date'], name='api_dailylo_travel__b0cf0b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bus', 'travel_date'), name='unique_daily_load')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_dailyload_analyticsrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('booking_id', models.BigIntegerField()),
+                ('bus_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='version',
+            field=models.PositiveIntegerField(default=1, help_text='Incremented on every status change'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['bus', 'updated_at', 'id'], name='booking_bus_changes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingtombstone',
+            index=models.Index(fields=['bus_id', 'deleted_at'], name='tombstone_bus_deleted_idx'),
+        ),
+    ]
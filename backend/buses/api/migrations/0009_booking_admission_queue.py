@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('travel_date', models.DateField()),
+                ('seat_ids', models.JSONField(default=list)),
+                ('passenger_info', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('completed', 'Completed'), ('rejected', 'Rejected')], default='queued', max_length=20)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('booking', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='admission_request', to='api.booking')),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_requests', to='api.bus')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_requests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'bus', 'travel_date', 'id'], name='bookingrequest_queue_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HotDeparture',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('travel_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hot_departures', to='api.bus')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bus', 'travel_date'), name='unique_hot_departure')],
+            },
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_daily_schedules(apps, schema_editor):
+    """
+    Buses used to run every day at their fixed times; keep that behaviour.
+    """
+    Bus = apps.get_model('api', 'Bus')
+    Schedule = apps.get_model('api', 'Schedule')
+    Schedule.objects.bulk_create(
+        Schedule(bus_id=bus.id, departure_time=bus.departure_time, arrival_time=bus.arrival_time)
+        for bus in Bus.objects.all()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_booking_admission_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Schedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('departure_time', models.TimeField()),
+                ('arrival_time', models.TimeField()),
+                ('days_of_week', models.PositiveSmallIntegerField(default=127, help_text='Bitmask of running weekdays: Monday = 1, Tuesday = 2, ... Sunday = 64')),
+                ('valid_from', models.DateField(blank=True, null=True)),
+                ('valid_until', models.DateField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='api.bus')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Trip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('travel_date', models.DateField()),
+                ('departure_time', models.TimeField()),
+                ('arrival_time', models.TimeField()),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trips', to='api.bus')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trips', to='api.route')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trips', to='api.schedule')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='trip',
+            field=models.ForeignKey(blank=True, help_text='Departure booked; empty for bookings made before schedules existed', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='bookings', to='api.trip'),
+        ),
+        migrations.CreateModel(
+            name='ScheduleException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('runs', models.BooleanField(default=False)),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exceptions', to='api.schedule')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('schedule', 'date'), name='unique_schedule_exception')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['route', 'travel_date', 'departure_time'], name='trip_route_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['bus', 'travel_date'], name='trip_bus_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='trip',
+            constraint=models.UniqueConstraint(fields=('schedule', 'travel_date'), name='unique_trip_per_date'),
+        ),
+        migrations.AddField(
+            model_name='bookingrequest',
+            name='trip',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='booking_requests', to='api.trip'),
+        ),
+        migrations.RunPython(create_daily_schedules, migrations.RunPython.noop),
+    ]
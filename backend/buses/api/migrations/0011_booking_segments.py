@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_schedules_and_trips'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='alight_station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alightings', to='api.station'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='board_station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='boardings', to='api.station'),
+        ),
+        migrations.AddField(
+            model_name='bookingrequest',
+            name='alight_station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.station'),
+        ),
+        migrations.AddField(
+            model_name='bookingrequest',
+            name='board_station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.station'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_booking_segments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('recorded_at', models.DateTimeField()),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('resolution', models.PositiveIntegerField(default=0, help_text='0 for a raw fix, else the bucket in seconds this point was downsampled to')),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_points', to='api.bus')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bus', 'recorded_at'], name='location_bus_time_idx'), models.Index(fields=['day', 'resolution', 'bus', 'recorded_at'], name='location_compaction_idx')],
+            },
+        ),
+    ]
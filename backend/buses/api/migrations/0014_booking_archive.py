@@ -0,0 +1,52 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_booking_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('travel_date', models.DateField()),
+                ('trip', models.BigIntegerField(blank=True, null=True)),
+                ('board_station', models.BigIntegerField(blank=True, null=True)),
+                ('alight_station', models.BigIntegerField(blank=True, null=True)),
+                ('seats', models.JSONField(default=list, help_text='Seat ids')),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('passenger_info', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('cancelled', 'Cancelled'), ('completed', 'Completed')], max_length=20)),
+                ('booking_date', models.DateTimeField()),
+                ('receipt_id', models.CharField(max_length=50, unique=True)),
+                ('updated_at', models.DateTimeField()),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['travel_date'], name='booking_travel_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedbooking',
+            name='bus',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to='api.bus'),
+        ),
+        migrations.AddField(
+            model_name='archivedbooking',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedbooking',
+            index=models.Index(fields=['user', 'travel_date'], name='archivedbooking_user_idx'),
+        ),
+    ]
@@ -0,0 +1,156 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:40
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+CHUNK_SIZE = 500
+
+
+def ticket_prices(booking, bus, passengers):
+    """
+    Prices of the seats whose passengers are `passengers`: the fare rules of
+    api.serializers.seat_prices when they reproduce the booking's total,
+    otherwise the total split evenly.
+    """
+    count = len(passengers)
+    discount = Decimal(bus.student_discount)
+    prices = [
+        bus.price_per_seat * (100 - discount) / 100 if passenger.get('type') == 'student'
+        else bus.price_per_seat
+        for passenger in passengers
+    ]
+    if sum(prices).quantize(Decimal('0.01')) == booking.total_price:
+        return [price.quantize(Decimal('0.01')) for price in prices]
+    share = (booking.total_price / count).quantize(Decimal('0.01'))
+    return [share] * (count - 1) + [booking.total_price - share * (count - 1)]
+
+
+def create_tickets(apps, schema_editor):
+    """
+    One ticket per booked seat, with the passenger recorded for that seat,
+    `CHUNK_SIZE` bookings at a time.
+    """
+    Booking = apps.get_model('api', 'Booking')
+    Bus = apps.get_model('api', 'Bus')
+    Ticket = apps.get_model('api', 'Ticket')
+    through = Booking.seats.through
+    buses = Bus.objects.in_bulk()
+    last_id = 0
+    while True:
+        bookings = list(Booking.objects.filter(id__gt=last_id).order_by('id')[:CHUNK_SIZE])
+        if not bookings:
+            return
+        last_id = bookings[-1].id
+        seats = {booking.id: [] for booking in bookings}
+        for booking_id, seat_id in (
+            through.objects.filter(booking_id__in=list(seats)).order_by('id').values_list('booking_id', 'seat_id')
+        ):
+            seats[booking_id].append(seat_id)
+
+        tickets = []
+        for booking in bookings:
+            seat_ids = seats[booking.id]
+            if not seat_ids:
+                continue
+            passengers = booking.passenger_info if isinstance(booking.passenger_info, list) else []
+            # Passengers name their seat; older rows only match by position.
+            by_seat = {p.get('seatId'): p for p in passengers if isinstance(p, dict) and p.get('seatId')}
+            seat_passengers = [
+                by_seat.get(seat_id) or (
+                    passengers[i] if i < len(passengers) and isinstance(passengers[i], dict)
+                    and not passengers[i].get('seatId') else {}
+                )
+                for i, seat_id in enumerate(seat_ids)
+            ]
+            prices = ticket_prices(booking, buses[booking.bus_id], seat_passengers)
+            for seat_id, passenger, price in zip(seat_ids, seat_passengers, prices):
+                tickets.append(Ticket(
+                    booking_id=booking.id,
+                    seat_id=seat_id,
+                    travel_date=booking.travel_date,
+                    passenger_name=passenger.get('name') or '',
+                    passenger_phone=passenger.get('phone') or '',
+                    passenger_email=passenger.get('email') or '',
+                    passenger_type=passenger.get('type') or '',
+                    price=price,
+                ))
+        Ticket.objects.bulk_create(tickets)
+
+
+def restore_seats(apps, schema_editor):
+    Booking = apps.get_model('api', 'Booking')
+    Ticket = apps.get_model('api', 'Ticket')
+    through = Booking.seats.through
+    last_id = 0
+    while True:
+        tickets = list(Ticket.objects.filter(id__gt=last_id).select_related('seat').order_by('id')[:CHUNK_SIZE])
+        if not tickets:
+            return
+        last_id = tickets[-1].id
+        through.objects.bulk_create(
+            [through(booking_id=ticket.booking_id, seat_id=ticket.seat_id) for ticket in tickets],
+            ignore_conflicts=True,
+        )
+        passengers = {}
+        for ticket in tickets:
+            if ticket.passenger_name or ticket.passenger_phone or ticket.passenger_email or ticket.passenger_type:
+                passengers.setdefault(ticket.booking_id, []).append({
+                    'name': ticket.passenger_name,
+                    'phone': ticket.passenger_phone,
+                    'email': ticket.passenger_email,
+                    'type': ticket.passenger_type,
+                    'seatId': ticket.seat_id,
+                    'seatNumber': ticket.seat.seat_number,
+                })
+        for booking in Booking.objects.filter(id__in=list(passengers)):
+            booking.passenger_info = (booking.passenger_info or []) + passengers[booking.id]
+            booking.save(update_fields=['passenger_info'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_booking_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ticket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('travel_date', models.DateField()),
+                ('passenger_name', models.CharField(blank=True, max_length=200)),
+                ('passenger_phone', models.CharField(blank=True, max_length=50)),
+                ('passenger_email', models.CharField(blank=True, max_length=254)),
+                ('passenger_type', models.CharField(blank=True, choices=[('adult', 'Adult'), ('student', 'Student')], max_length=20)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='api.booking')),
+                ('seat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='api.seat')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['seat', 'travel_date'], name='ticket_seat_date_idx'),
+                    models.Index(fields=['passenger_phone'], name='ticket_phone_idx'),
+                ],
+                'constraints': [models.UniqueConstraint(fields=('booking', 'seat'), name='ticket_booking_seat_unique')],
+            },
+        ),
+        migrations.RunPython(create_tickets, restore_seats),
+        # A plain M2M cannot be altered into one with a through model.
+        migrations.RemoveField(
+            model_name='booking',
+            name='seats',
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='seats',
+            field=models.ManyToManyField(through='api.Ticket', to='api.seat'),
+        ),
+        migrations.RemoveField(
+            model_name='booking',
+            name='passenger_info',
+        ),
+    ]
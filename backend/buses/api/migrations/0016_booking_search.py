@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:10
+
+from django.db import migrations
+
+
+TABLE = 'api_booking_search'
+CHUNK_SIZE = 500
+
+
+def create_search_table(apps, schema_editor):
+    """
+    The search table of api.search, in the shape the database can index.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f"CREATE VIRTUAL TABLE {TABLE} USING fts5(document, tokenize='trigram')")
+    elif vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(f"CREATE TABLE {TABLE} (rowid bigint PRIMARY KEY, document text NOT NULL)")
+        schema_editor.execute(f"CREATE INDEX {TABLE}_trgm_idx ON {TABLE} USING gin (document gin_trgm_ops)")
+    else:
+        schema_editor.execute(f"CREATE TABLE {TABLE} (rowid bigint PRIMARY KEY, document text NOT NULL)")
+
+    # Index the existing bookings, as api.search.documents would.
+    Booking = apps.get_model('api', 'Booking')
+    Ticket = apps.get_model('api', 'Ticket')
+    last_id = 0
+    while True:
+        rows = list(
+            Booking.objects
+            .filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'receipt_id', 'user__username', 'user__email', 'bus__plate_number')[:CHUNK_SIZE]
+        )
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        parts = {booking_id: list(values) for booking_id, *values in rows}
+        for booking_id, *values in (
+            Ticket.objects
+            .filter(booking_id__in=list(parts))
+            .order_by('id')
+            .values_list('booking_id', 'passenger_name', 'passenger_phone', 'passenger_email')
+        ):
+            parts[booking_id].extend(values)
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, document) VALUES (%s, %s)",
+                [(booking_id, ' '.join(value for value in values if value)) for booking_id, values in parts.items()],
+            )
+
+
+def drop_search_table(apps, schema_editor):
+    schema_editor.execute(f"DROP TABLE {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_tickets'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
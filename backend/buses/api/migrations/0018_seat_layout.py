@@ -0,0 +1,81 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:38
+
+import re
+
+from django.db import migrations, models
+
+
+def natural_key(seat_number):
+    return tuple(
+        (0, int(part), '') if part.isdigit() else (1, 0, part.lower())
+        for part in re.split(r'(\d+)', seat_number) if part
+    )
+
+
+def layout_seats(apps, schema_editor):
+    """
+    Place the existing seats of every bus as api.seatmap.generate_layout
+    would for the default single-deck 2+2 layout, without adding seats.
+    """
+    Seat = apps.get_model('api', 'Seat')
+    row = [(1, 'window'), (2, 'aisle'), (4, 'aisle'), (5, 'window')]
+    seats_by_bus = {}
+    for seat in Seat.objects.order_by('id').only('id', 'bus_id', 'seat_number'):
+        seats_by_bus.setdefault(seat.bus_id, []).append(seat)
+    for seats in seats_by_bus.values():
+        seats.sort(key=lambda seat: natural_key(seat.seat_number))
+        for i, seat in enumerate(seats):
+            seat.deck = 1
+            seat.row = i // len(row) + 1
+            seat.column, seat.position = row[i % len(row)]
+        Seat.objects.bulk_update(seats, ['deck', 'row', 'column', 'position'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookingrequest',
+            name='seat_count',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bus',
+            name='decks',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='bus',
+            name='seat_layout',
+            field=models.CharField(choices=[('1+1', '1+1'), ('2+1', '2+1'), ('2+2', '2+2'), ('3+2', '3+2')], default='2+2', max_length=5),
+        ),
+        migrations.AddField(
+            model_name='seat',
+            name='column',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='seat',
+            name='deck',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='seat',
+            name='position',
+            field=models.CharField(blank=True, choices=[('window', 'Window'), ('middle', 'Middle'), ('aisle', 'Aisle')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='seat',
+            name='row',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='seat',
+            index=models.Index(fields=['bus', 'deck', 'row', 'column'], name='seat_layout_idx'),
+        ),
+        migrations.RunPython(layout_seats, migrations.RunPython.noop),
+    ]
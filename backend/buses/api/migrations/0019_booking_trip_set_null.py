@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_seat_layout'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='trip',
+            field=models.ForeignKey(blank=True, help_text='Departure booked; empty for bookings made before schedules existed or whose schedule was deleted', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='api.trip'),
+        ),
+    ]
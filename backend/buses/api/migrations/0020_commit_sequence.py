@@ -0,0 +1,81 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:10
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_events(apps, schema_editor):
+    """
+    Existing events keep their ids as sequence numbers, so the cursors and
+    analytics runs that point at them stay valid. Bookings and tombstones
+    are numbered by api.sequencing.stamp() on first use.
+    """
+    BookingEvent = apps.get_model('api', 'BookingEvent')
+    CommitSequence = apps.get_model('api', 'CommitSequence')
+    BookingEvent.objects.update(sequence=F('id'))
+    last = BookingEvent.objects.aggregate(last=Max('id'))['last'] or 0
+    CommitSequence.objects.create(pk=1, last_value=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_booking_trip_set_null'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommitSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bookingevent',
+            name='sequence',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Commit order (see api.sequencing); empty until numbered', null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='bookingtombstone',
+            name='sequence',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Commit order (see api.sequencing); empty until numbered', null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='sequence',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Commit order of the last change (see api.sequencing); empty until numbered', null=True, unique=True),
+        ),
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_bus_changes_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['bus', 'sequence'], name='booking_bus_sequence_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='bookingtombstone',
+            name='tombstone_bus_deleted_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bookingtombstone',
+            index=models.Index(fields=['bus_id', 'sequence'], name='tombstone_bus_sequence_idx'),
+        ),
+        migrations.RenameField(
+            model_name='eventcursor',
+            old_name='last_event_id',
+            new_name='last_sequence',
+        ),
+        migrations.RenameField(
+            model_name='analyticsrun',
+            old_name='last_event_id',
+            new_name='last_sequence',
+        ),
+        migrations.AlterField(
+            model_name='analyticsrun',
+            name='last_sequence',
+            field=models.BigIntegerField(help_text='Highest BookingEvent sequence folded into DailyLoad; empty for runs made before the event log', null=True),
+        ),
+        migrations.RunPython(number_existing_events, migrations.RunPython.noop),
+    ]
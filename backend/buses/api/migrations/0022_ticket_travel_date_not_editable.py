@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_idempotency_response_headers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticket',
+            name='travel_date',
+            field=models.DateField(editable=False),
+        ),
+    ]
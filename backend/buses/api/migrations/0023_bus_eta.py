@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:03
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_ticket_travel_date_not_editable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusETA',
+            fields=[
+                ('bus', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='api.bus')),
+                ('computed_at', models.DateTimeField()),
+                ('prediction', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+            ],
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:06
+
+import datetime
+
+from django.db import migrations, models
+
+
+def schedule_unscheduled_buses(apps, schema_editor):
+    """
+    A bus without schedules still ran every day at its own times through
+    the default schedule; give it that schedule before the times go.
+    """
+    Bus = apps.get_model('api', 'Bus')
+    Schedule = apps.get_model('api', 'Schedule')
+    Schedule.objects.bulk_create(
+        Schedule(bus_id=bus.id, departure_time=bus.departure_time, arrival_time=bus.arrival_time)
+        for bus in Bus.objects.filter(schedules__isnull=True)
+    )
+
+
+def restore_bus_times(apps, schema_editor):
+    """
+    Bus times from the first schedule of the day (midnight without one).
+    """
+    Bus = apps.get_model('api', 'Bus')
+    Schedule = apps.get_model('api', 'Schedule')
+    buses = list(Bus.objects.all())
+    for bus in buses:
+        first = Schedule.objects.filter(bus_id=bus.id).order_by('-is_active', 'departure_time', 'id').first()
+        bus.departure_time = first.departure_time if first else datetime.time(0)
+        bus.arrival_time = first.arrival_time if first else datetime.time(0)
+    Bus.objects.bulk_update(buses, ['departure_time', 'arrival_time'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_bus_eta'),
+    ]
+
+    operations = [
+        # Nullable in between, so the migration can be reversed.
+        migrations.AlterField(
+            model_name='bus',
+            name='departure_time',
+            field=models.TimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='bus',
+            name='arrival_time',
+            field=models.TimeField(null=True),
+        ),
+        migrations.RunPython(schedule_unscheduled_buses, restore_bus_times),
+        migrations.RemoveField(
+            model_name='bus',
+            name='arrival_time',
+        ),
+        migrations.RemoveField(
+            model_name='bus',
+            name='departure_time',
+        ),
+    ]
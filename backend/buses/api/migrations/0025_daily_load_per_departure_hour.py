@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:18
+
+from django.db import migrations, models
+
+
+def rebuild_on_next_refresh(apps, schema_editor):
+    """
+    Existing rows hold a whole day at one hour; the next analytics refresh
+    rebuilds them per departure hour instead of folding events into them.
+    """
+    AnalyticsRun = apps.get_model('api', 'AnalyticsRun')
+    AnalyticsRun.objects.update(last_sequence=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_bus_times_from_schedules'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_on_next_refresh, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='dailyload',
+            name='unique_daily_load',
+        ),
+        migrations.AlterField(
+            model_name='dailyload',
+            name='capacity',
+            field=models.PositiveIntegerField(help_text='Seats of one departure'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyload',
+            constraint=models.UniqueConstraint(fields=('bus', 'travel_date', 'departure_hour'), name='unique_daily_load'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 from django.conf import settings
 
 
@@ -45,6 +46,12 @@ class Bus(models.Model):
         ('active', 'Active'),
         ('inactive', 'Inactive'),
     )
+    SEAT_LAYOUT_CHOICES = (
+        ('1+1', '1+1'),
+        ('2+1', '2+1'),
+        ('2+2', '2+2'),
+        ('3+2', '3+2'),
+    )
 
     plate_number = models.CharField(max_length=20, unique=True)
     route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='buses')
@@ -63,9 +70,11 @@ class Bus(models.Model):
         default=0,
         help_text='Discount in percent for students'
     )
-    departure_time = models.TimeField()
-    arrival_time = models.TimeField()
+    # Departure and arrival times are the bus's Schedules (see api.schedules.with_times).
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
+    # Seats per row on either side of the aisle (see api.seatmap).
+    seat_layout = models.CharField(max_length=5, choices=SEAT_LAYOUT_CHOICES, default='2+2')
+    decks = models.PositiveSmallIntegerField(default=1)
 
     latitude = models.FloatField(null=True, blank=True, help_text="Current latitude of the bus")
     longitude = models.FloatField(null=True, blank=True, help_text="Current longitude of the bus")
@@ -75,34 +84,609 @@ class Bus(models.Model):
 
 
 class Seat(models.Model):
+    POSITION_CHOICES = [
+        ('window', 'Window'),
+        ('middle', 'Middle'),
+        ('aisle', 'Aisle'),
+    ]
+
     bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='seats')
     seat_number = models.CharField(max_length=10)
     # Status flags for quick checks (but actual availability should be validated on booking)
     is_available = models.BooleanField(default=True)
     is_reserved = models.BooleanField(default=False)
+    # Place in the bus; empty until the bus is laid out (see api.seatmap).
+    # Columns leave a gap for the aisle: a 2+2 row uses columns 1, 2, 4 and 5.
+    deck = models.PositiveSmallIntegerField(default=1)
+    row = models.PositiveSmallIntegerField(null=True, blank=True)
+    column = models.PositiveSmallIntegerField(null=True, blank=True)
+    position = models.CharField(max_length=10, choices=POSITION_CHOICES, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['bus', 'deck', 'row', 'column'], name='seat_layout_idx'),
+        ]
 
     def __str__(self):
         return f"Seat {self.seat_number} on Bus {self.bus.plate_number}"
 
 
+class Schedule(models.Model):
+    """
+    Service calendar of a bus: the weekdays and date range it runs on and
+    its departure/arrival times. A bus running twice a day has two schedules.
+    Concrete departures are generated from it as Trips (see api.schedules).
+    """
+    MONDAY, TUESDAY, WEDNESDAY, THURSDAY, FRIDAY, SATURDAY, SUNDAY = (1 << day for day in range(7))
+    EVERY_DAY = 0b1111111
+    WEEKDAYS = 0b0011111
+
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='schedules')
+    departure_time = models.TimeField()
+    arrival_time = models.TimeField()
+    days_of_week = models.PositiveSmallIntegerField(
+        default=EVERY_DAY,
+        help_text='Bitmask of running weekdays: Monday = 1, Tuesday = 2, ... Sunday = 64'
+    )
+    valid_from = models.DateField(null=True, blank=True)
+    valid_until = models.DateField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.bus.plate_number} at {self.departure_time:%H:%M}"
+
+    def runs_on(self, travel_date, exceptions=None):
+        """
+        Whether the schedule runs on `travel_date`. `exceptions` maps dates to
+        the `runs` flag of this schedule's ScheduleExceptions.
+        """
+        if exceptions and travel_date in exceptions:
+            return exceptions[travel_date]
+        if not self.is_active:
+            return False
+        if self.valid_from and travel_date < self.valid_from:
+            return False
+        if self.valid_until and travel_date > self.valid_until:
+            return False
+        return bool(self.days_of_week & (1 << travel_date.weekday()))
+
+
+class ScheduleException(models.Model):
+    """
+    Adds (runs=True) or cancels (runs=False) a schedule's service on one date.
+    """
+    schedule = models.ForeignKey(Schedule, on_delete=models.CASCADE, related_name='exceptions')
+    date = models.DateField()
+    runs = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['schedule', 'date'], name='unique_schedule_exception'),
+        ]
+
+    def __str__(self):
+        return f"{self.schedule} {'added' if self.runs else 'cancelled'} on {self.date}"
+
+
+class Trip(models.Model):
+    """
+    One concrete departure of a schedule on a travel date.
+    """
+    schedule = models.ForeignKey(Schedule, on_delete=models.CASCADE, related_name='trips')
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='trips')
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='trips')
+    travel_date = models.DateField()
+    departure_time = models.TimeField()
+    arrival_time = models.TimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['schedule', 'travel_date'], name='unique_trip_per_date'),
+        ]
+        indexes = [
+            models.Index(fields=['route', 'travel_date', 'departure_time'], name='trip_route_date_idx'),
+            models.Index(fields=['bus', 'travel_date'], name='trip_bus_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.bus.plate_number} on {self.travel_date} at {self.departure_time:%H:%M}"
+
+
 class Booking(models.Model):
     STATUS_CHOICES = [
+        ('pending', 'Pending'),
         ('confirmed', 'Confirmed'),
         ('cancelled', 'Cancelled'),
+        ('completed', 'Completed'),
     ]
+    # Statuses whose seats count as sold.
+    SOLD_STATUSES = ('confirmed', 'completed')
+    # Statuses that hold their seats: a booking a conductor puts back to
+    # pending keeps them until it is cancelled.
+    HELD_STATUSES = ('pending', *SOLD_STATUSES)
 
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='bookings')
     bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='bookings')
     travel_date = models.DateField()
-    seats = models.ManyToManyField(Seat)
-    total_price = models.DecimalField(max_digits=12, decimal_places=2)
-    passenger_info = models.JSONField(
-        default=dict,  # Add default to avoid migration issues and non-null errors
-        help_text='List of passenger info dicts with seatId, name, phone, email, passengerType'
+    # A booking whose trip goes away (its schedule was deleted) falls back to
+    # the legacy rule: it holds its seats on every trip of the bus that day.
+    trip = models.ForeignKey(
+        Trip,
+        on_delete=models.SET_NULL,
+        related_name='bookings',
+        null=True,
+        blank=True,
+        help_text='Departure booked; empty for bookings made before schedules existed or whose schedule was deleted',
+    )
+    # Stretch of the route travelled (see api.segments); empty means from
+    # the first or to the last station.
+    board_station = models.ForeignKey(
+        Station, on_delete=models.SET_NULL, null=True, blank=True, related_name='boardings'
+    )
+    alight_station = models.ForeignKey(
+        Station, on_delete=models.SET_NULL, null=True, blank=True, related_name='alightings'
     )
+    # One Ticket per seat, which also holds the passenger of that seat.
+    seats = models.ManyToManyField(Seat, through='Ticket')
+    total_price = models.DecimalField(max_digits=12, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='confirmed')
     booking_date = models.DateTimeField(auto_now_add=True)
     receipt_id = models.CharField(max_length=50, unique=True)
+    # Change tracking for offline clients (see api.sync)
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, help_text='Incremented on every status change')
+    sequence = models.BigIntegerField(
+        null=True, blank=True, unique=True, editable=False,
+        help_text='Commit order of the last change (see api.sequencing); empty until numbered'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['bus', 'sequence'], name='booking_bus_sequence_idx'),
+            models.Index(fields=['travel_date'], name='booking_travel_date_idx'),
+        ]
 
     def __str__(self):
         return f"Booking {self.receipt_id} by {self.user.username}"
+
+    def save(self, *args, **kwargs):
+        # Every change is numbered anew once it commits (see api.sequencing).
+        self.sequence = None
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'sequence'}
+        super().save(*args, **kwargs)
+
+    def set_status(self, status, record_event=True):
+        """
+        Change the status and log a BookingEvent in the same transaction.
+        With `record_event=False` the unsaved event is only returned, for
+        callers that bulk-insert the events of many changes.
+        """
+        previous_status = self.status
+        self.status = status
+        self.version += 1
+        event = BookingEvent.for_booking(self, BookingEvent.STATUS_CHANGED, previous_status)
+        with transaction.atomic():
+            self.save(update_fields=['status', 'version', 'updated_at'])
+            if record_event:
+                # Numbered on commit along with the booking (post_save).
+                event.save()
+        return event
+
+    @property
+    def passenger_info(self):
+        """
+        Passenger dicts as the booking API has always returned them, built
+        from the tickets.
+        """
+        tickets = self.tickets.select_related('seat').order_by('id') if self.pk else []
+        return [
+            passenger for passenger in (
+                ticket.passenger(ticket.seat.seat_number) for ticket in tickets
+            ) if passenger is not None
+        ]
+
+
+class Ticket(models.Model):
+    """
+    A seat of a booking and its passenger. Replaces the plain seat M2M and
+    the passenger JSON of Booking, so seat and passenger lookups are
+    indexed queries.
+    """
+    PASSENGER_TYPES = [
+        ('adult', 'Adult'),
+        ('student', 'Student'),
+    ]
+
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='tickets')
+    seat = models.ForeignKey(Seat, on_delete=models.CASCADE, related_name='tickets')
+    # Copy of the booking's, so seat lookups need no join; kept in step by
+    # save() and, when the booking's date changes, by api.signals.
+    travel_date = models.DateField(editable=False)
+    # Blank when the seat was booked without passenger details.
+    passenger_name = models.CharField(max_length=200, blank=True)
+    passenger_phone = models.CharField(max_length=50, blank=True)
+    passenger_email = models.CharField(max_length=254, blank=True)
+    passenger_type = models.CharField(max_length=20, blank=True, choices=PASSENGER_TYPES)
+    price = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['booking', 'seat'], name='ticket_booking_seat_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['seat', 'travel_date'], name='ticket_seat_date_idx'),
+            models.Index(fields=['passenger_phone'], name='ticket_phone_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ticket {self.booking_id}/{self.seat_id}"
+
+    def save(self, *args, **kwargs):
+        self.travel_date = self.booking.travel_date
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def for_passenger(cls, booking, seat, passenger, price):
+        """
+        Unsaved ticket for `seat` of `booking` from a passenger dict of the
+        booking API ({} when the seat has no passenger).
+        """
+        return cls(
+            booking=booking,
+            seat=seat,
+            travel_date=booking.travel_date,
+            passenger_name=passenger.get('name') or '',
+            passenger_phone=passenger.get('phone') or '',
+            passenger_email=passenger.get('email') or '',
+            passenger_type=passenger.get('type') or '',
+            price=price,
+        )
+
+    def passenger(self, seat_number):
+        return passenger_entry(
+            self.passenger_name, self.passenger_phone, self.passenger_email, self.passenger_type,
+            self.seat_id, seat_number,
+        )
+
+
+def passenger_entry(name, phone, email, passenger_type, seat_id, seat_number):
+    """
+    The passenger dict of the booking API for one ticket, or None when the
+    seat was booked without passenger details.
+    """
+    if not (name or phone or email or passenger_type):
+        return None
+    return {
+        'name': name,
+        'phone': phone,
+        'email': email,
+        'type': passenger_type,
+        'seatId': seat_id,
+        'seatNumber': seat_number,
+    }
+
+
+class ArchivedBooking(models.Model):
+    """
+    Cold copy of a booking whose travel date is long past (see
+    api.archive). Keeps the booking's id and receipt; the seats and the
+    departure are stored as plain ids so the row does not hold on to them.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='archived_bookings')
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='archived_bookings')
+    travel_date = models.DateField()
+    trip = models.BigIntegerField(null=True, blank=True)
+    board_station = models.BigIntegerField(null=True, blank=True)
+    alight_station = models.BigIntegerField(null=True, blank=True)
+    seats = models.JSONField(default=list, help_text='Seat ids')
+    total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    passenger_info = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+    booking_date = models.DateTimeField()
+    receipt_id = models.CharField(max_length=50, unique=True)
+    updated_at = models.DateTimeField()
+    version = models.PositiveIntegerField(default=1)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'travel_date'], name='archivedbooking_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived booking {self.receipt_id}"
+
+
+class BookingTombstone(models.Model):
+    """
+    Left behind when a booking row is deleted, so clients syncing changes
+    can drop it from their local copy.
+    """
+    booking_id = models.BigIntegerField()
+    bus_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    sequence = models.BigIntegerField(
+        null=True, blank=True, unique=True, editable=False,
+        help_text='Commit order (see api.sequencing); empty until numbered'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['bus_id', 'sequence'], name='tombstone_bus_sequence_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted booking {self.booking_id}"
+
+
+class BookingEvent(models.Model):
+    """
+    Append-only log of booking changes, written in the same transaction as
+    the change itself (see api.events). Consumers read it in commit
+    (sequence) order.
+    """
+    CREATED = 'created'
+    STATUS_CHANGED = 'status_changed'
+    DELETED = 'deleted'
+    TYPE_CHOICES = [
+        (CREATED, 'Created'),
+        (STATUS_CHANGED, 'Status changed'),
+        (DELETED, 'Deleted'),
+    ]
+
+    # Plain ids, so events outlive the bookings they describe.
+    booking_id = models.BigIntegerField()
+    bus_id = models.BigIntegerField()
+    event_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    status = models.CharField(max_length=20)
+    previous_status = models.CharField(max_length=20, blank=True)
+    payload = models.JSONField(default=dict, help_text='Snapshot of the booking after the change')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sequence = models.BigIntegerField(
+        null=True, blank=True, unique=True, editable=False,
+        help_text='Commit order (see api.sequencing); empty until numbered'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['booking_id', 'id'], name='bookingevent_booking_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} booking {self.booking_id} ({self.status})"
+
+    @classmethod
+    def for_booking(cls, booking, event_type, previous_status='', seat_ids=None):
+        """
+        Unsaved event for `booking`. Pass `seat_ids` when they are already
+        known, to save a query.
+        """
+        if seat_ids is None:
+            seat_ids = list(booking.seats.values_list('id', flat=True)) if booking.pk else []
+        return cls(
+            booking_id=booking.pk,
+            bus_id=booking.bus_id,
+            event_type=event_type,
+            status=booking.status,
+            previous_status=previous_status,
+            payload={
+                'receipt_id': booking.receipt_id,
+                'user': booking.user_id,
+                'bus': booking.bus_id,
+                'trip': booking.trip_id,
+                'travel_date': booking.travel_date.isoformat(),
+                'seats': seat_ids,
+                'total_price': str(booking.total_price),
+                'version': booking.version,
+            },
+        )
+
+
+class EventCursor(models.Model):
+    """
+    How far a named consumer has processed the BookingEvent log.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    last_sequence = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.last_sequence}"
+
+
+class CommitSequence(models.Model):
+    """
+    The last commit-order number handed out (see api.sequencing); one row.
+    """
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Commit sequence at {self.last_value}"
+
+
+# ----- Queued booking admission -----
+
+
+class HotDeparture(models.Model):
+    """
+    A bus/date under heavy demand: bookings for it go through the admission
+    queue (BookingRequest) instead of being created by the request itself.
+    """
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='hot_departures')
+    travel_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bus', 'travel_date'], name='unique_hot_departure'),
+        ]
+
+    def __str__(self):
+        return f"{self.bus.plate_number} on {self.travel_date}"
+
+
+class BookingRequest(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('completed', 'Completed'),
+        ('rejected', 'Rejected'),
+    ]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='booking_requests')
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='booking_requests')
+    travel_date = models.DateField()
+    # Requests still queued when their trip goes are rejected first (see
+    # api.schedules.reject_requests).
+    trip = models.ForeignKey(Trip, on_delete=models.SET_NULL, null=True, blank=True, related_name='booking_requests')
+    board_station = models.ForeignKey(Station, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    alight_station = models.ForeignKey(Station, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    seat_ids = models.JSONField(default=list)
+    # Seats to pick for the passengers when `seat_ids` is empty.
+    seat_count = models.PositiveSmallIntegerField(null=True, blank=True)
+    passenger_info = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    booking = models.OneToOneField(
+        Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='admission_request'
+    )
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'bus', 'travel_date', 'id'], name='bookingrequest_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Booking request {self.pk} ({self.status})"
+
+
+class RateLimitBucket(models.Model):
+    """
+    Token bucket state for api.throttling.DatabaseBucketStore.
+    """
+    key = models.CharField(max_length=200, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField(help_text='Unix time of the last refill')
+
+    def __str__(self):
+        return self.key
+
+
+class IdempotencyKey(models.Model):
+    """
+    Outcome of a request sent with an Idempotency-Key header, replayed to
+    retries of it (see api.idempotency).
+    """
+    # sha256 of the user and the client's key.
+    key = models.CharField(max_length=64, unique=True)
+    request_hash = models.CharField(max_length=64)
+    # Empty while the first request is still running.
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    response_headers = models.JSONField(default=dict, blank=True)
+    locked_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+# ----- Analytics -----
+
+
+class DailyLoad(models.Model):
+    """
+    Seats sold per bus, travel date and departure hour: the compact,
+    columnar base table the analytics jobs (api.analytics) aggregate instead
+    of scanning Booking.
+    """
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='daily_loads')
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='daily_loads')
+    travel_date = models.DateField()
+    weekday = models.PositiveSmallIntegerField(help_text='0 = Monday')
+    departure_hour = models.PositiveSmallIntegerField()
+    seats_booked = models.PositiveIntegerField(default=0)
+    capacity = models.PositiveIntegerField(help_text='Seats of one departure')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bus', 'travel_date', 'departure_hour'], name='unique_daily_load'),
+        ]
+        indexes = [
+            models.Index(fields=['travel_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.bus_id} on {self.travel_date}: {self.seats_booked}/{self.capacity}"
+
+
+class AnalyticsRun(models.Model):
+    """
+    Result of one analytics refresh, served as-is by the admin endpoint.
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    full_rebuild = models.BooleanField(default=False)
+    last_booking_id = models.BigIntegerField(
+        default=0,
+        help_text='Highest booking id folded into DailyLoad; the next incremental run starts after it'
+    )
+    last_sequence = models.BigIntegerField(
+        null=True,
+        help_text='Highest BookingEvent sequence folded into DailyLoad; empty for runs made before the event log'
+    )
+    bookings_processed = models.PositiveIntegerField(default=0)
+    load_factors = models.JSONField(default=dict)
+    forecasts = models.JSONField(default=list)
+
+    class Meta:
+        get_latest_by = 'created_at'
+
+    def __str__(self):
+        return f"Analytics run {self.created_at:%Y-%m-%d %H:%M}"
+
+
+# ----- Location history -----
+
+
+class LocationPoint(models.Model):
+    """
+    A GPS fix reported for a bus (see api.tracks). Rows are keyed by `day`,
+    the partition key: retention drops whole days, and on a database with
+    native partitioning the table can be range-partitioned on it.
+    """
+    RESOLUTION_RAW = 0
+
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='location_points')
+    day = models.DateField()
+    recorded_at = models.DateTimeField()
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    resolution = models.PositiveIntegerField(
+        default=RESOLUTION_RAW,
+        help_text='0 for a raw fix, else the bucket in seconds this point was downsampled to',
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['bus', 'recorded_at'], name='location_bus_time_idx'),
+            models.Index(fields=['day', 'resolution', 'bus', 'recorded_at'], name='location_compaction_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.bus_id} at {self.recorded_at:%Y-%m-%d %H:%M:%S}"
+
+
+class BusETA(models.Model):
+    """
+    The latest arrival prediction for a bus (see api.eta), kept in the
+    database so every worker serves what `manage.py refresh_etas` computed.
+    """
+    bus = models.OneToOneField(Bus, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    computed_at = models.DateTimeField()
+    prediction = models.JSONField(encoder=DjangoJSONEncoder)
+
+    def __str__(self):
+        return f"ETA of {self.bus_id} at {self.computed_at:%Y-%m-%d %H:%M:%S}"
@@ -0,0 +1,99 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# App label of django.core.cache.backends.db's cache entries.
+CACHE_APP_LABEL = 'django_cache'
+
+# True while the current request/thread must read from the primary, either
+# because it already wrote something or because the client wrote recently.
+_pinned = ContextVar('replica_pinned', default=False)
+
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def pin_to_primary():
+    """
+    Send every remaining read of the current request to the primary.
+    Returns a token that can be passed to `unpin()`.
+    """
+    return _pinned.set(True)
+
+
+def unpin(token=None):
+    if token is not None:
+        _pinned.reset(token)
+    else:
+        _pinned.set(False)
+
+
+@contextmanager
+def use_primary():
+    """
+    Force reads inside the block onto the primary, e.g. for read-modify-write
+    code that cannot tolerate replication lag.
+    """
+    token = pin_to_primary()
+    try:
+        yield
+    finally:
+        unpin(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Routes reads to one of the configured read replicas and everything else
+    to the primary (`default`).
+
+    Reads stay on the primary when:
+      * no replicas are configured,
+      * the request is pinned (it wrote, or the client wrote within
+        REPLICA_STICKY_SECONDS, see ReplicaPinningMiddleware),
+      * we are inside a transaction on the primary, so reads see our own
+        uncommitted writes.
+
+    `select_for_update()` querysets are marked for write by Django and
+    therefore always end up in `db_for_write`.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            # Cache entries must not lag behind.
+            return DEFAULT_DB_ALIAS
+        replicas = replica_aliases()
+        if not replicas or _pinned.get():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Anything read after a write in the same request must see it; a
+        # cache write says nothing about the request's own data.
+        if replica_aliases() and model._meta.app_label != CACHE_APP_LABEL:
+            _pinned.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary, so objects loaded from
+        # any of them may be related to each other.
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Left to Django so local SQLite "replicas" can be created with
+        # `migrate --database=replica1`; real replicas get schema changes
+        # through replication.
+        return None
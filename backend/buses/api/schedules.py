@@ -0,0 +1,176 @@
+"""
+Expansion of schedules into concrete trips.
+
+Trips are generated lazily: the first request for a date materializes the
+Trip rows of every schedule running that day, and a cache marker keyed on
+the schedules' version makes later requests for the date skip straight to
+an indexed Trip query. Changing a schedule (or one of its exceptions) bumps
+the version, so the next request re-expands the date.
+
+Only dates in the booking horizon (today and settings.BOOKING_HORIZON_DAYS
+- 1 days after it) are expanded, so requests cannot make the table grow
+without bound; trips that already exist outside it are still served.
+Trips that stop running are deleted unless they have bookings, and the
+booking requests still queued for them are rejected.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .caching import bump, get_versions
+from .models import Booking, BookingRequest, Schedule, ScheduleException, Trip
+
+
+SCHEDULES_TAG = 'schedules'
+EXPANDED_TIMEOUT = 24 * 3600
+
+
+def _expanded_key(travel_date, version):
+    return f"trips:expanded:{travel_date.isoformat()}:{version!r}"
+
+
+def invalidate():
+    bump(SCHEDULES_TAG)
+
+
+def in_horizon(travel_date):
+    today = timezone.localdate()
+    return today <= travel_date < today + timedelta(days=settings.BOOKING_HORIZON_DAYS)
+
+
+def reject_requests(trip_ids):
+    """
+    Reject the booking requests still queued for the trips `trip_ids`
+    (ids or a values_list query), which are about to be deleted.
+    """
+    BookingRequest.objects.filter(trip_id__in=trip_ids, status='queued').update(
+        status='rejected', error="This departure no longer runs.", processed_at=timezone.now(),
+    )
+
+
+def running(start, end):
+    """
+    (schedule, travel_date) for every departure the schedules of active
+    buses run on the dates in [start, end], exceptions included.
+    """
+    dates = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    schedules = list(
+        Schedule.objects
+        .filter(bus__status='active')
+        .select_related('bus')
+    )
+    exceptions = defaultdict(dict)
+    for schedule_id, date, runs in (
+        ScheduleException.objects
+        .filter(date__gte=start, date__lte=end)
+        .values_list('schedule_id', 'date', 'runs')
+    ):
+        exceptions[schedule_id][date] = runs
+    return [
+        (schedule, travel_date)
+        for travel_date in dates
+        for schedule in schedules
+        if schedule.runs_on(travel_date, exceptions.get(schedule.id))
+    ]
+
+
+def expand(start, end):
+    """
+    Materialize trips for every date in [start, end], dropping trips of
+    schedules that no longer run on a date unless they already have bookings.
+    """
+    wanted = [
+        Trip(
+            schedule=schedule, bus_id=schedule.bus_id, route_id=schedule.bus.route_id,
+            travel_date=travel_date,
+            departure_time=schedule.departure_time, arrival_time=schedule.arrival_time,
+        )
+        for schedule, travel_date in running(start, end)
+    ]
+    existing = {
+        (schedule_id, travel_date): (trip_id, route_id, departure_time, arrival_time)
+        for trip_id, schedule_id, travel_date, route_id, departure_time, arrival_time in (
+            Trip.objects
+            .filter(travel_date__gte=start, travel_date__lte=end)
+            .values_list('id', 'schedule_id', 'travel_date', 'route_id', 'departure_time', 'arrival_time')
+        )
+    }
+    to_create, to_update = [], []
+    for trip in wanted:
+        current = existing.pop((trip.schedule_id, trip.travel_date), None)
+        if current is None:
+            to_create.append(trip)
+        elif current[1:] != (trip.route_id, trip.departure_time, trip.arrival_time):
+            # Keep existing trips in step with edited schedules and buses.
+            trip.id = current[0]
+            to_update.append(trip)
+    # Whatever is left no longer runs.
+    stale = [current[0] for current in existing.values()]
+
+    with transaction.atomic():
+        Trip.objects.bulk_create(to_create, ignore_conflicts=True, batch_size=500)
+        Trip.objects.bulk_update(to_update, ['route', 'departure_time', 'arrival_time'], batch_size=500)
+        booked = set(Booking.objects.filter(trip_id__in=stale).values_list('trip_id', flat=True))
+        gone = [trip_id for trip_id in stale if trip_id not in booked]
+        reject_requests(gone)
+        Trip.objects.filter(id__in=gone).delete()
+
+
+def ensure_expanded(travel_date):
+    """
+    Make sure the trips of `travel_date` exist if it is in the booking
+    horizon; cheap after the first call.
+    """
+    if not in_horizon(travel_date):
+        return
+    version = get_versions([SCHEDULES_TAG])[SCHEDULES_TAG]
+    key = _expanded_key(travel_date, version)
+    if cache.get(key):
+        return
+    expand(travel_date, travel_date)
+    cache.set(key, True, timeout=EXPANDED_TIMEOUT)
+
+
+def trips_for(travel_date, **filters):
+    """
+    Trips running on `travel_date` (optionally filtered, e.g. route_id=...),
+    in departure order.
+    """
+    ensure_expanded(travel_date)
+    return Trip.objects.filter(travel_date=travel_date, **filters).order_by('departure_time', 'id')
+
+
+def with_times(buses):
+    """
+    `buses` annotated with the departure_time and arrival_time of the first
+    departure of the day among their active schedules (None without one).
+    """
+    first = Schedule.objects.filter(bus=OuterRef('pk'), is_active=True).order_by('departure_time', 'id')
+    return buses.annotate(
+        departure_time=Subquery(first.values('departure_time')[:1]),
+        arrival_time=Subquery(first.values('arrival_time')[:1]),
+    )
+
+
+def resolve_trip(bus, travel_date, trip=None):
+    """
+    The trip a booking of `bus` on `travel_date` is for. Returns (trip, error).
+    A bus with a single departure that day does not need the trip spelled out.
+    """
+    if not in_horizon(travel_date):
+        return None, f"Bookings are open from today to {settings.BOOKING_HORIZON_DAYS - 1} days ahead"
+    if trip is not None:
+        if trip.bus_id != bus.id or trip.travel_date != travel_date:
+            return None, f"Trip {trip.id} is not a departure of bus {bus.plate_number} on {travel_date}"
+        return trip, None
+    trips = list(trips_for(travel_date, bus_id=bus.id))
+    if not trips:
+        return None, f"Bus {bus.plate_number} does not run on {travel_date}"
+    if len(trips) > 1:
+        return None, f"Bus {bus.plate_number} departs several times on {travel_date}; choose a trip"
+    return trips[0], None
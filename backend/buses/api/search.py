@@ -0,0 +1,144 @@
+"""
+Booking search for admins and support.
+
+Each booking has one search document: its receipt id, the customer's
+username and e-mail, the bus plate and the names, phones and e-mails of
+the passengers on its tickets. Documents live in api_booking_search
+(rowid = booking id), which is not a Django model because its shape
+depends on the database (see migration 0016):
+
+- SQLite: an FTS5 table with the trigram tokenizer, so any substring of
+  three or more characters is found through the index;
+- PostgreSQL: a plain table with a pg_trgm GIN index, which serves
+  ILIKE '%...%';
+- anything else: a plain table, scanned.
+
+A search returns the newest matching bookings, every term having to
+occur somewhere in the document. Documents are rewritten when a booking,
+its customer's name or its bus plate change (api.signals). Tickets are
+written in bulk, so their writers (booking creation, the admission
+worker, the admin) call `index_bookings` once per booking themselves.
+"""
+from collections import defaultdict
+
+from django.db import connection
+
+from .models import Booking, Ticket
+
+
+TABLE = 'api_booking_search'
+SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 500
+# Rows per statement; also keeps `__in` lists under SQLite's parameter limit.
+INDEX_CHUNK = 500
+# Shortest term the trigram index can look up.
+MIN_TRIGRAM = 3
+
+
+def _chunks(ids, size=INDEX_CHUNK):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def documents(booking_ids):
+    """
+    {booking_id: search document} for the bookings that exist.
+    """
+    parts = defaultdict(list)
+    for booking_id, *values in (
+        Booking.objects
+        .filter(id__in=booking_ids)
+        .values_list('id', 'receipt_id', 'user__username', 'user__email', 'bus__plate_number')
+    ):
+        parts[booking_id].extend(values)
+    for booking_id, *values in (
+        Ticket.objects
+        .filter(booking_id__in=list(parts))
+        .order_by('id')
+        .values_list('booking_id', 'passenger_name', 'passenger_phone', 'passenger_email')
+    ):
+        parts[booking_id].extend(values)
+    return {booking_id: ' '.join(value for value in values if value) for booking_id, values in parts.items()}
+
+
+def remove(booking_ids):
+    with connection.cursor() as cursor:
+        for chunk in _chunks(booking_ids):
+            cursor.execute(
+                f"DELETE FROM {TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})", chunk,
+            )
+
+
+def index_bookings(booking_ids):
+    """
+    Rewrite the documents of `booking_ids`; ids of deleted bookings are
+    dropped from the index.
+    """
+    for chunk in _chunks(booking_ids):
+        docs = documents(chunk)
+        remove(chunk)
+        if docs:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {TABLE} (rowid, document) VALUES (%s, %s)", list(docs.items()),
+                )
+
+
+def rebuild(chunk_size=INDEX_CHUNK):
+    """
+    Index every booking from scratch. Returns the number indexed.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+    indexed, last_id = 0, 0
+    while True:
+        ids = list(
+            Booking.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return indexed
+        index_bookings(ids)
+        indexed += len(ids)
+        last_id = ids[-1]
+
+
+def _like(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def matches(query):
+    """
+    (sql, params) selecting the ids (rowid) of every booking whose document
+    contains each term of `query`, case-insensitively; None for a blank
+    query. Usable as a subquery, e.g. `id__in=RawSQL(*matches(query))`.
+    """
+    terms = query.split()
+    if not terms:
+        return None
+    conditions, params = [], []
+    if connection.vendor == 'sqlite':
+        indexed = [term for term in terms if len(term) >= MIN_TRIGRAM]
+        if indexed:
+            conditions.append(f"{TABLE} MATCH %s")
+            params.append(' '.join('"' + term.replace('"', '""') + '"' for term in indexed))
+        terms = [term for term in terms if len(term) < MIN_TRIGRAM]
+    operator = 'ILIKE' if connection.vendor == 'postgresql' else 'LIKE'
+    for term in terms:
+        conditions.append(f"document {operator} %s ESCAPE '\\'")
+        params.append(_like(term))
+    return f"SELECT rowid FROM {TABLE} WHERE {' AND '.join(conditions)}", params
+
+
+def search(query, limit=SEARCH_LIMIT):
+    """
+    Ids of the newest `limit` bookings matching `query` (see matches).
+    """
+    matched = matches(query)
+    if matched is None:
+        return []
+    sql, params = matched
+    with connection.cursor() as cursor:
+        cursor.execute(f"{sql} ORDER BY rowid DESC LIMIT %s", params + [limit])
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,157 @@
+"""
+Seat layout and group seat assignment.
+
+Seats know their place in the bus: deck, row and column, where each row
+leaves a column free for the aisle (a 2+2 row uses columns 1, 2, 4 and 5),
+and whether they are a window, middle or aisle seat. `generate_layout`
+lays out a bus from its capacity, `Bus.seat_layout` and `Bus.decks`;
+existing seats keep their numbers and take the first places in natural
+order ("2" before "10"). Seats that were never laid out sort after the
+others, in natural order.
+
+`assign` picks the seats for a group in one pass over the seat map of a
+departure (the seats in layout order and the occupancy bitsets of
+api.segments, loaded once per request or once per admission batch). Every
+run of `count` consecutive seats in layout order is a candidate; prefix
+sums make each one O(1) to check and score, preferring, in order: fewer
+rows, fewer breaks (the aisle, or a seat that is not next to the previous
+one) and the best-fit waste of segments.allocate. When no run is free
+throughout, the group is split over the best-fitting free seats.
+
+Callers hold the bus row lock (select_for_update) from loading the seat
+map until the tickets are written, so two groups are never given the same
+seat. A direct booking therefore waits for the other bookings of its bus,
+one at a time; departures busy enough for that to matter are hot and go
+through the admission queue (api.admission), whose worker takes the lock
+once per batch and assigns the whole batch from one load of the seat map.
+"""
+import re
+
+from django.db import transaction
+
+from .caching import bump
+from .models import Seat
+from .segments import allocate, fit_waste, span_mask
+
+
+def natural_key(seat_number):
+    """
+    Sort key comparing the numeric parts of seat numbers as numbers.
+    """
+    return tuple(
+        (0, int(part), '') if part.isdigit() else (1, 0, part.lower())
+        for part in re.split(r'(\d+)', seat_number) if part
+    )
+
+
+def layout_key(deck, row, column, seat_number):
+    return (deck, row is None, row or 0, column or 0, natural_key(seat_number))
+
+
+def row_places(seat_layout):
+    """
+    (column, position) of the seats of one row of a `seat_layout` bus.
+    """
+    left, right = (int(side) for side in seat_layout.split('+'))
+    last = left + right + 1
+    places = []
+    for column in [*range(1, left + 1), *range(left + 2, last + 1)]:
+        if column in (1, last):
+            position = 'window'
+        elif column in (left, left + 2):
+            position = 'aisle'
+        else:
+            position = 'middle'
+        places.append((column, position))
+    return places
+
+
+def places(count, seat_layout, decks=1):
+    """
+    (deck, row, column, position) of `count` seats, front to back, the
+    seats split evenly over the decks.
+    """
+    row = row_places(seat_layout)
+    per_deck = -(-count // max(1, decks))
+    for i in range(count):
+        deck, offset = divmod(i, per_deck)
+        yield (deck + 1, offset // len(row) + 1, *row[offset % len(row)])
+
+
+def generate_layout(bus):
+    """
+    Lay out the seats of `bus` and add seats up to its capacity.
+    Returns the number of seats created.
+    """
+    seats = sorted(bus.seats.all(), key=lambda seat: natural_key(seat.seat_number))
+    taken = {seat.seat_number for seat in seats}
+    new_numbers = (str(number) for number in range(1, bus.capacity + len(taken) + 1) if str(number) not in taken)
+    created = []
+    for i, (deck, row, column, position) in enumerate(places(max(bus.capacity, len(seats)), bus.seat_layout, bus.decks)):
+        if i < len(seats):
+            seat = seats[i]
+        else:
+            seat = Seat(bus=bus, seat_number=next(new_numbers))
+            created.append(seat)
+        seat.deck, seat.row, seat.column, seat.position = deck, row, column, position
+    with transaction.atomic():
+        Seat.objects.bulk_update(seats, ['deck', 'row', 'column', 'position'], batch_size=500)
+        Seat.objects.bulk_create(created)
+    # Bulk writes send no signals.
+    transaction.on_commit(lambda: bump(f'bus:{bus.pk}'))
+    return len(created)
+
+
+def sort_seats(seats):
+    """
+    `seats` (Seat instances) in layout order.
+    """
+    return sorted(seats, key=lambda seat: layout_key(seat.deck, seat.row, seat.column, seat.seat_number))
+
+
+def bus_layout(bus_id):
+    """
+    Seats of `bus_id` in layout order, as (seat_id, deck, row, column).
+    """
+    rows = Seat.objects.filter(bus_id=bus_id).values_list('id', 'deck', 'row', 'column', 'seat_number')
+    return [row[:4] for row in sorted(rows, key=lambda row: layout_key(*row[1:]))]
+
+
+def assign(layout, masks, start, end, count, segments):
+    """
+    Ids of `count` seats of `layout` (see bus_layout) free over
+    [start, end), together where possible, or None if there are not enough.
+    """
+    if count <= 0:
+        return None
+    wanted = span_mask(start, end)
+    # free[i], breaks[i] and waste[i]: sums over the first i seats; a break
+    # is counted on the seat that does not follow on from the one before.
+    free, breaks, waste = [0], [0], [0]
+    previous = None
+    for seat_id, deck, row, column in layout:
+        mask = masks.get(seat_id, 0)
+        is_free = not mask & wanted
+        free.append(free[-1] + is_free)
+        waste.append(waste[-1] + (fit_waste(mask, start, end, segments) if is_free else 0))
+        follows = (
+            previous is not None and previous[1:3] == (deck, row)
+            and column is not None and previous[3] is not None and column - previous[3] == 1
+        )
+        breaks.append(breaks[-1] + (not follows))
+        previous = (seat_id, deck, row, column)
+
+    best = None
+    for i in range(len(layout) - count + 1):
+        j = i + count
+        first, last = layout[i], layout[j - 1]
+        if free[j] - free[i] < count or first[1] != last[1]:
+            continue
+        rows = (last[2] or 0) - (first[2] or 0)
+        # Breaks inside the run: the first seat's own break is not one.
+        score = (rows, breaks[j] - breaks[i + 1], waste[j] - waste[i], i)
+        if best is None or score < best:
+            best = score
+    if best is not None:
+        return [seat_id for seat_id, _, _, _ in layout[best[3]:best[3] + count]]
+    return allocate(masks, [seat_id for seat_id, _, _, _ in layout], start, end, count, segments)
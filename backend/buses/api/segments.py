@@ -0,0 +1,145 @@
+"""
+Seat availability between stations.
+
+A route with n stations (in `order`) has n - 1 segments; segment k runs
+from the k-th to the (k+1)-th station. A booking covers the segments
+between its board and alight stations, the whole route if they are empty.
+
+Per departure, each seat's occupancy is an integer bitset with bit k set
+when segment k is sold. The bitsets are built in one pass over the booked
+seats of the departure, after which "is seat s free from station i to j"
+is a single AND, and the free seats of a whole bus are one pass over its
+seats, however many bookings there are.
+"""
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .models import Booking, Station, Ticket
+
+
+def full_mask(segments):
+    return (1 << segments) - 1
+
+
+def span_mask(start, end):
+    """
+    Bits of segments start..end-1.
+    """
+    return full_mask(end) & ~full_mask(start)
+
+
+def route_indexes(route_ids):
+    """
+    {route_id: {station_id: position}} for the stations of `route_ids`.
+    """
+    indexes = {route_id: {} for route_id in route_ids}
+    for route_id, station_id in (
+        Station.objects
+        .filter(route_id__in=list(indexes))
+        .order_by('route_id', 'order', 'id')
+        .values_list('route_id', 'id')
+    ):
+        indexes[route_id][station_id] = len(indexes[route_id])
+    return indexes
+
+
+def segment_count(index):
+    return max(1, len(index) - 1)
+
+
+def segment_span(index, board_station_id=None, alight_station_id=None):
+    """
+    (start, end) segments travelled between two stations of the route
+    indexed by `index`. Unknown or empty stations extend the span to the
+    end of the route, which can only overstate what a booking holds.
+    """
+    segments = segment_count(index)
+    start = index.get(board_station_id, 0)
+    end = index.get(alight_station_id, segments)
+    if end <= start:
+        return 0, segments
+    return start, min(end, segments)
+
+
+def seat_masks(departures, indexes=None):
+    """
+    Occupancy bitsets of the bookings holding seats (Booking.HELD_STATUSES)
+    for each departure.
+
+    `departures` are (trip_id, bus_id, travel_date, route_id) tuples; returns
+    {trip_id: {seat_id: mask}}. Bookings without a trip count against every
+    departure of their bus that day. Pass the `route_indexes` of the routes
+    when they are already loaded, to save a query.
+    """
+    departures = list(departures)
+    masks = {trip_id: defaultdict(int) for trip_id, _, _, _ in departures}
+    if not departures:
+        return masks
+    if indexes is None:
+        indexes = route_indexes({route_id for _, _, _, route_id in departures})
+    by_trip = {trip_id: indexes[route_id] for trip_id, _, _, route_id in departures}
+    by_day = defaultdict(list)
+    for trip_id, bus_id, travel_date, route_id in departures:
+        by_day[bus_id, travel_date].append(trip_id)
+
+    legacy = Q()
+    for bus_id, travel_date in by_day:
+        legacy |= Q(booking__bus_id=bus_id, travel_date=travel_date, booking__trip__isnull=True)
+    rows = (
+        Ticket.objects
+        .filter(Q(booking__trip_id__in=list(masks)) | legacy, booking__status__in=Booking.HELD_STATUSES)
+        .values_list(
+            'seat_id', 'booking__trip_id', 'booking__bus_id', 'booking__travel_date',
+            'booking__board_station_id', 'booking__alight_station_id',
+        )
+    )
+    for seat_id, trip_id, bus_id, travel_date, board_id, alight_id in rows:
+        trip_ids = [trip_id] if trip_id is not None else by_day[bus_id, travel_date]
+        for trip_id in trip_ids:
+            masks[trip_id][seat_id] |= span_mask(*segment_span(by_trip[trip_id], board_id, alight_id))
+    return masks
+
+
+def trip_seat_masks(trip, indexes=None):
+    return seat_masks([(trip.id, trip.bus_id, trip.travel_date, trip.route_id)], indexes)[trip.id]
+
+
+def free_seats(masks, seat_ids, start, end):
+    wanted = span_mask(start, end)
+    return [seat_id for seat_id in seat_ids if not masks.get(seat_id, 0) & wanted]
+
+
+def taken_count(masks, start, end):
+    wanted = span_mask(start, end)
+    return sum(1 for mask in masks.values() if mask & wanted)
+
+
+def fit_waste(mask, start, end, segments):
+    """
+    Free segments of a seat that a booking over [start, end) would strand
+    around it: the length of its free stretch around the span, minus the span.
+    """
+    low, high = start, end
+    while low > 0 and not mask >> (low - 1) & 1:
+        low -= 1
+    while high < segments and not mask >> high & 1:
+        high += 1
+    return (high - low) - (end - start)
+
+
+def allocate(masks, seat_ids, start, end, count, segments):
+    """
+    Pick `count` seats free over [start, end), or None if there are not
+    enough. Best fit: prefer the seats whose free stretch around the span is
+    shortest, so a short trip fills a gap between other bookings instead of
+    breaking up a seat that is still free for long trips.
+    """
+    candidates = [
+        (fit_waste(masks.get(seat_id, 0), start, end, segments), position, seat_id)
+        for position, seat_id in enumerate(free_seats(masks, seat_ids, start, end))
+    ]
+    if len(candidates) < count:
+        return None
+    candidates.sort()
+    return [seat_id for _, _, seat_id in candidates[:count]]
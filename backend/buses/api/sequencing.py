@@ -0,0 +1,85 @@
+"""
+Commit-ordered sequence numbers.
+
+Ids and timestamps are assigned before a transaction commits, so rows
+can become visible out of id or timestamp order, and a reader paging by
+them can step past a row whose transaction commits late. Rows that
+readers page through (BookingEvents for the event stream, Bookings and
+BookingTombstones for manifest sync) are therefore numbered after they
+commit instead: `stamp()` gives every committed row whose `sequence` is
+still empty the next numbers of one counter (CommitSequence), holding the
+counter row's lock until its own transaction commits. Numbers thus become
+visible strictly in order, and a reader that has seen sequence n will
+never be shown a new row numbered n or below.
+
+Writers call `stamp_on_commit()`; readers call `stamp()` before reading,
+which also numbers rows whose process died between commit and stamping,
+and costs one query when there are none. Rows without a number are not
+served yet.
+"""
+from django.db import transaction
+from django.db.models import Exists, F
+
+from .models import Booking, BookingEvent, BookingTombstone, CommitSequence
+from .routers import use_primary
+
+
+SEQUENCED_MODELS = (BookingEvent, BookingTombstone, Booking)
+COUNTER_ID = 1
+# Rows numbered per UPDATE.
+STAMP_BATCH = 500
+
+
+def stamp():
+    """
+    Number the committed rows that have no sequence yet. Returns the
+    highest number handed out so far.
+    """
+    with use_primary():
+        # The counter and whether each model has rows to number, in one query.
+        row = (
+            CommitSequence.objects.filter(pk=COUNTER_ID)
+            .annotate(**{
+                model._meta.model_name: Exists(model.objects.filter(sequence__isnull=True))
+                for model in SEQUENCED_MODELS
+            })
+            .values_list('last_value', *(model._meta.model_name for model in SEQUENCED_MODELS))
+            .first()
+        )
+        if row is None:
+            pending = SEQUENCED_MODELS
+        else:
+            pending = [model for model, waiting in zip(SEQUENCED_MODELS, row[1:]) if waiting]
+            if not pending:
+                return row[0]
+        with transaction.atomic():
+            # Writing the counter row first takes its lock (on SQLite, the
+            # database write lock) before anything is read, so stampers
+            # run one at a time.
+            CommitSequence.objects.filter(pk=COUNTER_ID).update(last_value=F('last_value'))
+            counter, _ = CommitSequence.objects.get_or_create(pk=COUNTER_ID)
+            value = counter.last_value
+            for model in pending:
+                while True:
+                    ids = list(
+                        model.objects.filter(sequence__isnull=True).order_by('id')
+                        .values_list('id', flat=True)[:STAMP_BATCH]
+                    )
+                    if not ids:
+                        break
+                    # bulk_update: a plain UPDATE, so Booking.save does not
+                    # clear the number again.
+                    model.objects.bulk_update(
+                        [model(id=pk, sequence=value + i) for i, pk in enumerate(ids, 1)], ['sequence'],
+                    )
+                    value += len(ids)
+            CommitSequence.objects.filter(pk=COUNTER_ID).update(last_value=value)
+    return value
+
+
+def stamp_on_commit():
+    """
+    Number the rows written by the current transaction once it commits.
+    A failure is only logged: the next reader numbers them.
+    """
+    transaction.on_commit(stamp, robust=True)
@@ -1,8 +1,16 @@
-from rest_framework import serializers
+from rest_framework import permissions, serializers
 from django.contrib.auth.password_validation import validate_password
-from django.db.models import Count
-from .models import CustomUser, Route, Station, Bus, Seat, Booking
+from django.db import transaction
+from django.db.models.manager import BaseManager
+from . import events, search
+from .models import ArchivedBooking, CustomUser, Route, Station, Bus, Seat, Booking, BookingRequest, Ticket, Trip
+from .schedules import resolve_trip
+from .seatmap import assign, bus_layout
+from .segments import (
+    route_indexes, seat_masks, segment_count, segment_span, span_mask, taken_count, trip_seat_masks,
+)
 import uuid
+from decimal import Decimal
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -32,6 +40,42 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
 
 
+def requested_fields(request):
+    """
+    Field names from a `?fields=a,b,c` query parameter, or None for all fields.
+    """
+    if request is None:
+        return None
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Lets clients ask for a subset of fields with `?fields=`, either from the
+    request in the serializer context or an explicit `fields` context entry.
+    Only the top-level serializer of a read is trimmed; nested serializers
+    and writes always see every field.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        is_root = self.parent is None or (
+            isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None
+        )
+        request = self.context.get('request')
+        if not is_root or (request is not None and request.method not in permissions.SAFE_METHODS):
+            return fields
+        wanted = self.context.get('fields') or requested_fields(self.context.get('request'))
+        if wanted:
+            for name in list(fields):
+                if name not in wanted and not fields[name].write_only:
+                    fields.pop(name)
+        return fields
+
+
 class StationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Station
@@ -46,8 +90,16 @@ class RouteSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'start_location', 'end_location', 'distance', 'estimated_duration', 'stations']
 
 
-class BusSerializer(serializers.ModelSerializer):
-    available_seats = serializers.SerializerMethodField()
+class BusSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Departure and arrival are those of the bus's first active schedule of
+    the day; list buses annotated by api.schedules.with_times. A bus has no
+    date to count bookings on, so all its seats are available; seats left
+    on a departure are TripSerializer's.
+    """
+    available_seats = serializers.IntegerField(source='capacity', read_only=True)
+    departure_time = serializers.TimeField(read_only=True, allow_null=True)
+    arrival_time = serializers.TimeField(read_only=True, allow_null=True)
 
     class Meta:
         model = Bus
@@ -67,22 +119,78 @@ class BusSerializer(serializers.ModelSerializer):
             'longitude',           # Newly added longitude
         ]
 
-    def get_available_seats(self, obj):
+
+class TripListSerializer(serializers.ListSerializer):
+    """
+    Loads the seat occupancy of all the listed trips at once.
+    """
+
+    def to_representation(self, data):
+        trips = list(data.all() if isinstance(data, BaseManager) else data)
+        self.child.load_occupancy(trips)
+        return super().to_representation(trips)
+
+
+class TripSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    A departure of a bus on a date, shaped like BusSerializer (`id` is the
+    bus) with the trip id and the trip's own times.
+    """
+    id = serializers.IntegerField(source='bus.id', read_only=True)
+    trip = serializers.IntegerField(source='id', read_only=True)
+    plate_number = serializers.CharField(source='bus.plate_number', read_only=True)
+    conductor = serializers.PrimaryKeyRelatedField(source='bus.conductor', read_only=True)
+    capacity = serializers.IntegerField(source='bus.capacity', read_only=True)
+    available_seats = serializers.SerializerMethodField()
+    price_per_seat = serializers.DecimalField(
+        source='bus.price_per_seat', max_digits=10, decimal_places=2, read_only=True
+    )
+    student_discount = serializers.IntegerField(source='bus.student_discount', read_only=True)
+    status = serializers.CharField(source='bus.status', read_only=True)
+    latitude = serializers.FloatField(source='bus.latitude', read_only=True)
+    longitude = serializers.FloatField(source='bus.longitude', read_only=True)
+
+    class Meta:
+        model = Trip
+        fields = [
+            'id',
+            'trip',
+            'plate_number',
+            'route',
+            'conductor',
+            'capacity',
+            'available_seats',
+            'price_per_seat',
+            'student_discount',
+            'departure_time',
+            'arrival_time',
+            'status',
+            'latitude',
+            'longitude',
+        ]
+        list_serializer_class = TripListSerializer
+
+    _indexes = _masks = None
+
+    def load_occupancy(self, trips):
         """
-        Calculate available seats for the given bus on a specific travel date.
-        Expects 'travel_date' in serializer context.
+        Load the route indexes and seat masks of `trips` (see api.segments).
         """
-        travel_date = self.context.get('travel_date')
-        if not travel_date:
-            # No date provided, assume full capacity available
-            return obj.capacity
-
-        # Count the total number of seats booked for this bus & date where booking is confirmed
-        booked_seats = obj.bookings.filter(travel_date=travel_date, status='confirmed').aggregate(
-            total=Count('seats')
-        )['total'] or 0
+        self._indexes = route_indexes({trip.route_id for trip in trips})
+        self._masks = seat_masks(
+            ((trip.id, trip.bus_id, trip.travel_date, trip.route_id) for trip in trips), self._indexes,
+        )
 
-        return max(0, obj.capacity - booked_seats)
+    def get_available_seats(self, trip):
+        """
+        Seats free between the 'board_station' and 'alight_station' in the
+        serializer context, the whole route by default.
+        """
+        if self._masks is None or trip.id not in self._masks:
+            self.load_occupancy([trip])
+        index = self._indexes[trip.route_id]
+        start, end = segment_span(index, self.context.get('board_station'), self.context.get('alight_station'))
+        return max(0, trip.bus.capacity - taken_count(self._masks[trip.id], start, end))
 
 
 class SeatSerializer(serializers.ModelSerializer):
@@ -93,14 +201,74 @@ class SeatSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Seat
-        fields = ['id', 'bus', 'seatNumber', 'isAvailable', 'isReserved', 'price']
+        fields = ['id', 'bus', 'seatNumber', 'deck', 'row', 'column', 'position', 'isAvailable', 'isReserved', 'price']
 
     def get_price(self, seat):
         return seat.bus.price_per_seat
 
 
-class BookingSerializer(serializers.ModelSerializer):
-    seats = serializers.PrimaryKeyRelatedField(queryset=Seat.objects.all(), many=True)
+def generate_receipt_ids(count):
+    """
+    `count` receipt ids that are not in use yet, checked with one query.
+    """
+    receipt_ids = set()
+    while len(receipt_ids) < count:
+        candidates = {f"RCP-{uuid.uuid4().hex[:16].upper()}" for _ in range(count - len(receipt_ids))}
+        taken = set(Booking.objects.filter(receipt_id__in=candidates).values_list('receipt_id', flat=True))
+        receipt_ids |= candidates - taken
+    return list(receipt_ids)
+
+
+def seat_prices(bus, seats, passenger_info):
+    """
+    Price of each of `seats`, applying the bus's student discount to seats
+    whose passenger (matched by position) has type 'student'.
+    """
+    base_price = bus.price_per_seat
+    discount = Decimal(bus.student_discount)
+
+    prices = []
+    for i, seat in enumerate(seats):
+        passenger = passenger_info[i] if i < len(passenger_info) else {}
+        passenger_type = passenger.get('type', 'adult')
+        # Apply discount only for students
+        if passenger_type == 'student':
+            price = base_price * (100 - discount) / 100
+        else:
+            price = base_price
+        prices.append(price)
+    return prices
+
+
+def price_seats(bus, seats, passenger_info):
+    """
+    Total price of `seats` (see seat_prices).
+    """
+    return sum(seat_prices(bus, seats, passenger_info), Decimal('0.00')).quantize(Decimal('0.01'))
+
+
+def build_tickets(booking, seats, passenger_info):
+    """
+    Unsaved Tickets of `booking`, one per seat with the passenger at the
+    same position and that seat's price.
+    """
+    prices = seat_prices(booking.bus, seats, passenger_info)
+    return [
+        Ticket.for_passenger(
+            booking, seat,
+            passenger_info[i] if i < len(passenger_info) else {},
+            prices[i].quantize(Decimal('0.01')),
+        )
+        for i, seat in enumerate(seats)
+    ]
+
+
+class BookingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    seats = serializers.PrimaryKeyRelatedField(queryset=Seat.objects.all(), many=True, required=False)
+    # Instead of `seats`: let the server pick this many seats together (api.seatmap).
+    seat_count = serializers.IntegerField(min_value=1, write_only=True, required=False)
+    # Stored on the tickets; read back through Booking.passenger_info.
+    passenger_info = serializers.ListField(child=serializers.DictField(), required=False)
 
     class Meta:
         model = Booking
@@ -109,26 +277,30 @@ class BookingSerializer(serializers.ModelSerializer):
             'user',
             'bus',
             'travel_date',
+            'trip',
+            'board_station',
+            'alight_station',
             'seats',
+            'seat_count',
             'total_price',
             'passenger_info',
             'status',
             'booking_date',
             'receipt_id',
+            'updated_at',
+            'version',
         ]
-        read_only_fields = ['id', 'status', 'booking_date', 'receipt_id', 'user']
+        read_only_fields = ['id', 'status', 'booking_date', 'receipt_id', 'user', 'updated_at', 'version']
 
     def generate_unique_receipt_id(self):
         """
         Generate a unique receipt_id to avoid DB uniqueness conflicts.
         """
-        while True:
-            receipt_id = f"RCP-{uuid.uuid4().hex[:16].upper()}"
-            if not Booking.objects.filter(receipt_id=receipt_id).exists():
-                return receipt_id
+        return generate_receipt_ids(1)[0]
 
     def create(self, validated_data):
-        seats = validated_data.pop('seats')
+        seats = validated_data.pop('seats', None)
+        seat_count = validated_data.pop('seat_count', None)
         passenger_info = validated_data.pop('passenger_info', [])
 
         user = self.context['request'].user
@@ -138,55 +310,120 @@ class BookingSerializer(serializers.ModelSerializer):
         validated_data['receipt_id'] = self.generate_unique_receipt_id()
 
         bus = validated_data['bus']
-        base_price = bus.price_per_seat
-        discount = bus.student_discount
-
-        total_price = 0
-        for i, seat in enumerate(seats):
-            passenger = passenger_info[i] if i < len(passenger_info) else {}
-            passenger_type = passenger.get('type', 'adult')
-            # Apply discount only for students
-            price = base_price * (1 - discount / 100) if passenger_type == 'student' else base_price
-            total_price += price
-
-        validated_data['total_price'] = total_price
-
-        # Combine passenger info with seat data
-        combined_passenger_info = []
-        for i, passenger in enumerate(passenger_info):
-            seat = seats[i] if i < len(seats) else None
-            if seat:
-                combined = passenger.copy()
-                combined['seatId'] = seat.id
-                combined['seatNumber'] = seat.seat_number
-                combined_passenger_info.append(combined)
-            else:
-                combined_passenger_info.append(passenger)
-
-        validated_data['passenger_info'] = combined_passenger_info
-
-        booking = Booking.objects.create(**validated_data)
-        booking.seats.set(seats)
-        booking.save()
+        with transaction.atomic():
+            # Bookings of the same bus wait for each other here, as in
+            # admission.process_batch, so the seats are checked or picked
+            # against occupancy that stays current until the tickets exist.
+            Bus.objects.select_for_update().filter(pk=bus.pk).values_list('pk').get()
+            seats = self.reserve_seats(validated_data, seats, seat_count)
+            validated_data['total_price'] = price_seats(bus, seats, passenger_info)
+            booking = Booking.objects.create(**validated_data)
+            Ticket.objects.bulk_create(build_tickets(booking, seats, passenger_info))
+            # bulk_create sends no signals: index the passengers' names.
+            search.index_bookings([booking.pk])
+            events.record_created([booking], [[seat.id for seat in seats]])
         return booking
 
+    def reserve_seats(self, attrs, seats, seat_count):
+        """
+        Check that `seats` are free on the booked trip and stretch, or pick
+        `seat_count` free seats together (api.seatmap). Call with the bus
+        locked.
+        """
+        bus, trip, travel_date = attrs['bus'], attrs['trip'], attrs['travel_date']
+        board_station = attrs.get('board_station')
+        alight_station = attrs.get('alight_station')
+        # Seat occupancy of this departure, per route segment
+        index = route_indexes([trip.route_id])[trip.route_id]
+        start, end = segment_span(
+            index,
+            board_station.id if board_station else None,
+            alight_station.id if alight_station else None,
+        )
+        masks = trip_seat_masks(trip, {trip.route_id: index})
+        if seat_count:
+            seat_ids = assign(bus_layout(bus.id), masks, start, end, seat_count, segment_count(index))
+            if seat_ids is None:
+                raise serializers.ValidationError(
+                    f"Bus {bus.plate_number} has fewer than {seat_count} free seats on {travel_date}"
+                )
+            by_id = Seat.objects.in_bulk(seat_ids)
+            return [by_id[seat_id] for seat_id in seat_ids]
+        for seat in seats:
+            if masks.get(seat.id, 0) & span_mask(start, end):
+                raise serializers.ValidationError(
+                    f"Seat {seat.seat_number} is already booked for {travel_date}"
+                )
+        return seats
+
     def validate(self, attrs):
         bus = attrs.get('bus')
         seats = attrs.get('seats')
+        seat_count = attrs.get('seat_count')
         travel_date = attrs.get('travel_date')
+        if seats and seat_count:
+            raise serializers.ValidationError("Give either seats or seat_count, not both.")
+        if seats is None and seat_count is None:
+            raise serializers.ValidationError({'seats': "This field is required."})
+
+        trip, error = resolve_trip(bus, travel_date, attrs.get('trip'))
+        if error:
+            raise serializers.ValidationError(error)
+        attrs['trip'] = trip
+
+        board_station = attrs.get('board_station')
+        alight_station = attrs.get('alight_station')
+        for station in (board_station, alight_station):
+            if station is not None and station.route_id != trip.route_id:
+                raise serializers.ValidationError(
+                    f"Station {station.name} is not on the route of bus {bus.plate_number}"
+                )
+        if board_station and alight_station and board_station.order >= alight_station.order:
+            raise serializers.ValidationError("The alighting station must come after the boarding station.")
 
-        for seat in seats:
+        if seats and len({seat.id for seat in seats}) != len(seats):
+            raise serializers.ValidationError("The same seat was requested twice.")
+        for seat in seats or []:
             if seat.bus_id != bus.id:
                 raise serializers.ValidationError(
                     f"Seat {seat.seat_number} does not belong to bus {bus.plate_number}"
                 )
+        # Whether the seats are free is checked by create(), under a lock.
+        return attrs
 
-            # Check seat availability for the travel date with confirmed status
-            if Booking.objects.filter(
-                bus=bus, travel_date=travel_date, seats=seat, status='confirmed'
-            ).exists():
-                raise serializers.ValidationError(
-                    f"Seat {seat.seat_number} is already booked for {travel_date}"
-                )
 
+class ArchivedBookingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Read-only, with the same fields and output as BookingSerializer.
+    """
+
+    class Meta:
+        model = ArchivedBooking
+        fields = [name for name in BookingSerializer.Meta.fields if name != 'seat_count']
+        read_only_fields = fields
+
+
+class BookingRequestSerializer(serializers.ModelSerializer):
+    """
+    Accepts the same payload as BookingSerializer for the admission queue;
+    seat ownership and availability are checked later by the queue worker.
+    """
+    seats = serializers.ListField(
+        child=serializers.IntegerField(), source='seat_ids', allow_empty=False, required=False,
+    )
+    seat_count = serializers.IntegerField(min_value=1, required=False)
+    passenger_info = serializers.ListField(child=serializers.DictField(), required=False)
+    booking = BookingSerializer(read_only=True)
+
+    class Meta:
+        model = BookingRequest
+        fields = [
+            'id', 'bus', 'travel_date', 'trip', 'board_station', 'alight_station', 'seats', 'seat_count',
+            'passenger_info', 'status', 'error', 'booking', 'created_at',
+        ]
+        read_only_fields = ['id', 'status', 'error', 'booking', 'created_at']
+
+    def validate(self, attrs):
+        if bool(attrs.get('seat_ids')) == bool(attrs.get('seat_count')):
+            raise serializers.ValidationError("Give either seats or seat_count.")
         return attrs
@@ -0,0 +1,154 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .caching import bump
+from . import archive, schedules, search, sequencing
+from .models import (
+    Booking, BookingEvent, BookingTombstone, Bus, CustomUser, Route, Schedule, ScheduleException, Seat, Station,
+    Ticket,
+)
+
+
+# ----- HTTP cache invalidation -----
+# Tags: 'catalogue' (routes & stations), 'route:<id>' (buses of a route and
+# their availability), 'bus:<id>' (seat map of a bus).
+
+@receiver([post_save, post_delete], sender=Route)
+def invalidate_catalogue(sender, instance, **kwargs):
+    bump('catalogue')
+
+
+@receiver([post_save, post_delete], sender=Station)
+def invalidate_station(sender, instance, **kwargs):
+    # Stations delimit the segments seat availability is counted over.
+    bump('catalogue', f'route:{instance.route_id}')
+
+
+@receiver([post_save, post_delete], sender=Bus)
+def invalidate_bus(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(update_fields) - {'latitude', 'longitude'}:
+        # Of the cached responses only the route's trip listing shows the
+        # position; seat maps and the trips that run stay as they are.
+        bump(f'route:{instance.route_id}')
+        return
+    bump(f'bus:{instance.pk}', f'route:{instance.route_id}')
+    schedules.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Seat)
+def invalidate_seat(sender, instance, **kwargs):
+    bump(f'bus:{instance.bus_id}')
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def invalidate_booking(sender, instance, **kwargs):
+    if archive.archiving():
+        return
+    bump(f'bus:{instance.bus_id}', f'route:{instance.bus.route_id}')
+
+
+@receiver(post_save, sender=Ticket)
+def invalidate_ticket(sender, instance, **kwargs):
+    # Tickets are created in bulk with their booking, whose receiver bumps;
+    # this covers tickets added or changed later (the admin). There is no
+    # delete receiver, so ticket deletes stay fast: deleting a booking
+    # bumps through the booking, and the admin bumps for the tickets it
+    # deletes.
+    invalidate_booking(Booking, instance.booking)
+
+
+@receiver(post_save, sender=Booking)
+def copy_travel_date(sender, instance, created, update_fields=None, **kwargs):
+    # Ticket.travel_date is a copy of the booking's.
+    if not created and (update_fields is None or 'travel_date' in update_fields):
+        instance.tickets.exclude(travel_date=instance.travel_date).update(travel_date=instance.travel_date)
+
+
+# ----- Manifest sync -----
+
+@receiver(post_save, sender=Booking)
+def sequence_booking(sender, instance, **kwargs):
+    # Booking.save cleared the number; see api.sequencing.
+    sequencing.stamp_on_commit()
+
+
+@receiver(post_delete, sender=Booking)
+def leave_tombstone(sender, instance, **kwargs):
+    # Archived bookings are in the past, which manifests do not cover.
+    if archive.archiving():
+        return
+    BookingTombstone.objects.create(booking_id=instance.pk, bus_id=instance.bus_id)
+    sequencing.stamp_on_commit()
+
+
+# ----- Event log -----
+
+@receiver(pre_delete, sender=Booking)
+def record_deletion(sender, instance, **kwargs):
+    # Before the delete, while the seats can still be read; the event is
+    # written inside the delete's transaction. Archiving moves a booking
+    # rather than deleting it.
+    if archive.archiving():
+        return
+    BookingEvent.for_booking(instance, BookingEvent.DELETED, instance.status).save()
+    sequencing.stamp_on_commit()
+
+
+# ----- Search index -----
+# Documents hold the receipt, customer, plate and passengers of a booking
+# (see api.search); status changes and position updates leave them as is.
+# Tickets have no receivers: whoever writes them reindexes their bookings
+# once, and ticket deletes stay fast (no per-row signals).
+
+@receiver(post_save, sender=Booking)
+def index_booking(sender, instance, created, update_fields=None, **kwargs):
+    if created or not update_fields or {'receipt_id', 'user', 'bus'} & set(update_fields):
+        search.index_bookings([instance.pk])
+
+
+@receiver(post_delete, sender=Booking)
+def unindex_booking(sender, instance, **kwargs):
+    if not archive.archiving():
+        search.remove([instance.pk])
+
+
+@receiver(pre_save, sender=CustomUser)
+@receiver(pre_save, sender=Bus)
+def note_searched_fields(sender, instance, update_fields=None, **kwargs):
+    # Whether a field that appears in booking documents is about to change.
+    fields = {'username', 'email'} if sender is CustomUser else {'plate_number'}
+    if update_fields:
+        fields &= set(update_fields)
+    instance._search_fields_changed = bool(fields) and not instance._state.adding and (
+        sender.objects.filter(pk=instance.pk)
+        .exclude(**{field: getattr(instance, field) for field in fields})
+        .exists()
+    )
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=Bus)
+def reindex_searched_fields(sender, instance, **kwargs):
+    if getattr(instance, '_search_fields_changed', False):
+        lookup = 'user' if sender is CustomUser else 'bus'
+        search.index_bookings(Booking.objects.filter(**{lookup: instance}).values_list('id', flat=True))
+
+
+# ----- Schedules -----
+
+@receiver(pre_delete, sender=Schedule)
+def reject_schedule_requests(sender, instance, **kwargs):
+    # Its trips are deleted with it.
+    schedules.reject_requests(instance.trips.values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Schedule)
+def invalidate_schedule(sender, instance, **kwargs):
+    schedules.invalidate()
+    bump(f'route:{instance.bus.route_id}')
+
+
+@receiver([post_save, post_delete], sender=ScheduleException)
+def invalidate_schedule_exception(sender, instance, **kwargs):
+    invalidate_schedule(Schedule, instance.schedule)
@@ -0,0 +1,162 @@
+"""
+Delta sync of conductor manifests.
+
+A cursor is the commit sequence number (see api.sequencing) up to which a
+client has seen the changes. Each sync returns the bookings changed after
+it, in commit order, so the cost of a sync depends on how much changed
+rather than on the booking history, and a change that commits late is
+never skipped. Cancelled bookings and deleted rows are returned as ids
+only (tombstones).
+"""
+import base64
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import events, sequencing
+from .caching import bump
+from .fast_serializers import serialize_bookings
+from .models import Booking, BookingEvent, BookingTombstone, Bus, Ticket
+from .routers import use_primary
+
+
+SYNC_PAGE_SIZE = 500
+MAX_BATCH_UPDATES = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sequence):
+    return base64.urlsafe_b64encode(str(sequence).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        sequence = int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor(cursor) from exc
+    if sequence < 0:
+        raise InvalidCursor(cursor)
+    return sequence
+
+
+def changes_since(bus_ids, cursor=None, limit=SYNC_PAGE_SIZE, today=None):
+    """
+    Manifest changes for `bus_ids` after `cursor` (None for a first sync).
+    Only bookings travelling today or later are part of a manifest.
+    """
+    today = today or timezone.localdate()
+    since = None if cursor is None else decode_cursor(cursor)
+    # Read before the rows, so whatever is numbered later is above it; the
+    # rows are read from the primary as well.
+    latest = sequencing.stamp()
+    with use_primary():
+        bookings = Booking.objects.filter(bus_id__in=bus_ids, travel_date__gte=today, sequence__isnull=False)
+        tombstones = BookingTombstone.objects.filter(bus_id__in=bus_ids, sequence__isnull=False)
+
+        if since is None:
+            # First sync: nothing to remove yet, and no need for cancelled rows.
+            bookings = bookings.exclude(status='cancelled')
+            tombstones = tombstones.none()
+        else:
+            bookings = bookings.filter(sequence__gt=since)
+            tombstones = tombstones.filter(sequence__gt=since)
+
+        page = list(bookings.order_by('sequence').values_list('id', 'sequence', 'status')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        if has_more:
+            last = page[-1][1]
+            tombstones = tombstones.filter(sequence__lte=last)
+        removed_rows = list(tombstones.values_list('booking_id', 'sequence'))
+        if not has_more:
+            # Everything numbered so far has been sent.
+            last = max([latest, since or 0, *(row[1] for row in page), *(row[1] for row in removed_rows)])
+
+        removed = [booking_id for booking_id, _, status in page if status == 'cancelled']
+        removed += [booking_id for booking_id, _ in removed_rows]
+        changed_ids = [booking_id for booking_id, _, status in page if status != 'cancelled']
+        changed = serialize_bookings(
+            Booking.objects.filter(id__in=changed_ids).order_by('sequence')
+        ) if changed_ids else []
+
+    return {
+        'changed': changed,
+        'removed': removed,
+        'cursor': encode_cursor(last),
+        'has_more': has_more,
+    }
+
+
+def apply_status_updates(bus_ids, updates, allowed_statuses):
+    """
+    Apply many `{"id", "status", "version"}` updates in one transaction.
+    An update whose `version` no longer matches the booking is a conflict
+    and is skipped, the others are applied. Returns one result per update.
+    The changed bookings are written with one bulk update, so the cost does
+    not grow a query per booking.
+    """
+    ids = [update.get('id') for update in updates]
+    results = []
+    changed = []
+    changes = []
+    with transaction.atomic():
+        bookings = (
+            Booking.objects
+            .select_for_update()
+            .filter(bus_id__in=bus_ids)
+            .in_bulk([booking_id for booking_id in ids if isinstance(booking_id, int)])
+        )
+        seat_ids = defaultdict(list)
+        for booking_id, seat_id in (
+            Ticket.objects.filter(booking_id__in=list(bookings)).order_by('id').values_list('booking_id', 'seat_id')
+        ):
+            seat_ids[booking_id].append(seat_id)
+        now = timezone.now()
+        for update in updates:
+            booking = bookings.get(update.get('id'))
+            if booking is None:
+                results.append({'id': update.get('id'), 'result': 'not_found'})
+                continue
+            status_value = update.get('status')
+            if status_value not in allowed_statuses:
+                results.append({'id': booking.id, 'result': 'invalid_status'})
+                continue
+            expected = update.get('version')
+            if expected is not None and expected != booking.version:
+                results.append({
+                    'id': booking.id,
+                    'result': 'conflict',
+                    'status': booking.status,
+                    'version': booking.version,
+                })
+                continue
+            if booking.status != status_value:
+                previous_status = booking.status
+                booking.status = status_value
+                booking.version += 1
+                booking.updated_at = now
+                booking.sequence = None
+                changed.append(booking)
+                changes.append(BookingEvent.for_booking(
+                    booking, BookingEvent.STATUS_CHANGED, previous_status, seat_ids=seat_ids[booking.id],
+                ))
+            results.append({'id': booking.id, 'result': 'applied', 'version': booking.version})
+        Booking.objects.bulk_update(
+            changed, ['status', 'version', 'updated_at', 'sequence'], batch_size=MAX_BATCH_UPDATES,
+        )
+        # Also numbers the bookings (see api.sequencing).
+        events.record(changes)
+        if changed:
+            # bulk_update sends no signals.
+            tags = {f'bus:{booking.bus_id}' for booking in changed}
+            tags |= {
+                f'route:{route_id}'
+                for route_id in Bus.objects.filter(id__in={booking.bus_id for booking in changed})
+                .values_list('route_id', flat=True)
+            }
+            transaction.on_commit(lambda: bump(*tags))
+    return results
@@ -1,3 +1,1645 @@
-from django.test import TestCase
+"""
+Tests of the API, one TestCase per feature; most build on the booked bus
+of BookedBusTestCase.
 
-# Create your tests here.
+QueryBudgetTests hold the query-count budgets. Every named URL of api.urls
+has an entry in QUERY_BUDGETS: the most queries one request to it may
+issue. Each endpoint is requested against a small data set and again
+after the data has grown; it must stay within its budget and issue the
+same number of queries both times, so a query per row (N+1) fails with
+the SQL of both runs diffed. A URL added without a budget fails
+`test_every_url_has_a_budget`. Response caching is disabled there
+(store_timeout 0) so the views do their full work on every request.
+"""
+import difflib
+import gzip
+import time as time_module
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DataError, OperationalError, connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from buses.startup import check_shared_cache
+
+from . import admission, analytics, archive, eta, events, search, sequencing, tracks, urls
+from .admission import wait_for_result
+from .caching import get_stats, get_versions
+from .fast_serializers import serialize_bookings, serialize_buses, serialize_trips
+from .idempotency import IN_FLIGHT_TIMEOUT, claim, key_digest
+from .middleware import ReplicaPinningMiddleware, brotli
+from .models import (
+    AnalyticsRun, ArchivedBooking, Booking, BookingEvent, BookingRequest, BookingTombstone, Bus, CustomUser, DailyLoad,
+    IdempotencyKey, LocationPoint, Route, Schedule, ScheduleException, Seat, Station, Ticket, Trip,
+)
+from .routers import CACHE_APP_LABEL, PrimaryReplicaRouter, is_pinned, unpin
+from .schedules import ensure_expanded, expand, trips_for, with_times
+from .seatmap import assign, generate_layout
+from .segments import span_mask
+from .serializers import ArchivedBookingSerializer, BookingSerializer, BusSerializer, TripSerializer
+from .sync import InvalidCursor, changes_since
+from .throttling import InMemoryBucketStore, TokenBucketThrottle, get_semaphore
+from .tracks import record
+
+
+QUERY_BUDGETS = {
+    'register': 4,
+    'login': 1,
+    'route-list': 2,
+    'station-list-by-route': 1,
+    'bus-list-by-route': 4,
+    'seat-list-by-bus': 1,
+    'trip-seat-availability': 5,
+    'booking-create': 23,
+    'booking-request-status': 1,
+    'user-bookings': 3,
+    'booking-receipt': 3,
+    'admin-stats': 10,
+    'admin-cache-stats': 0,
+    'admin-analytics': 1,
+    'admin-booking-events': 2,
+    'admin-booking-search': 3,
+    'conductor-buses': 1,
+    'conductor-bookings': 2,
+    'conductor-summary': 6,
+    'conductor-manifest': 2,
+    'conductor-sync': 5,
+    'conductor-batch-booking-status': 8,
+    'update-bus-location': 3,
+    'bus-track': 2,
+    'bus-eta': 1,
+    'update-booking-status': 7,
+}
+
+NO_RESPONSE_CACHE = {
+    name: {**policy, 'store_timeout': 0} for name, policy in settings.HTTP_CACHE_POLICIES.items()
+}
+
+
+@override_settings(
+    RATE_LIMITS={},
+    HTTP_CACHE_POLICIES=NO_RESPONSE_CACHE,
+    BOOKING_ADMISSION_QUEUE=False,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class QueryBudgetTests(TestCase):
+    # Rows added per table before the first run and between the two runs.
+    SMALL, LARGE = 2, 6
+
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        self.travel_date = self.today + timedelta(days=1)
+        self.passenger = CustomUser.objects.create_user(username='passenger', password='secret')
+        self.conductor = CustomUser.objects.create_user(username='conductor', password='secret', role='conductor')
+        self.admin = CustomUser.objects.create_user(
+            username='admin', password='secret', role='admin', is_staff=True,
+        )
+        self.route = Route.objects.create(
+            name='Main', start_location='A', end_location='B', distance=100, estimated_duration=120,
+        )
+        for order in range(3):
+            Station.objects.create(
+                route=self.route, name=f'Stop {order}', latitude=order, longitude=order, order=order,
+            )
+        self.bus = self.add_bus('MAIN-1', capacity=8)
+        self.bus.latitude, self.bus.longitude = 0.5, 0.5
+        self.bus.save(update_fields=['latitude', 'longitude'])
+        self.booking_request = BookingRequest.objects.create(
+            user=self.passenger, bus=self.bus, travel_date=self.travel_date, seat_count=1,
+        )
+        AnalyticsRun.objects.create(load_factors={}, forecasts={})
+        self.grown = 0
+        self.runs = 0
+
+    # ----- Data -----
+
+    def add_bus(self, plate_number, capacity, route=None):
+        bus = Bus.objects.create(
+            plate_number=plate_number, route=route or self.route, conductor=self.conductor, capacity=capacity,
+            price_per_seat=Decimal('10.00'),
+        )
+        Schedule.objects.create(bus=bus, departure_time=time(8), arrival_time=time(10))
+        generate_layout(bus)
+        return bus
+
+    def add_booking(self, bus, seats, user=None, status='confirmed'):
+        booking = Booking.objects.create(
+            user=user or self.passenger, bus=bus, travel_date=self.travel_date,
+            total_price=Decimal('10.00') * len(seats), receipt_id=f'RCP-TEST-{Booking.objects.count():04}',
+            status=status,
+        )
+        Ticket.objects.bulk_create([
+            Ticket(booking=booking, seat=seat, travel_date=self.travel_date,
+                   passenger_name=f'Passenger {seat.pk}', price=Decimal('10.00'))
+            for seat in seats
+        ])
+        return booking
+
+    def grow(self, count):
+        """
+        Add `count` of everything the endpoints list or aggregate.
+        """
+        for _ in range(count):
+            self.grown += 1
+            n = self.grown
+            route = Route.objects.create(
+                name=f'Route {n}', start_location='C', end_location='D', distance=10, estimated_duration=20,
+            )
+            Station.objects.create(route=route, name=f'Stop {n}', latitude=n, longitude=n, order=0)
+            bus = self.add_bus(f'BUS-{n}', capacity=4)
+            self.add_booking(bus, list(bus.seats.order_by('id')[:2]))
+            # Extra seats on the main bus, booked in pairs.
+            seats = [Seat.objects.create(bus=self.bus, seat_number=f'X{n}{side}') for side in 'AB']
+            self.add_booking(self.bus, seats)
+            ArchivedBooking.objects.create(
+                id=10 ** 6 + n, user=self.passenger, bus=self.bus, travel_date=self.today - timedelta(days=365),
+                seats=[seat.pk for seat in seats], total_price=Decimal('20.00'), receipt_id=f'RCP-OLD-{n}',
+                status='completed', booking_date=timezone.now(), updated_at=timezone.now(),
+            )
+            BookingRequest.objects.create(
+                user=self.passenger, bus=self.bus, travel_date=self.travel_date, seat_ids=[seats[0].pk],
+            )
+            record(self.bus, timezone.now() - timedelta(minutes=n))
+        # Bookings the status endpoints change during the next run, on seats
+        # of their own (pending bookings hold their seats).
+        seats = [Seat.objects.create(bus=self.bus, seat_number=f'P{self.grown}-{i}') for i in range(count + 1)]
+        self.pending = [self.add_booking(self.bus, [seat], status='pending') for seat in seats]
+
+    # ----- Requests -----
+
+    def requests(self):
+        """
+        {url name: (user, method, path, data)}, fresh for each run.
+        """
+        self.runs += 1
+        trip = trips_for(self.travel_date, bus_id=self.bus.id).get()
+        receipt_id = self.bus.bookings.filter(status='confirmed').latest('id').receipt_id
+        return {
+            'register': (
+                None, 'post', reverse('register'),
+                {'username': f'new{self.runs}', 'password': 'Xq9!long-pass', 'role': 'passenger'},
+            ),
+            'login': (None, 'post', reverse('login'), {'username': 'passenger', 'password': 'secret'}),
+            'route-list': (None, 'get', reverse('route-list'), None),
+            'station-list-by-route': (None, 'get', reverse('station-list-by-route', args=[self.route.id]), None),
+            'bus-list-by-route': (
+                None, 'get', reverse('bus-list-by-route', args=[self.route.id]), {'date': self.travel_date},
+            ),
+            'seat-list-by-bus': (None, 'get', reverse('seat-list-by-bus', args=[self.bus.id]), None),
+            'trip-seat-availability': (
+                None, 'get', reverse('trip-seat-availability', args=[trip.id]), {'count': 2},
+            ),
+            'booking-create': (
+                self.passenger, 'post', reverse('booking-create'),
+                {'bus': self.bus.id, 'travel_date': self.travel_date, 'seat_count': 1, 'total_price': '0'},
+            ),
+            'booking-request-status': (
+                self.passenger, 'get', reverse('booking-request-status', args=[self.booking_request.id]), None,
+            ),
+            'user-bookings': (self.passenger, 'get', reverse('user-bookings'), {'archived': 'true'}),
+            'booking-receipt': (self.passenger, 'get', reverse('booking-receipt', args=[receipt_id]), None),
+            'admin-stats': (self.admin, 'get', reverse('admin-stats'), None),
+            'admin-cache-stats': (self.admin, 'get', reverse('admin-cache-stats'), None),
+            'admin-analytics': (self.admin, 'get', reverse('admin-analytics'), None),
+            'admin-booking-events': (self.admin, 'get', reverse('admin-booking-events'), None),
+            'admin-booking-search': (self.admin, 'get', reverse('admin-booking-search'), {'q': 'RCP passenger'}),
+            'conductor-buses': (self.conductor, 'get', reverse('conductor-buses'), None),
+            'conductor-bookings': (self.conductor, 'get', reverse('conductor-bookings'), None),
+            'conductor-summary': (self.conductor, 'get', reverse('conductor-summary'), {'days': 2}),
+            'conductor-manifest': (
+                self.conductor, 'get', reverse('conductor-manifest'), {'bus': self.bus.id, 'date': self.travel_date},
+            ),
+            'conductor-sync': (self.conductor, 'get', reverse('conductor-sync'), None),
+            'conductor-batch-booking-status': (
+                self.conductor, 'post', reverse('conductor-batch-booking-status'),
+                {'updates': [{'id': booking.id, 'status': 'confirmed'} for booking in self.pending[1:]]},
+            ),
+            'update-bus-location': (
+                self.conductor, 'post', reverse('update-bus-location', args=[self.bus.id]),
+                {'latitude': 0.6, 'longitude': 0.6},
+            ),
+            'bus-track': (None, 'get', reverse('bus-track', args=[self.bus.id]), None),
+            'bus-eta': (None, 'get', reverse('bus-eta', args=[self.bus.id]), None),
+            'update-booking-status': (
+                self.conductor, 'patch', reverse('update-booking-status', args=[self.pending[0].id]),
+                {'status': 'confirmed'},
+            ),
+        }
+
+    def run_requests(self):
+        """
+        {url name: (status code, [SQL])} for one request to every endpoint.
+        """
+        cache.clear()
+        # What refresh_etas would have stored for the buses grow() added.
+        eta.refresh(timezone.now())
+        ensure_expanded(self.today)
+        ensure_expanded(self.travel_date)
+        # The rows added by grow() were committed, as far as readers go.
+        sequencing.stamp()
+        results = {}
+        for name, (user, method, path, data) in self.requests().items():
+            client = APIClient()
+            if user is not None:
+                client.force_authenticate(user)
+            call = getattr(client, method)
+            # On-commit work (cache bumps, sequencing) runs after the
+            # response, as it would once the request's transaction commits.
+            with self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as queries:
+                    if method == 'get':
+                        response = call(path, data)
+                    else:
+                        response = call(path, data, format='json')
+            results[name] = (response.status_code, [query['sql'] for query in queries.captured_queries])
+        return results
+
+    # ----- Tests -----
+
+    def test_every_url_has_a_budget(self):
+        self.grow(1)
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(
+            names - set(QUERY_BUDGETS), set(),
+            "Add a QUERY_BUDGETS entry (and a request in QueryBudgetTests.requests) for these URLs.",
+        )
+        self.assertEqual(set(QUERY_BUDGETS) - names, set(), "QUERY_BUDGETS lists URLs that no longer exist.")
+        self.assertEqual(set(self.requests()), set(QUERY_BUDGETS))
+
+    def test_query_counts_do_not_grow_with_data(self):
+        self.grow(self.SMALL)
+        small = self.run_requests()
+        self.grow(self.LARGE - self.SMALL)
+        large = self.run_requests()
+
+        for name, budget in QUERY_BUDGETS.items():
+            with self.subTest(url=name):
+                (small_status, small_sql), (large_status, large_sql) = small[name], large[name]
+                self.assertLess(small_status, 400, f"{name} failed with {small_status}")
+                self.assertEqual(small_status, large_status)
+                self.assertEqual(
+                    len(small_sql), len(large_sql),
+                    f"{name} issued {len(small_sql)} queries with {self.SMALL} rows and {len(large_sql)} "
+                    f"with {self.LARGE}:\n" + '\n'.join(difflib.unified_diff(
+                        small_sql, large_sql, f'{self.SMALL} rows', f'{self.LARGE} rows', lineterm='',
+                    )),
+                )
+                self.assertLessEqual(
+                    len(large_sql), budget,
+                    f"{name} issued {len(large_sql)} queries, over its budget of {budget}:\n"
+                    + '\n'.join(f"{i}. {sql}" for i, sql in enumerate(large_sql, 1)),
+                )
+
+
+class SharedCacheTests(TestCase):
+    LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    DATABASE = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'api_cache'}}
+
+    def test_per_process_cache_is_refused_when_a_shared_one_is_required(self):
+        with override_settings(REQUIRE_SHARED_CACHE=True, CACHES=self.LOCMEM):
+            with self.assertRaises(ImproperlyConfigured):
+                check_shared_cache()
+        with override_settings(REQUIRE_SHARED_CACHE=True, CACHES=self.DATABASE):
+            check_shared_cache()
+        with override_settings(REQUIRE_SHARED_CACHE=False, CACHES=self.LOCMEM):
+            check_shared_cache()
+
+
+class BookedBusTestCase(TestCase):
+    """
+    One bus with one confirmed single-seat booking for tomorrow.
+    """
+
+    def setUp(self):
+        self.travel_date = timezone.localdate() + timedelta(days=1)
+        self.user = CustomUser.objects.create_user(username='passenger', password='secret')
+        route = Route.objects.create(
+            name='Main', start_location='A', end_location='B', distance=100, estimated_duration=120,
+        )
+        self.bus = Bus.objects.create(
+            plate_number='MAIN-1', route=route, capacity=4, price_per_seat=Decimal('10.00'),
+        )
+        self.schedule = Schedule.objects.create(bus=self.bus, departure_time=time(8), arrival_time=time(10))
+        generate_layout(self.bus)
+        self.trip = trips_for(self.travel_date, bus_id=self.bus.id).get()
+        self.booking = Booking.objects.create(
+            user=self.user, bus=self.bus, trip=self.trip, travel_date=self.travel_date,
+            total_price=Decimal('10.00'), receipt_id='RCP-TEST-0001', status='confirmed',
+        )
+        seat = self.bus.seats.order_by('id').first()
+        Ticket.objects.create(booking=self.booking, seat=seat, travel_date=self.travel_date, price=Decimal('10.00'))
+
+
+class DeletionTests(BookedBusTestCase):
+    def test_deleting_a_booked_bus_deletes_its_bookings(self):
+        self.bus.delete()
+        self.assertFalse(Booking.objects.filter(pk=self.booking.pk).exists())
+        self.assertFalse(Ticket.objects.exists())
+
+    def test_deleting_a_schedule_keeps_its_bookings(self):
+        self.trip.schedule.delete()
+        self.booking.refresh_from_db()
+        self.assertIsNone(self.booking.trip_id)
+        self.assertEqual(self.booking.tickets.count(), 1)
+
+
+class SequencingTests(BookedBusTestCase):
+    def test_event_committed_after_a_later_one_is_not_skipped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.set_status('cancelled')
+        seen = events.stream()
+        # A transaction that took a lower id commits only now.
+        late = BookingEvent.for_booking(self.booking, BookingEvent.STATUS_CHANGED, 'confirmed', seat_ids=[])
+        late.id = seen[0].id - 1
+        late.save()
+        self.assertEqual(events.stream(seen[-1].sequence), [], "Unnumbered events are not served")
+        sequencing.stamp()
+        self.assertEqual(events.stream(seen[-1].sequence), [late])
+
+    def test_consume_advances_the_cursor(self):
+        sequencing.stamp()
+        handled = []
+        self.assertEqual(events.consume('test', handled.extend), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.set_status('cancelled')
+        self.assertEqual(events.consume('test', handled.extend), 1)
+        self.assertEqual(events.consume('test', handled.extend), 0)
+        self.assertEqual([event.status for event in handled], ['cancelled'])
+
+    def test_sync_returns_changes_after_the_cursor(self):
+        first = changes_since([self.bus.id])
+        self.assertEqual([row['id'] for row in first['changed']], [self.booking.id])
+        self.assertEqual(changes_since([self.bus.id], first['cursor'])['changed'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.set_status('cancelled')
+        cancelled = changes_since([self.bus.id], first['cursor'])
+        self.assertEqual(cancelled['removed'], [self.booking.id])
+
+        booking_id = self.booking.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.delete()
+        deleted = changes_since([self.bus.id], cancelled['cursor'])
+        self.assertEqual((deleted['changed'], deleted['removed']), ([], [booking_id]))
+
+    def test_sync_pages_in_commit_order(self):
+        for n in range(2):
+            Booking.objects.create(
+                user=self.user, bus=self.bus, trip=self.trip, travel_date=self.travel_date,
+                total_price=Decimal('10.00'), receipt_id=f'RCP-TEST-100{n}', status='confirmed',
+            )
+        sequencing.stamp()
+        # The oldest booking changes last.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.set_status('completed')
+        ids, cursor = [], None
+        while True:
+            page = changes_since([self.bus.id], cursor, limit=1)
+            ids += [row['id'] for row in page['changed']]
+            cursor = page['cursor']
+            if not page['has_more']:
+                break
+        self.assertEqual(ids[-1], self.booking.id)
+        self.assertEqual(len(ids), 3)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            changes_since([self.bus.id], 'not a cursor')
+
+
+class AssignTests(SimpleTestCase):
+    # Two rows of a 2+2 bus: seats 1-4 in row 1, 5-8 in row 2, the aisle
+    # between columns 2 and 4.
+    LAYOUT = [
+        (row * 4 + i + 1, 1, row + 1, column)
+        for row in range(2) for i, column in enumerate([1, 2, 4, 5])
+    ]
+    TAKEN = span_mask(0, 2)
+
+    def assign(self, taken=(), count=2, start=0, end=2, masks=None):
+        masks = masks if masks is not None else {seat_id: self.TAKEN for seat_id in taken}
+        return assign(self.LAYOUT, masks, start, end, count, 2)
+
+    def test_group_sits_together_on_one_side_of_the_aisle(self):
+        self.assertEqual(self.assign(), [1, 2])
+        self.assertEqual(self.assign(taken=[1]), [3, 4])
+
+    def test_group_stays_in_one_row(self):
+        self.assertEqual(self.assign(taken=[1], count=4), [5, 6, 7, 8])
+        self.assertEqual(self.assign(count=3), [1, 2, 3])
+
+    def test_group_is_split_when_no_run_is_free(self):
+        seat_ids = self.assign(taken=[2, 4, 6, 8], count=3)
+        self.assertEqual(len(seat_ids), 3)
+        self.assertLessEqual(set(seat_ids), {1, 3, 5, 7})
+
+    def test_not_enough_free_seats(self):
+        self.assertIsNone(self.assign(taken=range(1, 8)))
+        self.assertIsNone(self.assign(count=0))
+
+    def test_seat_taken_on_another_segment_is_free(self):
+        masks = {seat_id: span_mask(0, 1) for seat_id in range(1, 8)}
+        self.assertEqual(self.assign(masks=masks, count=1, start=0, end=1), [8])
+        # Best fit: the rest of a half-booked seat rather than a free one.
+        self.assertEqual(self.assign(masks=masks, count=1, start=1, end=2), [1])
+        self.assertEqual(self.assign(masks=masks, start=1, end=2), [1, 2])
+
+
+class SeatLayoutTests(TestCase):
+    def setUp(self):
+        route = Route.objects.create(
+            name='Main', start_location='A', end_location='B', distance=100, estimated_duration=120,
+        )
+        self.bus = Bus.objects.create(
+            plate_number='MAIN-1', route=route, capacity=6, price_per_seat=Decimal('10.00'), seat_layout='2+1',
+        )
+
+    def places(self):
+        return [
+            (seat.seat_number, seat.deck, seat.row, seat.column, seat.position)
+            for seat in self.bus.seats.order_by('deck', 'row', 'column')
+        ]
+
+    def test_existing_seats_keep_their_numbers_and_come_first(self):
+        for number in ('10', '2'):
+            Seat.objects.create(bus=self.bus, seat_number=number)
+        self.assertEqual(generate_layout(self.bus), 4)
+        self.assertEqual(self.places(), [
+            ('2', 1, 1, 1, 'window'), ('10', 1, 1, 2, 'aisle'), ('1', 1, 1, 4, 'window'),
+            ('3', 1, 2, 1, 'window'), ('4', 1, 2, 2, 'aisle'), ('5', 1, 2, 4, 'window'),
+        ])
+        self.assertEqual(generate_layout(self.bus), 0)
+
+    def test_seats_are_split_over_the_decks(self):
+        self.bus.capacity, self.bus.seat_layout, self.bus.decks = 6, '2+2', 2
+        generate_layout(self.bus)
+        self.assertEqual([place[1:3] for place in self.places()], [(1, 1)] * 3 + [(2, 1)] * 3)
+
+
+class SeatReservationTests(BookedBusTestCase):
+    def serializer(self, **data):
+        serializer = BookingSerializer(
+            data={'bus': self.bus.id, 'travel_date': self.travel_date, 'total_price': '0', **data},
+            context={'request': SimpleNamespace(user=self.user, method='POST')},
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer
+
+    def take(self, seat):
+        booking = Booking.objects.create(
+            user=self.user, bus=self.bus, trip=self.trip, travel_date=self.travel_date,
+            total_price=Decimal('10.00'), receipt_id=f'RCP-TAKE-{seat.pk}', status='confirmed',
+        )
+        Ticket.objects.create(booking=booking, seat=seat, travel_date=self.travel_date, price=Decimal('10.00'))
+
+    def free_seats(self):
+        return list(self.bus.seats.filter(tickets__isnull=True).order_by('id'))
+
+    def test_seat_count_is_assigned_from_the_occupancy_at_save(self):
+        serializer = self.serializer(seat_count=2)
+        first, *others = self.free_seats()
+        # Booked by someone else after validation.
+        self.take(first)
+        booking = serializer.save()
+        self.assertEqual(sorted(seat.pk for seat in booking.seats.all()), [seat.pk for seat in others[:2]])
+
+    def test_seats_taken_after_validation_are_refused(self):
+        seat = self.free_seats()[0]
+        serializer = self.serializer(seats=[seat.id])
+        self.take(seat)
+        with self.assertRaises(ValidationError):
+            serializer.save()
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_seat_count_larger_than_what_is_left(self):
+        serializer = self.serializer(seat_count=3)
+        self.take(self.free_seats()[0])
+        with self.assertRaises(ValidationError):
+            serializer.save()
+
+    @override_settings(RATE_LIMITS={}, BOOKING_ADMISSION_QUEUE=False)
+    def test_a_seat_requested_twice_is_refused(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        seat = self.free_seats()[0]
+        response = client.post(reverse('booking-create'), {
+            'bus': self.bus.id, 'travel_date': self.travel_date, 'seats': [seat.id, seat.id], 'total_price': '20.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    @override_settings(RATE_LIMITS={}, BOOKING_ADMISSION_QUEUE=False)
+    def test_seats_stay_held_until_the_booking_is_cancelled(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        seat = self.booking.seats.get()
+        data = {'bus': self.bus.id, 'travel_date': self.travel_date, 'seats': [seat.id], 'total_price': '10.00'}
+        for status in ('completed', 'pending'):
+            self.booking.set_status(status)
+            response = client.post(reverse('booking-create'), data, format='json')
+            self.assertEqual(response.status_code, 400, status)
+        self.booking.set_status('cancelled')
+        self.assertEqual(client.post(reverse('booking-create'), data, format='json').status_code, 201)
+
+
+@override_settings(RATE_LIMITS={}, BOOKING_ADMISSION_QUEUE=False, IDEMPOTENCY_WAIT=0)
+class IdempotencyTests(BookedBusTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('booking-create')
+        self.data = {'bus': self.bus.id, 'travel_date': self.travel_date, 'seat_count': 1, 'total_price': '0'}
+
+    def post(self, key='key-1', **data):
+        return self.client.post(self.url, {**self.data, **data}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def slots_in_use(self):
+        """
+        Take every booking concurrency slot of this process; release with the result.
+        """
+        semaphore = get_semaphore('booking')
+        taken = 0
+        while semaphore.acquire(blocking=False):
+            taken += 1
+        return lambda: [semaphore.release() for _ in range(taken)]
+
+    def test_claim(self):
+        now = timezone.now()
+        record, claimed = claim('digest', 'request', now)
+        self.assertTrue(claimed)
+        again, claimed = claim('digest', 'request', now)
+        self.assertEqual((again.pk, claimed), (record.pk, False))
+
+    def test_retry_gets_the_first_response(self):
+        first = self.post()
+        IdempotencyKey.objects.update(response_headers={'Location': '/bookings/1'})
+        retry = self.post()
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry.data), (201, first.data))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry['Location'], '/bookings/1')
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_key_reused_for_another_request(self):
+        self.post()
+        self.assertEqual(self.post(seat_count=2).status_code, 422)
+
+    def test_duplicates_are_answered_without_a_concurrency_slot(self):
+        self.post()
+        release = self.slots_in_use()
+        try:
+            self.assertEqual(self.post().status_code, 201)
+            IdempotencyKey.objects.update(response_status=None, locked_at=timezone.now())
+            running = self.post()
+            self.assertEqual((running.status_code, running['Retry-After']), (409, '1'))
+            # A new request does need a slot; the key is not kept.
+            self.assertEqual(self.post(key='key-2').status_code, 503)
+        finally:
+            release()
+        self.assertFalse(IdempotencyKey.objects.filter(key=key_digest(self.user.pk, 'key-2')).exists())
+
+    @override_settings(IDEMPOTENCY_WAIT=5)
+    def test_duplicates_beyond_the_wait_limit_are_answered_at_once(self):
+        self.post()
+        IdempotencyKey.objects.update(response_status=None, locked_at=timezone.now())
+        semaphore = get_semaphore('idempotency_wait')
+        taken = 0
+        while semaphore.acquire(blocking=False):
+            taken += 1
+        try:
+            with mock.patch('api.idempotency.wait') as wait:
+                response = self.post()
+        finally:
+            for _ in range(taken):
+                semaphore.release()
+        wait.assert_not_called()
+        self.assertEqual((response.status_code, response['Retry-After']), (409, '1'))
+
+    def test_server_error_releases_the_key(self):
+        with mock.patch.object(BookingSerializer, 'create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.post()
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post().status_code, 201)
+
+    def test_abandoned_claim_is_taken_over(self):
+        self.post()
+        IdempotencyKey.objects.update(
+            response_status=None, locked_at=timezone.now() - IN_FLIGHT_TIMEOUT - timedelta(seconds=1),
+        )
+        retry = self.post()
+        self.assertEqual(retry.status_code, 201)
+        self.assertFalse(retry.has_header('Idempotent-Replayed'))
+        self.assertEqual(Booking.objects.count(), 3)
+
+
+class SearchTests(BookedBusTestCase):
+    def setUp(self):
+        super().setUp()
+        self.booking.tickets.update(passenger_name='Ada Lovelace')
+        search.index_bookings([self.booking.pk])
+
+    def add_booking(self, receipt_id, names):
+        booking = Booking.objects.create(
+            user=self.user, bus=self.bus, trip=self.trip, travel_date=self.travel_date,
+            total_price=Decimal('10.00'), receipt_id=receipt_id, status='confirmed',
+        )
+        Ticket.objects.bulk_create([
+            Ticket(booking=booking, seat=seat, travel_date=self.travel_date, passenger_name=name,
+                   price=Decimal('10.00'))
+            for seat, name in zip(self.bus.seats.filter(tickets__isnull=True).order_by('id'), names)
+        ])
+        search.index_bookings([booking.pk])
+        return booking
+
+    def test_terms_match_substrings_through_the_index(self):
+        other = self.add_booking('RCP-TEST-0002', ['Grace Hopper'])
+        self.assertEqual(search.search('lovel'), [self.booking.pk])
+        self.assertEqual(search.search('MAIN'), [other.pk, self.booking.pk])
+        self.assertEqual(search.search('main hopp'), [other.pk])
+        self.assertEqual(search.search('turing'), [])
+        self.assertEqual(search.search('  '), [])
+
+    def test_short_terms_are_matched_with_like(self):
+        other = self.add_booking('RCP-TEST-0002', ['Grace Hopper'])
+        self.assertEqual(search.search('-1'), [other.pk, self.booking.pk])
+        self.assertEqual(search.search('02 grace'), [other.pk])
+        # LIKE wildcards are literal.
+        self.assertEqual(search.search('%'), [])
+
+    def test_deleting_a_booking_removes_it_and_ticket_deletes_stay_fast(self):
+        booking = self.add_booking('RCP-TEST-0002', ['Grace Hopper', 'Alan Turing', 'Edsger Dijkstra'])
+        with self.assertNumQueries(1):
+            Ticket.objects.filter(booking=self.booking).delete()
+        booking.delete()
+        self.assertEqual(search.search('turing'), [])
+
+    def test_admin_reindexes_a_booking_once_with_its_tickets(self):
+        booking_admin = admin.site._registry[Booking]
+        self.booking.tickets.update(passenger_name='Barbara Liskov')
+        form = SimpleNamespace(instance=self.booking, save_m2m=lambda: None)
+        booking_admin.save_related(None, form, [], True)
+        self.assertEqual(search.search('liskov'), [self.booking.pk])
+        self.assertEqual(search.search('rcp-old'), [])
+
+    def test_admin_search_is_not_truncated(self):
+        others = [self.add_booking(f'RCP-TEST-100{n}', []) for n in range(2)]
+        booking_admin = admin.site._registry[Booking]
+        with mock.patch.object(search, 'SEARCH_LIMIT', 1), mock.patch.object(search, 'MAX_SEARCH_LIMIT', 1):
+            queryset, _ = booking_admin.get_search_results(None, Booking.objects.all(), 'main')
+        self.assertEqual(set(queryset.values_list('id', flat=True)), {self.booking.pk, *(b.pk for b in others)})
+
+
+class TicketTests(BookedBusTestCase):
+    def test_tickets_follow_the_booking_travel_date(self):
+        later = self.travel_date + timedelta(days=3)
+        self.booking.travel_date = later
+        self.booking.save()
+        self.assertEqual(set(self.booking.tickets.values_list('travel_date', flat=True)), {later})
+
+        seat = self.bus.seats.filter(tickets__isnull=True).first()
+        ticket = Ticket.objects.create(booking=self.booking, seat=seat, travel_date=self.travel_date, price=0)
+        self.assertEqual(ticket.travel_date, later)
+
+    def test_status_changes_do_not_touch_the_tickets(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.booking.set_status('cancelled')
+        self.assertFalse(any(query['sql'].startswith('UPDATE "api_ticket"') for query in queries.captured_queries))
+
+    def test_ticket_changes_invalidate_the_bus(self):
+        ticket = self.booking.tickets.get()
+        with mock.patch('api.signals.bump') as bump:
+            ticket.passenger_name = 'Ada Lovelace'
+            ticket.save()
+        bump.assert_called_once_with(f'bus:{self.bus.id}', f'route:{self.bus.route_id}')
+
+
+@override_settings(RATE_LIMITS={})
+class BookingRequestWaitTests(BookedBusTestCase):
+    def setUp(self):
+        super().setUp()
+        self.booking_request = BookingRequest.objects.create(
+            user=self.user, bus=self.bus, travel_date=self.travel_date, seat_count=1,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('booking-request-status', args=[self.booking_request.id])
+
+    def test_polls_back_off(self):
+        clock = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        with mock.patch('api.admission.time.monotonic', lambda: clock[0]), \
+                mock.patch('api.admission.time.sleep', sleep):
+            wait_for_result(self.booking_request, 3)
+        self.assertEqual(sleeps[:6], [0.05, 0.1, 0.2, 0.4, 0.8, 1.0])
+        self.assertAlmostEqual(sum(sleeps), 3)
+
+    def test_decided_request_returns_at_once(self):
+        BookingRequest.objects.filter(pk=self.booking_request.pk).update(status='rejected', error='Full')
+        with mock.patch('api.admission.time.sleep') as sleep:
+            response = self.client.get(self.url, {'wait': 5})
+        self.assertEqual(response.data['status'], 'rejected')
+        self.assertLessEqual(sleep.call_count, 1)
+
+    def test_long_polls_beyond_the_limit_are_answered_at_once(self):
+        semaphore = get_semaphore('booking_wait')
+        taken = 0
+        while semaphore.acquire(blocking=False):
+            taken += 1
+        try:
+            with mock.patch('api.views.wait_for_result') as wait:
+                response = self.client.get(self.url, {'wait': 5})
+        finally:
+            for _ in range(taken):
+                semaphore.release()
+        self.assertEqual((response.status_code, response.data['status']), (200, 'queued'))
+        wait.assert_not_called()
+
+
+class AdmissionWorkerTests(BookedBusTestCase):
+    def setUp(self):
+        super().setUp()
+        self.requests = [
+            BookingRequest.objects.create(
+                user=self.user, bus=self.bus, travel_date=self.travel_date, seat_count=1,
+                passenger_info=[{'name': name, 'type': 'adult'}],
+            )
+            for name in ('Ada Lovelace', 'Too long', 'Grace Hopper')
+        ]
+
+    def statuses(self):
+        return [
+            (request.status, request.error)
+            for request in BookingRequest.objects.filter(pk__in=[r.pk for r in self.requests]).order_by('id')
+        ]
+
+    def test_a_failing_request_is_rejected_and_the_queue_drained(self):
+        real_price_seats = admission.price_seats
+
+        def price_seats(bus, seats, passenger_info):
+            if passenger_info[0]['name'] == 'Too long':
+                raise DataError('value too long for type character varying(100)')
+            return real_price_seats(bus, seats, passenger_info)
+
+        with mock.patch('api.admission.price_seats', price_seats), self.assertLogs('api.admission', 'ERROR'):
+            admission.run_worker(once=True)
+        self.assertEqual(self.statuses(), [
+            ('completed', ''), ('rejected', admission.FAILED_ERROR), ('completed', ''),
+        ])
+        self.assertEqual(Booking.objects.count(), 3)
+
+    def test_operational_errors_reject_nothing(self):
+        with mock.patch('api.admission.process_batch', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('api.admission', 'ERROR'):
+            admission.run_worker(once=True)
+        self.assertEqual(self.statuses(), [('queued', '')] * 3)
+        admission.run_worker(once=True)
+        self.assertEqual([status for status, _ in self.statuses()], ['completed'] * 3)
+
+
+class ETATests(BookedBusTestCase):
+    def setUp(self):
+        super().setUp()
+        for order in range(3):
+            Station.objects.create(
+                route=self.bus.route, name=f'Stop {order}', latitude=order, longitude=order, order=order,
+            )
+        self.now = timezone.now()
+        self.bus.latitude = self.bus.longitude = 0.5
+        self.bus.save(update_fields=['latitude', 'longitude'])
+        record(self.bus, self.now - timedelta(minutes=1))
+        self.url = reverse('bus-eta', args=[self.bus.id])
+
+    def test_stored_predictions_are_served_without_the_cache(self):
+        eta.refresh(self.now)
+        # What another process (refresh_etas) wrote is in the database.
+        cache.clear()
+        with mock.patch('api.eta.refresh') as refresh:
+            response = APIClient().get(self.url)
+        refresh.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s['name'] for s in response.data['data']['stations']], ['Stop 1', 'Stop 2'])
+
+    def test_stale_predictions_are_not_served_or_recomputed(self):
+        eta.refresh(self.now - eta.ETA_TIMEOUT)
+        with mock.patch('api.eta.refresh') as refresh:
+            response = APIClient().get(self.url)
+        refresh.assert_not_called()
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(eta.get_eta(self.bus.id, timezone.now()))
+
+
+class ThrottlingTests(BookedBusTestCase):
+    LIMITS = {'login': {'ip': {'rate': '1/min', 'burst': 1}}}
+    VIEW = SimpleNamespace(throttle_scope='login')
+
+    def allowed(self, forwarded_for, remote_addr='10.0.0.1'):
+        request = SimpleNamespace(
+            META={'REMOTE_ADDR': remote_addr, 'HTTP_X_FORWARDED_FOR': forwarded_for}, user=None,
+        )
+        return TokenBucketThrottle().allow_request(request, self.VIEW)
+
+    @override_settings(RATE_LIMITS=LIMITS)
+    def test_forwarded_for_does_not_pick_the_bucket(self):
+        with mock.patch('api.throttling.get_bucket_store', return_value=InMemoryBucketStore()):
+            self.assertTrue(self.allowed('198.51.100.1'))
+            self.assertFalse(self.allowed('198.51.100.2'))
+            self.assertTrue(self.allowed('198.51.100.2', remote_addr='10.0.0.2'))
+
+    @override_settings(RATE_LIMITS=LIMITS, REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_only_the_proxy_hop_is_trusted(self):
+        with mock.patch('api.throttling.get_bucket_store', return_value=InMemoryBucketStore()):
+            self.assertTrue(self.allowed('198.51.100.1, 203.0.113.5'))
+            self.assertFalse(self.allowed('198.51.100.2, 203.0.113.5'))
+            self.assertFalse(self.allowed('203.0.113.5'))
+            self.assertTrue(self.allowed('203.0.113.5, 203.0.113.6'))
+
+    def test_bucket_refills(self):
+        clock = [1000.0]
+        store = InMemoryBucketStore()
+        with mock.patch('api.throttling.time.monotonic', lambda: clock[0]):
+            consume = lambda: store.consume('key', 2, 1.0)  # noqa: E731
+            self.assertEqual([consume()[0], consume()[0]], [True, True])
+            self.assertEqual(consume(), (False, 1.0))
+            clock[0] += 0.5
+            self.assertEqual(consume(), (False, 0.5))
+            clock[0] += 0.5
+            self.assertEqual(consume(), (True, 0))
+            # Idle time refills up to the burst, no further.
+            clock[0] += 60
+            self.assertEqual([consume()[0] for _ in range(3)], [True, True, False])
+
+    @override_settings(RATE_LIMITS={}, BOOKING_ADMISSION_QUEUE=False)
+    def test_requests_beyond_the_concurrency_limit_are_shed(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        data = {'bus': self.bus.id, 'travel_date': self.travel_date, 'seat_count': 1, 'total_price': '0'}
+        semaphore = get_semaphore('booking')
+        taken = 0
+        while semaphore.acquire(blocking=False):
+            taken += 1
+        try:
+            response = client.post(reverse('booking-create'), data, format='json')
+        finally:
+            for _ in range(taken):
+                semaphore.release()
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+        self.assertEqual(Booking.objects.count(), 1)
+        # The shed request took no slot, so the next one runs.
+        self.assertEqual(client.post(reverse('booking-create'), data, format='json').status_code, 201)
+
+
+class ScheduleTests(BookedBusTestCase):
+    def add_schedule(self, hour, **kwargs):
+        return Schedule.objects.create(bus=self.bus, departure_time=time(hour), arrival_time=time(hour + 2), **kwargs)
+
+    def departures(self, travel_date):
+        return list(trips_for(travel_date, bus_id=self.bus.id).values_list('schedule_id', flat=True))
+
+    def test_runs_on_its_weekdays_within_its_dates(self):
+        start = self.travel_date
+        weekly = self.add_schedule(18, days_of_week=1 << start.weekday(), valid_until=start + timedelta(days=7))
+        expand(start, start + timedelta(days=20))
+        self.assertEqual(
+            list(Trip.objects.filter(schedule=weekly).order_by('travel_date').values_list('travel_date', flat=True)),
+            [start, start + timedelta(days=7)],
+        )
+
+    def test_exceptions_cancel_and_add_departures(self):
+        day_after = self.travel_date + timedelta(days=1)
+        weekly = self.add_schedule(18, days_of_week=1 << self.travel_date.weekday())
+        self.assertEqual(self.departures(self.travel_date), [self.schedule.id, weekly.id])
+        ScheduleException.objects.create(schedule=weekly, date=self.travel_date, runs=False)
+        ScheduleException.objects.create(schedule=weekly, date=day_after, runs=True)
+        self.assertEqual(self.departures(self.travel_date), [self.schedule.id])
+        self.assertEqual(self.departures(day_after), [self.schedule.id, weekly.id])
+
+    def test_cancelled_departures_with_bookings_are_kept(self):
+        ScheduleException.objects.create(schedule=self.schedule, date=self.travel_date, runs=False)
+        self.assertEqual(list(trips_for(self.travel_date, bus_id=self.bus.id)), [self.trip])
+        self.assertEqual(self.departures(self.travel_date + timedelta(days=1)), [self.schedule.id])
+
+    def test_edited_times_move_existing_trips(self):
+        self.schedule.departure_time = time(9)
+        self.schedule.save()
+        trip = trips_for(self.travel_date, bus_id=self.bus.id).get()
+        self.assertEqual((trip.id, trip.departure_time), (self.trip.id, time(9)))
+
+    def test_dates_outside_the_booking_horizon_are_not_expanded(self):
+        url = reverse('bus-list-by-route', args=[self.bus.route_id])
+        trips = Trip.objects.count()
+        for travel_date in (
+            self.travel_date - timedelta(days=2),
+            self.travel_date + timedelta(days=settings.BOOKING_HORIZON_DAYS),
+            self.travel_date + timedelta(days=3650),
+        ):
+            response = APIClient().get(url, {'date': travel_date})
+            self.assertEqual((response.status_code, response.data), (200, []))
+        self.assertEqual(Trip.objects.count(), trips)
+
+    @override_settings(RATE_LIMITS={}, BOOKING_ADMISSION_QUEUE=False)
+    def test_bookings_beyond_the_horizon_are_refused(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(reverse('booking-create'), {
+            'bus': self.bus.id, 'travel_date': self.travel_date + timedelta(days=settings.BOOKING_HORIZON_DAYS),
+            'seat_count': 1, 'total_price': '0',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_requests_queued_for_a_dropped_departure_are_rejected(self):
+        evening = self.add_schedule(18)
+        trip = trips_for(self.travel_date, bus_id=self.bus.id).get(schedule=evening)
+        by_exception = BookingRequest.objects.create(
+            user=self.user, bus=self.bus, travel_date=self.travel_date, trip=trip, seat_count=1,
+        )
+        ScheduleException.objects.create(schedule=evening, date=self.travel_date, runs=False)
+        expand(self.travel_date, self.travel_date)
+        later = self.travel_date + timedelta(days=1)
+        by_deletion = BookingRequest.objects.create(
+            user=self.user, bus=self.bus, travel_date=later,
+            trip=trips_for(later, bus_id=self.bus.id).get(schedule=evening), seat_count=1,
+        )
+        evening.delete()
+        for request in (by_exception, by_deletion):
+            request.refresh_from_db()
+            self.assertEqual((request.status, request.trip), ('rejected', None))
+
+    def test_bus_times_come_from_the_first_active_schedule(self):
+        self.add_schedule(6, is_active=False)
+        self.add_schedule(18)
+        bus = with_times(Bus.objects.filter(pk=self.bus.pk)).get()
+        self.assertEqual((bus.departure_time, bus.arrival_time), (time(8), time(10)))
+
+    def test_trip_list_loads_availability_once(self):
+        for hour in (12, 16):
+            self.add_schedule(hour)
+        trips = list(trips_for(self.travel_date, bus_id=self.bus.id).select_related('bus'))
+        with self.assertNumQueries(2):
+            data = TripSerializer(trips, many=True).data
+        self.assertEqual([trip['available_seats'] for trip in data], [3, 4, 4])
+
+
+class ConductorSummaryTests(BookedBusTestCase):
+    def setUp(self):
+        super().setUp()
+        self.conductor = CustomUser.objects.create_user(username='conductor', password='secret', role='conductor')
+        Bus.objects.filter(pk=self.bus.pk).update(conductor=self.conductor)
+        Schedule.objects.create(bus=self.bus, departure_time=time(18), arrival_time=time(20))
+        self.late = trips_for(self.travel_date, bus_id=self.bus.id).exclude(pk=self.trip.pk).get()
+        self.client = APIClient()
+        self.client.force_authenticate(self.conductor)
+
+    def book(self, trip, seats, status='confirmed'):
+        booking = Booking.objects.create(
+            user=self.user, bus=self.bus, trip=trip, travel_date=self.travel_date,
+            total_price=Decimal('10.00') * len(seats), receipt_id=f'RCP-SUM-{Booking.objects.count()}', status=status,
+        )
+        for seat in seats:
+            Ticket.objects.create(booking=booking, seat=seat, price=Decimal('10.00'))
+
+    def test_counts_per_departure(self):
+        first, second, third = self.bus.seats.order_by('id')[:3]
+        # The seat of the booking on the morning trip, sold again in the evening.
+        self.book(self.late, [first])
+        self.book(self.late, [second], status='pending')
+        self.book(self.trip, [second, third], status='cancelled')
+
+        response = self.client.get(reverse('conductor-summary'), {'date': self.travel_date})
+        self.assertEqual(response.status_code, 200)
+        [row] = response.data['data']['buses']
+        self.assertEqual(
+            {name: row[name] for name in (
+                'departures', 'capacity', 'bookings', 'passengers', 'seats_filled', 'revenue', 'pending', 'cancelled',
+            )},
+            {'departures': 2, 'capacity': 8, 'bookings': 3, 'passengers': 3, 'seats_filled': 2,
+             'revenue': '20.00', 'pending': 1, 'cancelled': 1},
+        )
+        self.assertEqual(response.data['data']['totals']['seats_filled'], 2)
+
+    def test_next_departures_count_their_own_seats(self):
+        self.book(self.late, list(self.bus.seats.order_by('id')[:2]))
+        now = timezone.make_aware(datetime.combine(self.travel_date, time(7)))
+        with mock.patch('api.views.localtime', return_value=now):
+            response = self.client.get(reverse('conductor-summary'), {'date': self.travel_date})
+        self.assertEqual(
+            [(trip['trip'], trip['seats_filled'], trip['capacity'])
+             for trip in response.data['data']['next_departures'][:2]],
+            [(self.trip.id, 1, 4), (self.late.id, 2, 4)],
+        )
+
+
+class AnalyticsTests(BookedBusTestCase):
+    HISTORY = 14
+
+    def setUp(self):
+        super().setUp()
+        self.today = self.travel_date - timedelta(days=1)
+        self.week_ago = self.today - timedelta(days=7)
+        # Once a week in the morning, every evening.
+        self.schedule.days_of_week = 1 << self.today.weekday()
+        self.schedule.save()
+        self.evening = Schedule.objects.create(bus=self.bus, departure_time=time(18), arrival_time=time(20))
+        expand(self.today - timedelta(days=self.HISTORY), self.today)
+
+    def book(self, travel_date, hour, count, status='confirmed'):
+        trip = Trip.objects.get(bus=self.bus, travel_date=travel_date, departure_time=time(hour))
+        booking = Booking.objects.create(
+            user=self.user, bus=self.bus, trip=trip, travel_date=travel_date, total_price=Decimal('10.00') * count,
+            receipt_id=f'RCP-AN-{Booking.objects.count()}', status=status,
+        )
+        seats = list(self.bus.seats.order_by('id')[:count])
+        for seat in seats:
+            Ticket.objects.create(booking=booking, seat=seat, price=Decimal('10.00'))
+        # As BookingSerializer logs it.
+        events.record_created([booking], [[seat.id for seat in seats]])
+        return booking
+
+    def loads(self):
+        return list(
+            DailyLoad.objects.filter(seats_booked__gt=0).order_by('travel_date', 'departure_hour')
+            .values_list('travel_date', 'departure_hour', 'seats_booked', 'capacity')
+        )
+
+    def test_capacity_is_offered_per_scheduled_departure(self):
+        self.book(self.week_ago, 8, 2)
+        analytics.refresh(full=True, today=self.today)
+        factors = analytics.load_factors(self.today, history_days=self.HISTORY)
+        # 2 morning and 14 evening departures of 4 seats.
+        self.assertEqual(factors['bus'], [
+            {'key': self.bus.id, 'load_factor': 0.0312, 'seats_sold': 2, 'seats_offered': 64},
+        ])
+        self.assertEqual(factors['departure_hour'], [
+            {'key': 8, 'load_factor': 0.25, 'seats_sold': 2, 'seats_offered': 8},
+            {'key': 18, 'load_factor': 0.0, 'seats_sold': 0, 'seats_offered': 56},
+        ])
+
+    def test_forecasts_are_capped_by_the_departures_of_the_day(self):
+        self.book(self.week_ago, 8, 4)
+        analytics.refresh(full=True, today=self.today)
+        forecasts = {
+            row['travel_date']: row for row in analytics.forecast_demand(self.today, 2, history_days=self.HISTORY)
+        }
+        today, tomorrow = forecasts[self.today.isoformat()], forecasts[self.travel_date.isoformat()]
+        # Four seats sold on this weekday over two weeks: two expected today.
+        self.assertEqual((today['seats_offered'], today['expected_seats'], today['expected_load_factor']), (8, 2, 0.25))
+        # Tomorrow only the evening bus runs; the morning booking is already there.
+        self.assertEqual((tomorrow['seats_offered'], tomorrow['booked_seats']), (4, 1))
+
+    def test_forecasts_are_at_least_what_is_booked(self):
+        self.book(self.today, 18, 3)
+        analytics.refresh(full=True, today=self.today)
+        today = analytics.forecast_demand(self.today, 1, history_days=self.HISTORY)[0]
+        self.assertEqual(
+            (today['seats_offered'], today['booked_seats'], today['expected_seats'], today['expected_load_factor']),
+            (8, 3, 3, 0.375),
+        )
+
+    def test_loads_are_kept_per_departure(self):
+        self.book(self.week_ago, 8, 2)
+        self.book(self.week_ago, 18, 1)
+        self.book(self.week_ago, 18, 2)
+        self.book(self.week_ago, 18, 1, status='pending')
+        run = analytics.refresh(full=True, today=self.today)
+        # With the booking of BookedBusTestCase.
+        self.assertEqual((run.full_rebuild, run.bookings_processed), (True, 4))
+        self.assertEqual(self.loads(), [
+            (self.week_ago, 8, 2, 4), (self.week_ago, 18, 3, 4), (self.travel_date, 8, 1, 4),
+        ])
+        factors = analytics.load_factors(self.today, history_days=self.HISTORY)
+        self.assertEqual(factors['route'], [
+            {'key': self.bus.route_id, 'load_factor': 0.0781, 'seats_sold': 5, 'seats_offered': 64},
+        ])
+        weekday = next(row for row in factors['weekday'] if row['key'] == self.week_ago.weekday())
+        # Morning and evening departures on that weekday, in each of the two weeks.
+        self.assertEqual((weekday['seats_sold'], weekday['seats_offered']), (5, 16))
+
+    def test_an_incremental_refresh_matches_a_full_rebuild(self):
+        self.book(self.week_ago, 8, 2)
+        cancelled = self.book(self.week_ago + timedelta(days=1), 18, 3)
+        deleted = self.book(self.today - timedelta(days=2), 18, 1)
+        analytics.refresh(full=True, today=self.today)
+
+        self.book(self.today - timedelta(days=3), 18, 2)
+        confirmed = self.book(self.today, 18, 1, status='pending')
+        confirmed.set_status('confirmed')
+        cancelled.set_status('cancelled')
+        deleted.delete()
+        incremental = analytics.refresh(today=self.today)
+        self.assertFalse(incremental.full_rebuild)
+        loads = self.loads()
+
+        full = analytics.refresh(full=True, today=self.today)
+        self.assertEqual(loads, self.loads())
+        self.assertEqual(loads, [
+            (self.week_ago, 8, 2, 4), (self.today - timedelta(days=3), 18, 2, 4), (self.today, 18, 1, 4),
+            (self.travel_date, 8, 1, 4),
+        ])
+        self.assertEqual(incremental.load_factors, full.load_factors)
+        self.assertEqual(incremental.forecasts, full.forecasts)
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(unpin)
+        self.middleware = ReplicaPinningMiddleware(self.respond)
+        self.pinned = []
+
+    def respond(self, request):
+        self.pinned.append(is_pinned())
+        return HttpResponse(status=400 if request.path == '/invalid/' else 200)
+
+    def request(self, method, path='/', remote_addr='10.0.0.1', forwarded_for='198.51.100.1'):
+        request = getattr(RequestFactory(), method)(
+            path, REMOTE_ADDR=remote_addr, HTTP_X_FORWARDED_FOR=forwarded_for,
+        )
+        self.middleware(request)
+        return self.pinned[-1]
+
+    def test_reads_go_to_a_replica(self):
+        self.assertEqual(Bus.objects.all().db, 'replica1')
+
+    def test_writes_go_to_the_primary_and_pin_the_request(self):
+        self.assertEqual(Bus.objects.select_for_update().db, 'default')
+        self.assertTrue(is_pinned())
+        self.assertEqual(Bus.objects.all().db, 'default')
+
+    def test_cache_entries_do_not_pin(self):
+        # What DatabaseCache routes its queries as.
+        cache_entry = SimpleNamespace(_meta=SimpleNamespace(app_label=CACHE_APP_LABEL))
+        self.assertEqual(PrimaryReplicaRouter().db_for_write(cache_entry), 'default')
+        self.assertFalse(is_pinned())
+
+    def test_a_write_pins_its_client_for_the_sticky_window(self):
+        self.assertFalse(self.request('get'))
+        self.assertTrue(self.request('post'))
+        self.assertTrue(self.request('get'))
+        self.assertFalse(self.request('get', remote_addr='10.0.0.2'))
+        with mock.patch('time.time', return_value=time_module.time() + settings.REPLICA_STICKY_SECONDS + 1):
+            self.assertFalse(self.request('get'))
+
+    def test_a_failed_write_does_not_pin(self):
+        self.request('post', '/invalid/')
+        self.assertFalse(self.request('get'))
+
+    def test_forwarded_for_does_not_pick_the_pin(self):
+        self.request('post', forwarded_for='198.51.100.1')
+        self.assertTrue(self.request('get', forwarded_for='198.51.100.2'))
+        self.assertFalse(self.request('get', remote_addr='10.0.0.2', forwarded_for='198.51.100.1'))
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_only_the_proxy_hop_is_trusted(self):
+        self.request('post', forwarded_for='198.51.100.1, 203.0.113.5')
+        self.assertTrue(self.request('get', forwarded_for='198.51.100.2, 203.0.113.5'))
+        self.assertFalse(self.request('get', forwarded_for='203.0.113.6'))
+
+
+@skipUnless(settings.REPLICA_DATABASES, 'needs DB_REPLICAS, e.g. DB_REPLICAS=replica1.sqlite3')
+class ReplicaDatabaseTests(TransactionTestCase):
+    """
+    Against the replicas of DB_REPLICAS, which mirror the test database.
+    """
+    databases = {'default', *settings.REPLICA_DATABASES}
+
+    def setUp(self):
+        cache.clear()
+        self.replica = settings.REPLICA_DATABASES[0]
+        Route.objects.create(name='Main', start_location='A', end_location='B', distance=100, estimated_duration=120)
+
+    def queries(self, method):
+        """
+        (primary SQL, replica SQL) of one request that reads the routes and,
+        unless it is a GET, also adds one.
+        """
+        def view(request):
+            list(Route.objects.all())
+            if request.method != 'GET':
+                Route.objects.create(
+                    name='Other', start_location='B', end_location='C', distance=50, estimated_duration=60,
+                )
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/', REMOTE_ADDR='10.0.0.1')
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[self.replica]) as replica:
+            with mock.patch('api.routers.random.choice', return_value=self.replica):
+                ReplicaPinningMiddleware(view)(request)
+        return [q['sql'] for q in primary], [q['sql'] for q in replica]
+
+    def test_reads_go_to_the_replica(self):
+        primary, replica = self.queries('get')
+        self.assertEqual((len(primary), len(replica)), (0, 1))
+
+    def test_writes_and_the_following_reads_go_to_the_primary(self):
+        primary, replica = self.queries('post')
+        self.assertEqual(replica, [])
+        self.assertTrue(any(sql.startswith('INSERT') for sql in primary))
+        # The sticky window carries over to the client's next request.
+        primary, replica = self.queries('get')
+        self.assertEqual((len(primary), len(replica)), (1, 0))
+
+
+class HTTPCacheTests(BookedBusTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client = APIClient()
+        self.station = Station.objects.create(route=self.bus.route, name='Stop', latitude=0, longitude=0, order=0)
+        self.seats_url = reverse('seat-list-by-bus', args=[self.bus.id])
+        self.trips_url = reverse('bus-list-by-route', args=[self.bus.route_id]) + f'?date={self.travel_date}'
+        self.stations_url = reverse('station-list-by-route', args=[self.bus.route_id])
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_conditional_requests_are_answered_with_304(self):
+        response = self.client.get(self.seats_url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': etag},
+            # As weakened by the compression middleware.
+            {'HTTP_IF_NONE_MATCH': 'W/' + etag},
+            {'HTTP_IF_MODIFIED_SINCE': last_modified},
+        ):
+            response = self.client.get(self.seats_url, **headers)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.seats_url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_cached_copies_are_served_without_queries(self):
+        first = self.client.get(self.seats_url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.seats_url)
+        self.assertEqual(second.data, first.data)
+
+    def test_hit_rate(self):
+        etag = self.etag(self.seats_url)
+        self.etag(self.seats_url)
+        self.client.get(self.seats_url, HTTP_IF_NONE_MATCH=etag)
+        self.client.get(self.stations_url)
+        self.assertEqual(
+            get_stats(), {'hits': 1, 'misses': 2, 'not_modified': 1, 'hit_rate': 0.5},
+        )
+
+    def test_booking_changes_invalidate_seat_maps_and_listings(self):
+        seats, trips = self.etag(self.seats_url), self.etag(self.trips_url)
+        self.booking.status = 'cancelled'
+        self.booking.save()
+        self.assertNotEqual(self.etag(self.seats_url), seats)
+        self.assertNotEqual(self.etag(self.trips_url), trips)
+
+    def test_seat_changes_invalidate_the_seat_map(self):
+        seats, trips = self.etag(self.seats_url), self.etag(self.trips_url)
+        seat = Seat.objects.filter(bus=self.bus).first()
+        seat.is_available = False
+        seat.save()
+        self.assertNotEqual(self.etag(self.seats_url), seats)
+        self.assertEqual(self.etag(self.trips_url), trips)
+
+    def test_station_changes_invalidate_stations_and_listings(self):
+        stations, trips, seats = self.etag(self.stations_url), self.etag(self.trips_url), self.etag(self.seats_url)
+        self.station.name = 'Renamed'
+        self.station.save()
+        self.assertNotEqual(self.etag(self.stations_url), stations)
+        self.assertNotEqual(self.etag(self.trips_url), trips)
+        self.assertEqual(self.etag(self.seats_url), seats)
+
+    def test_position_updates_only_invalidate_the_listing(self):
+        seats, trips = self.etag(self.seats_url), self.etag(self.trips_url)
+        self.bus.latitude, self.bus.longitude = 1.5, 2.5
+        self.bus.save(update_fields=['latitude', 'longitude'])
+        self.assertEqual(self.etag(self.seats_url), seats)
+        response = self.client.get(self.trips_url)
+        self.assertNotEqual(response['ETag'], trips)
+        self.assertEqual(response.data[0]['latitude'], 1.5)
+
+
+class FastSerializerTests(BookedBusTestCase):
+    """
+    The .values() serializers of api.fast_serializers against the
+    ModelSerializers they stand in for.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.bus.conductor = CustomUser.objects.create_user(username='conductor', password='secret', role='conductor')
+        self.bus.latitude, self.bus.longitude = 0.25, 0.75
+        self.bus.save()
+        for order in range(3):
+            Station.objects.create(route=self.bus.route, name=f'Stop {order}', latitude=0, longitude=0, order=order)
+        seats = list(self.bus.seats.order_by('id'))
+        booking = Booking.objects.create(
+            user=self.user, bus=self.bus, trip=self.trip, travel_date=self.travel_date,
+            total_price=Decimal('20.00'), receipt_id='RCP-TEST-0002', status='pending',
+        )
+        Ticket.objects.bulk_create(
+            Ticket(booking=booking, seat=seat, travel_date=self.travel_date, price=Decimal('10.00'),
+                   passenger_name=name, passenger_phone='0700000000', passenger_type='student')
+            for seat, name in zip(seats[1:3], ['Ada Lovelace', 'Grace Hopper'])
+        )
+
+    def assertSameOutput(self, fast, serializer):
+        self.assertEqual(fast, [dict(item) for item in serializer.data])
+
+    def test_bookings(self):
+        bookings = Booking.objects.order_by('id')
+        self.assertSameOutput(serialize_bookings(bookings), BookingSerializer(bookings, many=True))
+        fields = {'id', 'seats', 'status'}
+        self.assertSameOutput(
+            serialize_bookings(bookings, fields=fields),
+            BookingSerializer(bookings, many=True, context={'fields': fields}),
+        )
+
+    def test_trips(self):
+        trips = trips_for(self.travel_date).select_related('bus')
+        self.assertSameOutput(serialize_trips(trips), TripSerializer(trips, many=True))
+        board, alight = Station.objects.order_by('order').values_list('id', flat=True)[1:]
+        self.assertSameOutput(
+            serialize_trips(trips, board_station=board, alight_station=alight),
+            TripSerializer(trips, many=True, context={'board_station': board, 'alight_station': alight}),
+        )
+
+    def test_buses(self):
+        buses = with_times(Bus.objects.all())
+        with self.assertNumQueries(1):
+            # No query per bus for its available seats.
+            serialized = BusSerializer(buses, many=True).data
+        self.assertEqual(serialize_buses(buses), [dict(item) for item in serialized])
+        self.assertEqual(serialize_buses(buses, fields={'id', 'departure_time'}), [
+            {'id': self.bus.id, 'departure_time': '08:00:00'},
+        ])
+
+    def test_fields_parameter(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('user-bookings'), {'fields': 'id,receipt_id'})
+        self.assertEqual(response.data['data'], [
+            {'id': booking.id, 'receipt_id': booking.receipt_id} for booking in Booking.objects.order_by('id')
+        ])
+        client.force_authenticate(self.bus.conductor)
+        response = client.get(reverse('conductor-buses'), {'fields': 'plate_number'})
+        self.assertEqual(response.data, [{'plate_number': 'MAIN-1'}])
+
+
+class CompressionTests(BookedBusTestCase):
+    def setUp(self):
+        super().setUp()
+        # A response well over RESPONSE_COMPRESSION_MIN_LENGTH.
+        self.url = reverse('seat-list-by-bus', args=[self.bus.id])
+
+    def get(self, accept_encoding):
+        return self.client.get(self.url, HTTP_ACCEPT_ENCODING=accept_encoding)
+
+    @override_settings(RESPONSE_COMPRESSION=False)
+    def test_off_by_default(self):
+        self.assertFalse(self.get('gzip').has_header('Content-Encoding'))
+
+    @override_settings(RESPONSE_COMPRESSION=True)
+    def test_gzip(self):
+        plain = self.get('')
+        response = self.get('gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        # Revalidation still matches the weakened ETag.
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    @skipUnless(brotli, 'brotli is not installed')
+    @override_settings(RESPONSE_COMPRESSION=True)
+    def test_brotli(self):
+        plain = self.get('')
+        response = self.get('gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+
+class TrackTests(BookedBusTestCase):
+    START = datetime(2026, 1, 5, 12, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        self.other = Bus.objects.create(
+            plate_number='MAIN-2', route=self.bus.route, capacity=4, price_per_seat=Decimal('10.00'),
+        )
+
+    def fix(self, bus, recorded_at, latitude=0.0, longitude=0.0):
+        bus.latitude, bus.longitude = latitude, longitude
+        return tracks.record(bus, recorded_at)
+
+    def test_simplify_keeps_the_points_beyond_the_tolerance(self):
+        x = np.array([0.0, 100, 200, 300, 400])
+        y = np.array([0.0, 4, 0, 30, 0])
+        self.assertEqual(tracks.simplify(x, y, 50).tolist(), [0, 4])
+        # 30 m off the chord; then 20 m off the new one from the start.
+        self.assertEqual(tracks.simplify(x, y, 10).tolist(), [0, 2, 3, 4])
+        self.assertEqual(tracks.simplify(x, y, 3).tolist(), [0, 1, 2, 3, 4])
+        # A loop back to the start is measured from the start point.
+        self.assertEqual(tracks.simplify(np.array([0.0, 100, 0]), np.zeros(3), 10).tolist(), [0, 1, 2])
+
+    def test_track_is_simplified(self):
+        for second in range(10):
+            # A straight line north with a few centimetres of jitter.
+            self.fix(self.bus, self.START + timedelta(seconds=second), second * 0.001, (second % 2) * 1e-7)
+        path = tracks.track(self.bus.id, self.START, self.START + timedelta(minutes=1))
+        self.assertEqual(path['recorded_points'], 10)
+        self.assertEqual(
+            [point[2] for point in path['points']],
+            [int(self.START.timestamp()), int(self.START.timestamp()) + 9],
+        )
+
+    def test_downsampling_keeps_one_point_per_bus_and_minute_across_chunks(self):
+        for second in range(0, 300, 10):
+            for bus in (self.bus, self.other):
+                self.fix(bus, self.START + timedelta(seconds=second))
+        # Aligned down to the minute: the fifth minute stays raw.
+        before = self.START + timedelta(minutes=4, seconds=30)
+        self.assertEqual(tracks.downsample(before, interval=60, chunk_size=7), 2 * 4 * 5)
+        for bus in (self.bus, self.other):
+            points = LocationPoint.objects.filter(bus=bus).order_by('recorded_at')
+            self.assertEqual(
+                [(point.recorded_at, point.resolution) for point in points if point.resolution],
+                [(self.START + timedelta(minutes=minute), 60) for minute in range(4)],
+            )
+            self.assertEqual(points.filter(resolution=LocationPoint.RESOLUTION_RAW).count(), 6)
+        # Nothing left to do for the same window.
+        self.assertEqual(tracks.downsample(before, interval=60, chunk_size=7), 0)
+
+    def test_old_days_expire(self):
+        for day in range(5):
+            for minute in range(3):
+                self.fix(self.bus, self.START + timedelta(days=day, minutes=minute))
+        cutoff = (self.START + timedelta(days=3)).date()
+        self.assertEqual(tracks.expire(cutoff, chunk_size=2), 9)
+        self.assertEqual(
+            sorted({point.day for point in LocationPoint.objects.all()}),
+            [cutoff, cutoff + timedelta(days=1)],
+        )
+
+    def test_compact(self):
+        for minute in range(3):
+            self.fix(self.bus, self.START - timedelta(days=100, minutes=minute))
+            for second in (0, 30):
+                self.fix(self.bus, self.START - timedelta(days=2, minutes=minute, seconds=-second))
+        self.assertEqual(tracks.compact(self.START), {'expired': 3, 'downsampled': 3})
+        self.assertEqual(LocationPoint.objects.count(), 3)
+
+
+class ArchiveTests(BookedBusTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cutoff = timezone.localdate() - archive.ARCHIVE_AFTER
+        self.old = [self.add_booking(f'RCP-OLD-{n}', self.cutoff - timedelta(days=n + 1)) for n in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_booking(self, receipt_id, travel_date):
+        booking = Booking.objects.create(
+            user=self.user, bus=self.bus, travel_date=travel_date, total_price=Decimal('20.00'),
+            receipt_id=receipt_id, status='completed',
+        )
+        Ticket.objects.bulk_create(
+            Ticket(booking=booking, seat=seat, travel_date=travel_date, price=Decimal('10.00'),
+                   passenger_name=name, passenger_phone='0700000000', passenger_type='adult')
+            for seat, name in zip(self.bus.seats.order_by('id'), ['Ada Lovelace', 'Grace Hopper'])
+        )
+        return booking
+
+    def test_archival_moves_bookings_with_their_tickets(self):
+        expected = {booking.id: BookingSerializer(booking).data for booking in self.old}
+        self.assertEqual(archive.archive(self.cutoff, batch_size=2), 3)
+        self.assertEqual(list(Booking.objects.all()), [self.booking])
+        self.assertEqual(Ticket.objects.exclude(booking=self.booking).count(), 0)
+        for archived in ArchivedBooking.objects.all():
+            data = expected[archived.id]
+            data.pop('seat_count', None)
+            self.assertEqual(ArchivedBookingSerializer(archived).data, data)
+        self.assertEqual(archive.archive(self.cutoff), 0)
+
+    def test_archival_is_not_a_change(self):
+        tags = [f'bus:{self.bus.id}', f'route:{self.bus.route_id}']
+        versions = get_versions(tags)
+        self.assertEqual(len(search.search('rcp-old')), 3)
+        archive.archive(self.cutoff)
+        self.assertEqual(get_versions(tags), versions)
+        self.assertFalse(BookingEvent.objects.filter(event_type=BookingEvent.DELETED).exists())
+        self.assertFalse(BookingTombstone.objects.exists())
+        # But archived bookings leave the search index.
+        self.assertEqual(search.search('rcp-old'), [])
+
+    def test_archived_bookings_are_listed_on_request(self):
+        seats = list(self.bus.seats.order_by('id').values_list('id', flat=True))
+        archive.archive(self.cutoff)
+        url = reverse('user-bookings')
+        self.assertEqual([row['id'] for row in self.client.get(url).data['data']], [self.booking.id])
+        response = self.client.get(url, {'archived': 'true', 'fields': 'id,receipt_id,seats'})
+        # In id order, ahead of the current ones.
+        self.assertEqual(response.data['data'], [
+            *({'id': booking.id, 'receipt_id': booking.receipt_id, 'seats': seats[:2]} for booking in self.old),
+            {'id': self.booking.id, 'receipt_id': self.booking.receipt_id, 'seats': seats[:1]},
+        ])
+
+    def test_receipts_of_archived_bookings(self):
+        archive.archive(self.cutoff)
+        response = self.client.get(reverse('booking-receipt', args=['RCP-OLD-0']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data['id'], response.data['status'], len(response.data['passenger_info'])),
+            (self.old[0].id, 'completed', 2),
+        )
+        other = CustomUser.objects.create_user(username='other', password='secret')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(reverse('booking-receipt', args=['RCP-OLD-0'])).status_code, 404)
+
+
+@override_settings(RATE_LIMITS={}, BOOKING_ADMISSION_QUEUE=False)
+class SegmentBookingTests(BookedBusTestCase):
+    """
+    Bookings between stations, through the API. The booking of
+    BookedBusTestCase holds the first seat over the whole route.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.a, self.b, self.c = (
+            Station.objects.create(route=self.bus.route, name=name, latitude=0, longitude=0, order=order)
+            for order, name in enumerate('ABC')
+        )
+        self.seat = self.bus.seats.order_by('id')[1]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.availability_url = reverse('trip-seat-availability', args=[self.trip.id])
+
+    def book(self, board, alight, seat):
+        return self.client.post(reverse('booking-create'), {
+            'bus': self.bus.id, 'travel_date': self.travel_date, 'seats': [seat.id], 'total_price': '10.00',
+            'board_station': board.id, 'alight_station': alight.id,
+        }, format='json')
+
+    def free_seats(self, board, alight):
+        response = self.client.get(self.availability_url, {'from': board.id, 'to': alight.id})
+        self.assertEqual(response.status_code, 200)
+        return response.data['free_seats']
+
+    def available(self, board, alight):
+        response = self.client.get(
+            reverse('bus-list-by-route', args=[self.bus.route_id]),
+            {'date': self.travel_date, 'from': board.id, 'to': alight.id},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data[0]['available_seats']
+
+    def test_a_seat_is_sold_once_per_segment(self):
+        self.assertEqual(self.book(self.a, self.b, self.seat).status_code, 201)
+        self.assertNotIn(self.seat.id, self.free_seats(self.a, self.b))
+        self.assertIn(self.seat.id, self.free_seats(self.b, self.c))
+        self.assertEqual((self.available(self.a, self.b), self.available(self.b, self.c)), (2, 3))
+
+        self.assertEqual(self.book(self.b, self.c, self.seat).status_code, 201)
+        self.assertNotIn(self.seat.id, self.free_seats(self.b, self.c))
+        self.assertEqual(self.book(self.a, self.c, self.seat).status_code, 400)
+        self.assertEqual(self.book(self.a, self.b, self.seat).status_code, 400)
+
+    def test_stations_must_be_on_the_route_and_in_order(self):
+        other_route = Route.objects.create(
+            name='Other', start_location='C', end_location='D', distance=10, estimated_duration=20,
+        )
+        elsewhere = Station.objects.create(route=other_route, name='D', latitude=0, longitude=0, order=0)
+        listing = reverse('bus-list-by-route', args=[self.bus.route_id])
+        for params in (
+            {'from': 99999},
+            {'to': elsewhere.id},
+            {'from': self.c.id, 'to': self.a.id},
+            {'from': self.b.id, 'to': self.b.id},
+        ):
+            self.assertEqual(self.client.get(self.availability_url, params).status_code, 400, params)
+            self.assertEqual(
+                self.client.get(listing, {'date': self.travel_date, **params}).status_code, 400, params,
+            )
+        self.assertEqual(self.book(self.a, elsewhere, self.seat).status_code, 400)
+        self.assertEqual(self.book(self.c, self.a, self.seat).status_code, 400)
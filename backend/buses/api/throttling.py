@@ -0,0 +1,216 @@
+"""
+Token-bucket rate limiting and concurrency shedding for expensive endpoints.
+
+Views opt in with `throttle_scope` (token buckets configured in
+settings.RATE_LIMITS) and `ConcurrencyLimitMixin` + `concurrency_scope`
+(in-flight limits from settings.CONCURRENCY_LIMITS). Both answer with a
+Retry-After header: 429 when a client is over its rate, 503 when the
+process is already busy with as many such requests as it should take on.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+
+RATE_UNITS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """
+    '10/min' -> tokens per second.
+    """
+    count, unit = rate.split('/')
+    return int(count) / RATE_UNITS[unit]
+
+
+# ----- Bucket stores -----
+
+class BucketStore:
+    """
+    Holds token buckets. `consume()` takes `cost` tokens from the bucket at
+    `key` if it has them and returns (allowed, seconds until it would).
+    """
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        raise NotImplementedError
+
+    @staticmethod
+    def refill(tokens, updated_at, now, capacity, refill_rate):
+        if tokens is None:
+            return capacity
+        return min(capacity, tokens + (now - updated_at) * refill_rate)
+
+    @staticmethod
+    def take(tokens, capacity, refill_rate, cost):
+        if tokens >= cost:
+            return True, tokens - cost, 0
+        return False, tokens, (cost - tokens) / refill_rate
+
+
+class InMemoryBucketStore(BucketStore):
+    """
+    Per-process buckets; the fastest option, but every worker counts separately.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated_at = self.buckets.get(key, (None, now))
+            tokens = self.refill(tokens, updated_at, now, capacity, refill_rate)
+            allowed, tokens, wait = self.take(tokens, capacity, refill_rate, cost)
+            self.buckets[key] = (tokens, now)
+        return allowed, wait
+
+
+class CacheBucketStore(BucketStore):
+    """
+    Buckets in a Django cache shared by all workers. Read-modify-write is not
+    atomic, so concurrent requests may occasionally both take the last token.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        now = time.time()
+        cache_key = f"ratelimit:{key}"
+        tokens, updated_at = self.cache.get(cache_key, (None, now))
+        tokens = self.refill(tokens, updated_at, now, capacity, refill_rate)
+        allowed, tokens, wait = self.take(tokens, capacity, refill_rate, cost)
+        # Keep the bucket only as long as it takes to refill completely.
+        self.cache.set(cache_key, (tokens, now), timeout=int(capacity / refill_rate) + 1)
+        return allowed, wait
+
+
+class DatabaseBucketStore(BucketStore):
+    """
+    Buckets in the RateLimitBucket table, updated under a row lock.
+    """
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        from .models import RateLimitBucket
+
+        now = time.time()
+        with transaction.atomic():
+            bucket, created = RateLimitBucket.objects.select_for_update().get_or_create(
+                key=key, defaults={'tokens': capacity, 'updated_at': now},
+            )
+            tokens = self.refill(bucket.tokens, bucket.updated_at, now, capacity, refill_rate)
+            allowed, tokens, wait = self.take(tokens, capacity, refill_rate, cost)
+            bucket.tokens = tokens
+            bucket.updated_at = now
+            bucket.save(update_fields=['tokens', 'updated_at'])
+        return allowed, wait
+
+
+_store = None
+
+
+def get_bucket_store():
+    global _store
+    if _store is None:
+        _store = import_string(settings.RATE_LIMIT_STORE)()
+    return _store
+
+
+# ----- Throttle -----
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Applies the buckets of `settings.RATE_LIMITS[view.throttle_scope]`:
+    'user' (authenticated users), 'ip' (every client address) and
+    'endpoint' (all clients together). Views without a scope are not limited.
+    The client IP only trusts as many X-Forwarded-For hops as
+    REST_FRAMEWORK['NUM_PROXIES'], so a client cannot pick its own bucket.
+    """
+
+    def allow_request(self, request, view):
+        self.wait_time = None
+        scope = getattr(view, 'throttle_scope', None)
+        limits = settings.RATE_LIMITS.get(scope) if scope else None
+        if not limits:
+            return True
+
+        identities = {
+            'ip': self.get_ident(request),
+            'endpoint': 'all',
+        }
+        if request.user and request.user.is_authenticated:
+            identities['user'] = request.user.pk
+
+        store = get_bucket_store()
+        waits = []
+        for dimension, limit in limits.items():
+            if dimension not in identities:
+                continue
+            refill_rate = parse_rate(limit['rate'])
+            allowed, wait = store.consume(
+                f"{scope}:{dimension}:{identities[dimension]}", limit['burst'], refill_rate,
+            )
+            if not allowed:
+                waits.append(wait)
+        if waits:
+            self.wait_time = max(waits)
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_time
+
+
+# ----- Concurrency shedding -----
+
+class Overloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is busy, please retry shortly.'
+    default_code = 'overloaded'
+
+    def __init__(self, wait, detail=None):
+        super().__init__(detail)
+        # Picked up by DRF's exception handler as the Retry-After header.
+        self.wait = wait
+
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def get_semaphore(scope):
+    with _semaphores_lock:
+        if scope not in _semaphores:
+            _semaphores[scope] = threading.BoundedSemaphore(settings.CONCURRENCY_LIMITS[scope])
+        return _semaphores[scope]
+
+
+class ConcurrencyLimitMixin:
+    """
+    Rejects a request with 503 + Retry-After instead of queueing it when this
+    process is already running CONCURRENCY_LIMITS[concurrency_scope] of them,
+    leaving worker threads free for cheap endpoints.
+    """
+    concurrency_scope = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        semaphore = get_semaphore(self.concurrency_scope)
+        if not semaphore.acquire(blocking=False):
+            raise Overloaded(wait=settings.CONCURRENCY_RETRY_AFTER)
+        self._concurrency_slot = semaphore
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        semaphore = getattr(self, '_concurrency_slot', None)
+        if semaphore is not None:
+            self._concurrency_slot = None
+            semaphore.release()
+        return super().finalize_response(request, response, *args, **kwargs)
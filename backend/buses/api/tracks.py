@@ -0,0 +1,174 @@
+"""
+Location history of buses.
+
+Every location update is stored as a raw LocationPoint. Raw points are
+kept at full resolution for RAW_RETENTION; compaction then keeps one point
+per bus and DOWNSAMPLE_INTERVAL, and drops whole days older than
+HISTORY_RETENTION. Compaction walks the table one day (the partition key)
+and at most `chunk_size` rows at a time, so its memory use does not grow
+with the table.
+
+Tracks are served as polylines simplified with Douglas–Peucker, which
+drops the points that lie within `tolerance` metres of the line through
+their neighbours.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+
+from .models import LocationPoint
+
+
+RAW_RETENTION = timedelta(hours=24)
+DOWNSAMPLE_INTERVAL = 60
+HISTORY_RETENTION = timedelta(days=90)
+# Rows per statement; also keeps `__in` lists under SQLite's parameter limit.
+COMPACTION_CHUNK = 900
+DEFAULT_TOLERANCE = 10.0
+EARTH_RADIUS = 6371000.0
+
+
+def record(bus, recorded_at):
+    return LocationPoint.objects.create(
+        bus=bus,
+        day=recorded_at.date(),
+        recorded_at=recorded_at,
+        latitude=bus.latitude,
+        longitude=bus.longitude,
+    )
+
+
+# ----- Simplification -----
+
+def project(latitudes, longitudes):
+    """
+    Equirectangular projection to metres around the mean latitude; accurate
+    enough for the extent of one bus track.
+    """
+    # NumPy is imported on first use: location updates import this module
+    # but never need it, and it is a large share of worker boot time.
+    import numpy as np
+
+    latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+    x = longitudes * math.cos(latitudes.mean()) * EARTH_RADIUS
+    y = latitudes * EARTH_RADIUS
+    return x, y
+
+
+def simplify(x, y, tolerance):
+    """
+    Indices of the points Douglas–Peucker keeps for the polyline (x, y).
+    """
+    import numpy as np
+
+    count = len(x)
+    if count < 3:
+        return np.arange(count)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length = math.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(dx * py - dy * px) / length
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep)
+
+
+def track(bus_id, start, end, tolerance=DEFAULT_TOLERANCE):
+    """
+    The simplified path of a bus between two datetimes:
+    {'recorded_points': n, 'points': [[latitude, longitude, unix time], ...]}.
+    """
+    rows = list(
+        LocationPoint.objects
+        .filter(bus_id=bus_id, recorded_at__gte=start, recorded_at__lte=end)
+        .order_by('recorded_at', 'id')
+        .values_list('recorded_at', 'latitude', 'longitude')
+    )
+    if not rows:
+        return {'recorded_points': 0, 'points': []}
+    times, latitudes, longitudes = zip(*rows)
+    kept = simplify(*project(latitudes, longitudes), tolerance)
+    return {
+        'recorded_points': len(rows),
+        'points': [
+            [latitudes[i], longitudes[i], int(times[i].timestamp())]
+            for i in kept.tolist()
+        ],
+    }
+
+
+# ----- Retention and compaction -----
+
+def downsample(before, interval=DOWNSAMPLE_INTERVAL, chunk_size=COMPACTION_CHUNK):
+    """
+    Reduce raw points recorded before `before` to the first point of each
+    bus and `interval`-second bucket. Returns the number of points deleted.
+    """
+    # Bucket-aligned, so a bucket is never split between two runs.
+    before = datetime.fromtimestamp(int(before.timestamp()) // interval * interval, tz=dt_timezone.utc)
+    raw = LocationPoint.objects.filter(resolution=LocationPoint.RESOLUTION_RAW, recorded_at__lt=before)
+    deleted = 0
+    for day in raw.values_list('day', flat=True).distinct().order_by('day'):
+        last_bucket = None
+        while True:
+            rows = list(
+                raw.filter(day=day)
+                .order_by('bus_id', 'recorded_at', 'id')
+                .values_list('id', 'bus_id', 'recorded_at')[:chunk_size]
+            )
+            if not rows:
+                break
+            kept, dropped = [], []
+            for point_id, bus_id, recorded_at in rows:
+                bucket = (bus_id, int(recorded_at.timestamp()) // interval)
+                if bucket == last_bucket:
+                    dropped.append(point_id)
+                else:
+                    kept.append(point_id)
+                    last_bucket = bucket
+            with transaction.atomic():
+                # Kept points stop being raw, which moves the next query on.
+                LocationPoint.objects.filter(id__in=kept).update(resolution=interval)
+                LocationPoint.objects.filter(id__in=dropped).delete()
+            deleted += len(dropped)
+    return deleted
+
+
+def expire(before_day, chunk_size=COMPACTION_CHUNK):
+    """
+    Delete every point of the days before `before_day`, `chunk_size` rows
+    per statement. Returns the number of points deleted.
+    """
+    deleted = 0
+    while True:
+        ids = list(
+            LocationPoint.objects
+            .filter(day__lt=before_day)
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        deleted += LocationPoint.objects.filter(id__in=ids).delete()[0]
+
+
+def compact(now, chunk_size=COMPACTION_CHUNK, raw_retention=RAW_RETENTION,
+            history_retention=HISTORY_RETENTION, interval=DOWNSAMPLE_INTERVAL):
+    expired = expire((now - history_retention).date(), chunk_size)
+    downsampled = downsample(now - raw_retention, interval, chunk_size)
+    return {'expired': expired, 'downsampled': downsampled}
@@ -6,14 +6,26 @@ from .views import (
     StationListByRouteAPIView,
     BusListByRouteAPIView,
     SeatListByBusAPIView,
+    TripSeatAvailabilityAPIView,
     BookingCreateAPIView,
+    BookingRequestStatusAPIView,
     BookingReceiptView,
     UserBookingsAPIView,
     AdminStatsAPIView,
+    AdminCacheStatsAPIView,
+    AdminAnalyticsAPIView,
+    AdminBookingEventsAPIView,
+    AdminBookingSearchAPIView,
     ConductorBusesAPIView,
     ConductorBookingsAPIView,
+    ConductorManifestAPIView,
+    ConductorSummaryAPIView,
     UpdateBusLocationAPIView,
+    BusTrackAPIView,
+    BusETAAPIView,
     UpdateBookingStatusAPIView,
+    ConductorSyncAPIView,
+    BatchUpdateBookingStatusAPIView,
 
 )
 
@@ -29,21 +41,33 @@ urlpatterns = [
     # Buses & Seats
     path('buses/route/<int:route_id>/', BusListByRouteAPIView.as_view(), name='bus-list-by-route'),
     path('buses/<int:bus_id>/seats/', SeatListByBusAPIView.as_view(), name='seat-list-by-bus'),
+    path('trips/<int:trip_id>/availability/', TripSeatAvailabilityAPIView.as_view(), name='trip-seat-availability'),
 
     # Bookings
     path('bookings/', BookingCreateAPIView.as_view(), name='booking-create'),
+    path('bookings/queue/<int:request_id>/', BookingRequestStatusAPIView.as_view(), name='booking-request-status'),
     path('user/bookings/', UserBookingsAPIView.as_view(), name='user-bookings'),
 
 
     path('bookings/<str:receipt_id>/receipt/', BookingReceiptView.as_view(), name='booking-receipt'),
     path('admin/stats/', AdminStatsAPIView.as_view(), name='admin-stats'),
+    path('admin/cache-stats/', AdminCacheStatsAPIView.as_view(), name='admin-cache-stats'),
+    path('admin/analytics/', AdminAnalyticsAPIView.as_view(), name='admin-analytics'),
+    path('admin/events/', AdminBookingEventsAPIView.as_view(), name='admin-booking-events'),
+    path('admin/search/', AdminBookingSearchAPIView.as_view(), name='admin-booking-search'),
 
 
 
 
     path('conductor/buses/', ConductorBusesAPIView.as_view(), name='conductor-buses'),
     path('conductor/bookings/', ConductorBookingsAPIView.as_view(), name='conductor-bookings'),
+    path('conductor/summary/', ConductorSummaryAPIView.as_view(), name='conductor-summary'),
+    path('conductor/manifest/', ConductorManifestAPIView.as_view(), name='conductor-manifest'),
+    path('conductor/sync/', ConductorSyncAPIView.as_view(), name='conductor-sync'),
+    path('conductor/bookings/status/', BatchUpdateBookingStatusAPIView.as_view(), name='conductor-batch-booking-status'),
     path('buses/<int:bus_id>/location/', UpdateBusLocationAPIView.as_view(), name='update-bus-location'),
+    path('buses/<int:bus_id>/track/', BusTrackAPIView.as_view(), name='bus-track'),
+    path('buses/<int:bus_id>/eta/', BusETAAPIView.as_view(), name='bus-eta'),
     path('bookings/<int:booking_id>/status/', UpdateBookingStatusAPIView.as_view(), name='update-booking-status'),
 
 ]
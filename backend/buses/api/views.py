@@ -1,31 +1,60 @@
 from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from datetime import datetime, date
-from django.utils.timezone import now
+from django.urls import reverse
+from datetime import datetime, date, timedelta
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_aware, localtime, make_aware, now
 from django.db.models import Sum, Count
 from django.db.models.functions import TruncMonth
 
-from .models import CustomUser, Route, Station, Bus, Seat, Booking
+from .admission import is_hot, wait_for_result
+from .caching import CachedResponseMixin, get_stats
+from .dashboard import MAX_SUMMARY_DAYS, conductor_summary
+from .idempotency import IdempotentPostMixin
+from .fast_serializers import serialize_archived_bookings, serialize_bookings, serialize_buses, serialize_trips
+from .models import (
+    AnalyticsRun, ArchivedBooking, BookingRequest, CustomUser, Route, Station, Bus, Seat, Booking, Ticket, Trip,
+    passenger_entry,
+)
 from .serializers import (
-    RegisterSerializer, LoginSerializer, RouteSerializer, StationSerializer,
-    BusSerializer, SeatSerializer, BookingSerializer
+    ArchivedBookingSerializer, RegisterSerializer, LoginSerializer, RouteSerializer, StationSerializer,
+    BusSerializer, SeatSerializer, BookingSerializer, BookingRequestSerializer, TripSerializer,
+    requested_fields
 )
+from .schedules import SCHEDULES_TAG, trips_for, with_times
+from .seatmap import assign, bus_layout, layout_key, sort_seats
+from .segments import free_seats, route_indexes, segment_count, segment_span, trip_seat_masks
+from .sync import MAX_BATCH_UPDATES, InvalidCursor, SYNC_PAGE_SIZE, apply_status_updates, changes_since
+from .throttling import ConcurrencyLimitMixin, get_semaphore
+from . import events, search, sequencing, tracks
+
+
+# Statuses a conductor may set on a booking
+BOOKING_STATUS_UPDATES = ['pending', 'confirmed', 'cancelled', 'completed']
+# Longest time range served by the track endpoint
+MAX_TRACK_WINDOW = timedelta(days=7)
 
 
-class RegisterView(generics.CreateAPIView):
+class RegisterView(ConcurrencyLimitMixin, generics.CreateAPIView):
     queryset = CustomUser.objects.all()
     permission_classes = [permissions.AllowAny]
     serializer_class = RegisterSerializer
+    throttle_scope = 'register'
+    concurrency_scope = 'login'
 
 
-class LoginView(generics.GenericAPIView):
+class LoginView(ConcurrencyLimitMixin, generics.GenericAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = LoginSerializer
+    throttle_scope = 'login'
+    concurrency_scope = 'login'
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
@@ -44,70 +73,222 @@ class LoginView(generics.GenericAPIView):
         return Response({"detail": "Invalid credentials"}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class RouteListAPIView(generics.ListAPIView):
+class RouteListAPIView(CachedResponseMixin, generics.ListAPIView):
     permission_classes = [permissions.AllowAny]
-    queryset = Route.objects.all()
+    queryset = Route.objects.prefetch_related('stations')
     serializer_class = RouteSerializer
+    cache_policy = 'catalogue'
 
+    def get_cache_tags(self):
+        return ['catalogue']
 
-class StationListByRouteAPIView(generics.ListAPIView):
+
+class StationListByRouteAPIView(CachedResponseMixin, generics.ListAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = StationSerializer
+    cache_policy = 'catalogue'
+
+    def get_cache_tags(self):
+        return ['catalogue']
 
     def get_queryset(self):
         route_id = self.kwargs['route_id']
         return Station.objects.filter(route_id=route_id).order_by('order')
 
 
-class BusListByRouteAPIView(APIView):
+def station_params(request):
+    """
+    Board/alight station ids from `?from=&to=` (None when absent).
+    """
+    stations = []
+    for name in ('from', 'to'):
+        value = request.query_params.get(name)
+        try:
+            stations.append(int(value) if value else None)
+        except ValueError:
+            raise ParseError(f'{name} must be a station id.')
+    return stations
+
+
+def check_stations(index, board_station, alight_station):
     """
-    Returns active buses for a given route and date.
-    Query param: ?date=YYYY-MM-DD
+    Refuse board/alight stations that are not on the route indexed by
+    `index` (see api.segments), or not in travel order.
+    """
+    for name, station_id in (('from', board_station), ('to', alight_station)):
+        if station_id is not None and station_id not in index:
+            raise ParseError(f'{name} is not a station of this route.')
+    if board_station is not None and alight_station is not None and index[board_station] >= index[alight_station]:
+        raise ParseError('to must come after from.')
+
+
+class BusListByRouteAPIView(CachedResponseMixin, generics.ListAPIView):
+    """
+    Returns the departures (trips) of active buses for a given route and date,
+    one entry per trip, in departure order.
+    Query params: ?date=YYYY-MM-DD, optional ?from=<station id>&to=<station id>
+    to count the seats available between two stations of the route.
     """
     permission_classes = [permissions.AllowAny]
+    serializer_class = TripSerializer
+    cache_policy = 'availability'
+
+    def get_cache_tags(self):
+        return [f"route:{self.kwargs['route_id']}"]
 
-    def get(self, request, route_id):
-        date_str = request.query_params.get('date')
+    def get_travel_date(self):
+        date_str = self.request.query_params.get('date')
         if not date_str:
-            return Response({'detail': 'Date query parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
+            raise ParseError('Date query parameter is required.')
         try:
-            travel_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            return datetime.strptime(date_str, '%Y-%m-%d').date()
         except ValueError:
-            return Response({'detail': 'Invalid date format, should be YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+            raise ParseError('Invalid date format, should be YYYY-MM-DD.')
 
-        buses = Bus.objects.filter(route_id=route_id, status='active')
-        serializer = BusSerializer(buses, many=True, context={'travel_date': travel_date})
-        return Response(serializer.data)
+    def get_queryset(self):
+        return trips_for(
+            self.get_travel_date(), route_id=self.kwargs['route_id'], bus__status='active'
+        ).select_related('bus')
 
+    def list(self, request, *args, **kwargs):
+        board_station, alight_station = station_params(request)
+        if board_station is not None or alight_station is not None:
+            route_id = self.kwargs['route_id']
+            check_stations(route_indexes([route_id])[route_id], board_station, alight_station)
+        return Response(serialize_trips(
+            self.get_queryset(), fields=requested_fields(request),
+            board_station=board_station, alight_station=alight_station,
+        ))
 
-class SeatListByBusAPIView(generics.ListAPIView):
+
+class SeatListByBusAPIView(CachedResponseMixin, generics.ListAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = SeatSerializer
+    cache_policy = 'availability'
+
+    def get_cache_tags(self):
+        return [f"bus:{self.kwargs['bus_id']}"]
 
     def get_queryset(self):
-        bus_id = self.kwargs['bus_id']
-        return Seat.objects.filter(bus_id=bus_id).order_by('seat_number')
+        # Layout order, numbers compared naturally (see api.seatmap).
+        return sort_seats(Seat.objects.filter(bus_id=self.kwargs['bus_id']).select_related('bus'))
 
 
-class BookingCreateAPIView(generics.CreateAPIView):
+class TripSeatAvailabilityAPIView(CachedResponseMixin, generics.RetrieveAPIView):
+    """
+    Seats of a departure that are free between two stations.
+    Query params: optional ?from=<station id>&to=<station id> of the trip's
+    route (whole route by default), and ?count=N to get N suggested seats, together where possible
+    (see api.seatmap).
+    """
+    permission_classes = [permissions.AllowAny]
+    queryset = Trip.objects.all()
+    lookup_url_kwarg = 'trip_id'
+    cache_policy = 'availability'
+
+    def get_cache_tags(self):
+        bus_id = Trip.objects.filter(id=self.kwargs['trip_id']).values_list('bus_id', flat=True).first()
+        return [f"bus:{bus_id}", 'catalogue']
+
+    def retrieve(self, request, *args, **kwargs):
+        trip = self.get_object()
+        board_station, alight_station = station_params(request)
+        try:
+            count = int(request.query_params.get('count', 0))
+        except ValueError:
+            raise ParseError('count must be a number.')
+
+        index = route_indexes([trip.route_id])[trip.route_id]
+        check_stations(index, board_station, alight_station)
+        start, end = segment_span(index, board_station, alight_station)
+        masks = trip_seat_masks(trip, {trip.route_id: index})
+        layout = bus_layout(trip.bus_id)
+        data = {
+            'trip': trip.id,
+            'bus': trip.bus_id,
+            'travel_date': trip.travel_date,
+            'segments': [start, end],
+            'free_seats': free_seats(masks, [seat_id for seat_id, _, _, _ in layout], start, end),
+        }
+        if count > 0:
+            data['suggested_seats'] = assign(layout, masks, start, end, count, segment_count(index))
+        return Response(data)
+
+
+class BookingCreateAPIView(ConcurrencyLimitMixin, IdempotentPostMixin, generics.CreateAPIView):
+    """
+    Creates a booking, or queues it for a hot departure (202). Retries sent
+    with the same Idempotency-Key header get the first response back.
+    """
     serializer_class = BookingSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'booking'
+    concurrency_scope = 'booking'
+
+    def create(self, request, *args, **kwargs):
+        if settings.BOOKING_ADMISSION_QUEUE:
+            queued = BookingRequestSerializer(data=request.data)
+            if queued.is_valid() and is_hot(queued.validated_data['bus'].id, queued.validated_data['travel_date']):
+                # Hot departure: let the queue worker allocate the seats.
+                booking_request = queued.save(user=request.user)
+                return Response({
+                    **BookingRequestSerializer(booking_request).data,
+                    'poll_url': reverse('booking-request-status', args=[booking_request.id]),
+                }, status=status.HTTP_202_ACCEPTED)
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
+class BookingRequestStatusAPIView(APIView):
+    """
+    Result of a queued booking request.
+    Query param: ?wait=N long-polls up to N seconds (capped) for the request to be decided.
+    A process holds at most CONCURRENCY_LIMITS['booking_wait'] long-polls;
+    beyond that the request is answered at once, as without ?wait.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'booking_status'
+
+    def get(self, request, request_id):
+        booking_request = get_object_or_404(BookingRequest, id=request_id, user=request.user)
+        try:
+            wait = min(float(request.query_params.get('wait', 0)), settings.BOOKING_QUEUE_MAX_WAIT)
+        except ValueError:
+            return Response({"detail": "wait must be a number of seconds."}, status=status.HTTP_400_BAD_REQUEST)
+        if wait > 0:
+            semaphore = get_semaphore('booking_wait')
+            if semaphore.acquire(blocking=False):
+                try:
+                    booking_request = wait_for_result(booking_request, wait)
+                finally:
+                    semaphore.release()
+        return Response(BookingRequestSerializer(booking_request).data)
+
+
 class BookingReceiptView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, receipt_id):
-        booking = get_object_or_404(Booking, receipt_id=receipt_id, user=request.user)
-        serializer = BookingSerializer(booking)
+        booking = Booking.objects.filter(receipt_id=receipt_id, user=request.user).first()
+        if booking is None:
+            # Receipts of old trips stay valid after archival.
+            serializer = ArchivedBookingSerializer(
+                get_object_or_404(ArchivedBooking, receipt_id=receipt_id, user=request.user)
+            )
+        else:
+            serializer = BookingSerializer(booking)
         # Optionally generate PDF and return as response, or just JSON here
         return Response(serializer.data)
 
 
 class UserBookingsAPIView(generics.ListAPIView):
+    """
+    The user's bookings. Bookings of long-past trips live in the archive
+    (see api.archive) and are only listed with `?archived=true`, oldest
+    first, ahead of the current ones.
+    """
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -115,11 +296,14 @@ class UserBookingsAPIView(generics.ListAPIView):
         return Booking.objects.filter(user=self.request.user)
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+        fields = requested_fields(request)
+        data = serialize_bookings(self.get_queryset(), fields=fields)
+        if request.query_params.get('archived') in ('1', 'true'):
+            archived = ArchivedBooking.objects.filter(user=request.user).order_by('id')
+            data = serialize_archived_bookings(archived, fields=fields) + data
         return Response({
             "success": True,
-            "data": serializer.data,
+            "data": data,
         })
 
 
@@ -132,12 +316,17 @@ class AdminStatsAPIView(APIView):
         # Total Users count
         total_users = CustomUser.objects.count()
 
-        # Total bookings count
-        total_bookings = Booking.objects.count()
+        # Total bookings count, archived ones included
+        total_bookings = Booking.objects.count() + ArchivedBooking.objects.count()
 
         # Total spent on all confirmed bookings
-        total_spent_agg = Booking.objects.filter(status='confirmed').aggregate(total_spent=Sum('total_price'))
-        total_spent = total_spent_agg.get('total_spent') or 0
+        total_spent = sum(
+            (
+                model.objects.filter(status='confirmed').aggregate(total_spent=Sum('total_price'))['total_spent'] or 0
+                for model in (Booking, ArchivedBooking)
+            ),
+            0,
+        )
 
         # Active buses count
         active_buses = Bus.objects.filter(status='active').count()
@@ -169,7 +358,6 @@ class AdminStatsAPIView(APIView):
 
         # All bookings, latest first, serialized
         all_bookings = Booking.objects.all().order_by('-travel_date')
-        serializer = BookingSerializer(all_bookings, many=True)
 
         data = {
             'totalUsers': total_users,
@@ -178,7 +366,7 @@ class AdminStatsAPIView(APIView):
             'activeBuses': active_buses,
             'activeRoutes': active_routes,
             'chartData': chart_data,
-            'allBookings': serializer.data,
+            'allBookings': serialize_bookings(all_bookings, fields=requested_fields(request)),
         }
 
         return Response({
@@ -187,6 +375,94 @@ class AdminStatsAPIView(APIView):
         })
 
 
+class AdminCacheStatsAPIView(APIView):
+    """
+    Hit-rate counters of the HTTP response cache
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'success': True,
+            'data': get_stats(),
+        })
+
+
+class AdminAnalyticsAPIView(APIView):
+    """
+    Latest precomputed load factors and demand forecasts
+    (refreshed by `manage.py refresh_analytics`).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        run = AnalyticsRun.objects.order_by('-id').first()
+        if run is None:
+            return Response({"detail": "Analytics have not been computed yet."},
+                            status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'success': True,
+            'data': {
+                'generatedAt': run.created_at,
+                'bookingsProcessed': run.bookings_processed,
+                'loadFactors': run.load_factors,
+                'forecasts': run.forecasts,
+            },
+        })
+
+
+class AdminBookingEventsAPIView(APIView):
+    """
+    Booking events in commit order, for consumers outside this process.
+    Query params: ?after=<last event sequence seen> (default 0), ?limit= (at
+    most the stream page size). Continue from `lastSequence` while
+    `hasMore` is true.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = min(int(request.query_params.get('limit', events.STREAM_PAGE_SIZE)), events.STREAM_PAGE_SIZE)
+        except ValueError:
+            return Response({"detail": "after and limit must be integers."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        sequencing.stamp()
+        page = events.stream(after, max(limit, 1))
+        return Response({
+            'success': True,
+            'data': {
+                'events': [events.serialize(event) for event in page],
+                'lastSequence': page[-1].sequence if page else after,
+                'hasMore': len(page) == max(limit, 1),
+            },
+        })
+
+
+class AdminBookingSearchAPIView(APIView):
+    """
+    Bookings matching every term of ?q= in their receipt id, customer,
+    bus plate or passenger names, phones and e-mails, newest first (see
+    api.search). ?limit= caps the results.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"detail": "q is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', search.SEARCH_LIMIT)), search.MAX_SEARCH_LIMIT)
+        except ValueError:
+            return Response({"detail": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        booking_ids = search.search(query, max(limit, 1))
+        bookings = Booking.objects.filter(id__in=booking_ids).order_by('-id')
+        return Response({
+            "success": True,
+            "data": serialize_bookings(bookings, fields=requested_fields(request)),
+        })
+
+
 # ----- Conductor Dashboard Views -----
 
 
@@ -201,7 +477,10 @@ class ConductorBusesAPIView(generics.ListAPIView):
         user = self.request.user
         if user.role != 'conductor':
             return Bus.objects.none()
-        return Bus.objects.filter(conductor=user, status='active')
+        return with_times(Bus.objects.filter(conductor=user, status='active'))
+
+    def list(self, request, *args, **kwargs):
+        return Response(serialize_buses(self.get_queryset(), fields=requested_fields(request)))
 
 
 class ConductorBookingsAPIView(generics.ListAPIView):
@@ -218,6 +497,99 @@ class ConductorBookingsAPIView(generics.ListAPIView):
         bus_ids = Bus.objects.filter(conductor=user).values_list('id', flat=True)
         return Booking.objects.filter(bus_id__in=bus_ids).order_by('-travel_date')
 
+    def list(self, request, *args, **kwargs):
+        return Response(serialize_bookings(self.get_queryset(), fields=requested_fields(request)))
+
+
+class ConductorManifestAPIView(APIView):
+    """
+    Seat-by-seat passenger list of one of the conductor's buses on a date,
+    read from the tickets in one query, in seat layout order.
+    Query params: ?bus=<id>&date=YYYY-MM-DD, optionally &seat=<seat number>
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            bus_id = int(request.query_params.get('bus', ''))
+            travel_date = datetime.strptime(request.query_params.get('date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            return Response({"detail": "bus and date (YYYY-MM-DD) are required."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not Bus.objects.filter(id=bus_id, conductor=request.user).exists():
+            return Response({"detail": "Bus not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        tickets = Ticket.objects.filter(seat__bus_id=bus_id, travel_date=travel_date)
+        if request.query_params.get('seat'):
+            tickets = tickets.filter(seat__seat_number=request.query_params['seat'])
+        data = [
+            {
+                'ticket': ticket['id'],
+                'seat': ticket['seat_id'],
+                'seat_number': ticket['seat__seat_number'],
+                'booking': ticket['booking_id'],
+                'receipt_id': ticket['booking__receipt_id'],
+                'status': ticket['booking__status'],
+                'board_station': ticket['booking__board_station_id'],
+                'alight_station': ticket['booking__alight_station_id'],
+                'price': str(ticket['price']),
+                'passenger': passenger_entry(
+                    ticket['passenger_name'], ticket['passenger_phone'], ticket['passenger_email'],
+                    ticket['passenger_type'], ticket['seat_id'], ticket['seat__seat_number'],
+                ),
+            }
+            for ticket in sorted(
+                tickets.order_by('id').values(
+                    'id', 'seat_id', 'seat__seat_number', 'seat__deck', 'seat__row', 'seat__column',
+                    'booking_id', 'booking__receipt_id', 'booking__status', 'booking__board_station_id',
+                    'booking__alight_station_id', 'price',
+                    'passenger_name', 'passenger_phone', 'passenger_email', 'passenger_type',
+                ),
+                key=lambda ticket: layout_key(
+                    ticket['seat__deck'], ticket['seat__row'], ticket['seat__column'], ticket['seat__seat_number'],
+                ),
+            )
+        ]
+        return Response({"success": True, "data": data})
+
+
+class ConductorSummaryAPIView(CachedResponseMixin, generics.RetrieveAPIView):
+    """
+    Per bus and travel date of the authenticated conductor: departures,
+    seats offered, bookings, passengers, seats filled, revenue, and the next
+    departures, from grouped queries (see api.dashboard).
+    Query params: ?date=YYYY-MM-DD (default today), ?days=N (default 1)
+    Cached per conductor until one of their buses gets a booking change.
+    """
+    permission_classes = [IsAuthenticated]
+    cache_policy = 'dashboard'
+    vary_on_user = True
+
+    def get_cache_tags(self):
+        buses = Bus.objects.filter(conductor=self.request.user).values_list('id', 'route_id')
+        return [SCHEDULES_TAG] + [
+            tag for bus_id, route_id in buses for tag in (f'bus:{bus_id}', f'route:{route_id}')
+        ]
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.role != 'conductor':
+            return Response({"detail": "Only conductors have a dashboard."},
+                            status=status.HTTP_403_FORBIDDEN)
+        current = localtime()
+        try:
+            start = (
+                datetime.strptime(request.query_params['date'], '%Y-%m-%d').date()
+                if request.query_params.get('date') else current.date()
+            )
+            days = min(max(int(request.query_params.get('days', 1)), 1), MAX_SUMMARY_DAYS)
+        except ValueError:
+            return Response({"detail": "date must be YYYY-MM-DD and days an integer."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "success": True,
+            "data": conductor_summary(request.user, start, days, current),
+        })
+
 
 class UpdateBusLocationAPIView(APIView):
     """
@@ -239,14 +611,72 @@ class UpdateBusLocationAPIView(APIView):
         try:
             bus.latitude = float(latitude)
             bus.longitude = float(longitude)
-            bus.save()
+            bus.save(update_fields=['latitude', 'longitude'])
         except ValueError:
             return Response({"detail": "Invalid latitude or longitude."},
                             status=status.HTTP_400_BAD_REQUEST)
+        tracks.record(bus, now())
 
         return Response({"success": True, "message": "Location updated."})
 
 
+class BusTrackAPIView(APIView):
+    """
+    The path a bus travelled as a simplified polyline of [latitude, longitude, unix time] points.
+    Query params: ?from=&to= (ISO 8601 datetimes, default the last hour, at most
+    MAX_TRACK_WINDOW apart) and ?tolerance= in metres.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, bus_id):
+        bus = get_object_or_404(Bus, id=bus_id)
+        try:
+            end = self.parse_time(request.query_params.get('to')) or now()
+            start = self.parse_time(request.query_params.get('from')) or end - timedelta(hours=1)
+            tolerance = float(request.query_params.get('tolerance', tracks.DEFAULT_TOLERANCE))
+        except ValueError:
+            return Response({"detail": "from/to must be ISO 8601 datetimes and tolerance a number."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if start > end or end - start > MAX_TRACK_WINDOW:
+            return Response({"detail": f"from must be before to, at most {MAX_TRACK_WINDOW.days} days apart."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "success": True,
+            "data": {
+                "bus": bus.id,
+                "from": start,
+                "to": end,
+                **tracks.track(bus.id, start, end, tolerance),
+            },
+        })
+
+    @staticmethod
+    def parse_time(value):
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(value)
+        return parsed if is_aware(parsed) else make_aware(parsed)
+
+
+class BusETAAPIView(APIView):
+    """
+    Predicted arrival at each station the bus has not passed yet, as stored by
+    `manage.py refresh_etas`; 404 when it has no recent prediction.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, bus_id):
+        # Imported here so NumPy stays out of worker boot (see benchmark_startup).
+        from . import eta
+
+        prediction = eta.get_eta(bus_id, now())
+        if prediction is None:
+            return Response({"detail": "No recent prediction for this bus."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"success": True, "data": prediction})
+
+
 class UpdateBookingStatusAPIView(APIView):
     """
     Updates the status of a booking assigned to the authenticated conductor's bus.
@@ -261,11 +691,58 @@ class UpdateBookingStatusAPIView(APIView):
         booking = get_object_or_404(Booking, id=booking_id, bus_id__in=bus_ids)
 
         status_value = request.data.get('status')
-        allowed_statuses = ['pending', 'confirmed', 'cancelled', 'completed']
-        if status_value not in allowed_statuses:
-            return Response({"detail": f"Invalid status value. Allowed: {allowed_statuses}"},
+        if status_value not in BOOKING_STATUS_UPDATES:
+            return Response({"detail": f"Invalid status value. Allowed: {BOOKING_STATUS_UPDATES}"},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        booking.status = status_value
-        booking.save()
+        booking.set_status(status_value)
         return Response({"success": True, "message": "Booking status updated."})
+
+
+class ConductorSyncAPIView(APIView):
+    """
+    Returns only the manifest changes since the client's cursor for the
+    authenticated conductor's buses.
+    Query params: ?cursor=<opaque cursor from the previous sync>&limit=N
+    Cancelled and deleted bookings are listed in `removed` by id.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+        if user.role != 'conductor':
+            return Response({"detail": "Only conductors can sync manifests."},
+                            status=status.HTTP_403_FORBIDDEN)
+        try:
+            limit = min(int(request.query_params.get('limit', SYNC_PAGE_SIZE)), SYNC_PAGE_SIZE)
+        except ValueError:
+            return Response({"detail": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        bus_ids = list(Bus.objects.filter(conductor=user).values_list('id', flat=True))
+        try:
+            data = changes_since(bus_ids, request.query_params.get('cursor'), limit=max(limit, 1))
+        except InvalidCursor:
+            return Response({"detail": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"success": True, "data": data})
+
+
+class BatchUpdateBookingStatusAPIView(APIView):
+    """
+    Applies many status updates for the authenticated conductor's bookings in one transaction.
+    Expects JSON body: { "updates": [ { "id": int, "status": str, "version": int (optional) }, ... ] }
+    Updates whose version does not match the booking's current version are reported as conflicts.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        updates = request.data.get('updates')
+        if not isinstance(updates, list) or not all(isinstance(update, dict) for update in updates):
+            return Response({"detail": "updates must be a list of objects."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(updates) > MAX_BATCH_UPDATES:
+            return Response({"detail": f"At most {MAX_BATCH_UPDATES} updates per request."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        bus_ids = set(Bus.objects.filter(conductor=request.user).values_list('id', flat=True))
+        results = apply_status_updates(bus_ids, updates, BOOKING_STATUS_UPDATES)
+        return Response({"success": True, "results": results})
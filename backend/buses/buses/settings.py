@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -51,6 +52,14 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Only views with a `throttle_scope` listed in RATE_LIMITS are limited.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'api.throttling.TokenBucketThrottle',
+    ),
+    # Proxies in front of the app: the client address throttled by is the
+    # X-Forwarded-For entry the outermost of them added. With 0 the header
+    # is ignored (clients can write anything in it) and REMOTE_ADDR is used.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
 
 SIMPLE_JWT = {
@@ -67,19 +76,26 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
-    'corsheaders.middleware.CorsMiddleware', 
+    'api.middleware.CompressionMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ReplicaPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'buses.urls'
 
+# gzip/brotli compression of responses (api.middleware.CompressionMiddleware).
+# Brotli is used when the optional `brotli` package is installed.
+RESPONSE_COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', '') == '1'
+RESPONSE_COMPRESSION_MIN_LENGTH = 200
+RESPONSE_COMPRESSION_BROTLI_QUALITY = 5
+
 
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
@@ -102,6 +118,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'buses.wsgi.application'
 
+# Import the URLconf (and with it every view) when buses.wsgi/buses.asgi is
+# loaded rather than on the first request; see buses.startup.
+WARM_UP_ON_LOAD = False
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -113,6 +133,123 @@ DATABASES = {
     }
 }
 
+# Read replicas
+# Comma-separated SQLite files in DB_REPLICAS (e.g. "replica1.sqlite3") are
+# added as replica1, replica2, ... for local testing; add Postgres replicas
+# to DATABASES/REPLICA_DATABASES the same way in deployment settings.
+
+REPLICA_DATABASES = []
+for index, name in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    alias = f'replica{index}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / name.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+
+# Seconds a client keeps reading from the primary after one of its writes.
+REPLICA_STICKY_SECONDS = 5
+
+
+# Cache
+# The replica pin is stored here, so deployments with several workers need
+# a shared backend (Redis, Memcached or the database cache).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # Per-bus ETAs alone need one entry per active bus; the default of
+        # 300 would keep evicting them.
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+# Refuse to start (buses.startup) with a cache that is private to one
+# process; set by the multi-process production profile.
+REQUIRE_SHARED_CACHE = False
+
+# Rate limiting (see api.throttling)
+# Token buckets per scope: 'burst' tokens, refilled at 'rate'. Each bucket
+# applies per authenticated user, per client IP or to the whole endpoint.
+# Swap the store for api.throttling.DatabaseBucketStore or
+# InMemoryBucketStore as needed.
+
+RATE_LIMIT_STORE = 'api.throttling.CacheBucketStore'
+
+RATE_LIMITS = {
+    'login': {
+        'ip': {'rate': '10/min', 'burst': 10},
+        'endpoint': {'rate': '20/s', 'burst': 40},
+    },
+    'register': {
+        'ip': {'rate': '5/min', 'burst': 5},
+    },
+    'booking': {
+        'user': {'rate': '10/min', 'burst': 5},
+        'ip': {'rate': '30/min', 'burst': 15},
+    },
+    # Polling a queued booking's status
+    'booking_status': {
+        'user': {'rate': '1/s', 'burst': 10},
+    },
+}
+
+# Requests of a scope one worker process runs at once before shedding the
+# rest with 503; keep these below the number of worker threads.
+# 'booking_wait' caps the long-polls of queued bookings and
+# 'idempotency_wait' the retries waiting for their first attempt (see
+# api.idempotency); neither is shed, both are answered at once instead.
+CONCURRENCY_LIMITS = {
+    'login': 2,
+    'booking': 4,
+    'booking_wait': 2,
+    'idempotency_wait': 2,
+}
+CONCURRENCY_RETRY_AFTER = 1
+
+
+# Queued booking admission (see api.admission): bookings for departures
+# marked as HotDeparture are queued and decided by
+# `manage.py process_booking_queue`.
+BOOKING_ADMISSION_QUEUE = True
+# Longest a client may long-poll for a queued booking, in seconds.
+BOOKING_QUEUE_MAX_WAIT = 10
+
+# Days ahead, today included, that trips are generated and can be booked
+# (see api.schedules); also what `manage.py expand_trips` generates.
+BOOKING_HORIZON_DAYS = 30
+
+# Idempotency-Key handling of booking submissions (see api.idempotency):
+# how long a key's response is kept for retries, and how long a retry
+# waits for the first attempt to finish, in seconds.
+IDEMPOTENCY_KEY_TTL = 24 * 3600
+IDEMPOTENCY_WAIT = 5
+
+
+# HTTP caching of public GET endpoints (see api.caching).
+# store_timeout is how long the server keeps a rendered copy; it never goes
+# stale because the key includes the data's version tags.
+
+HTTP_CACHE_POLICIES = {
+    # Seat maps and buses per route/date: change with every booking.
+    'availability': {
+        'cache_control': {'public': True, 'max_age': 5, 's_maxage': 5},
+        'store_timeout': 300,
+    },
+    # Routes and stations: rarely change, clients revalidate with ETags.
+    'catalogue': {
+        'cache_control': {'public': True, 'max_age': 3600},
+        'store_timeout': 24 * 3600,
+    },
+    # Per-user dashboards: kept briefly, never by shared caches.
+    'dashboard': {
+        'cache_control': {'private': True, 'max_age': 10},
+        'store_timeout': 30,
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
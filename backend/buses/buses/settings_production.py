@@ -0,0 +1,142 @@
+"""
+Production settings for buses project.
+
+Select with DJANGO_SETTINGS_MODULE=buses.settings_production (set by
+gunicorn.conf.py). Everything not overridden here comes from settings.py;
+deployment-specific values are read from the environment.
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import REPLICA_DATABASES, REST_FRAMEWORK, RESPONSE_COMPRESSION, DATABASES, BASE_DIR
+
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host.strip()]
+
+# TLS is terminated by the proxy in front of gunicorn.
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+SESSION_COOKIE_SECURE = True
+CSRF_COOKIE_SECURE = True
+SECURE_SSL_REDIRECT = os.environ.get('DJANGO_SSL_REDIRECT', '') == '1'
+SECURE_HSTS_SECONDS = int(os.environ.get('DJANGO_HSTS_SECONDS', 0))
+
+
+# Only the middleware that does something in this deployment: compression
+# is usually left to the proxy, and replica pinning needs replicas.
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+if RESPONSE_COMPRESSION:
+    MIDDLEWARE.insert(0, 'api.middleware.CompressionMiddleware')
+if REPLICA_DATABASES:
+    MIDDLEWARE.append('api.middleware.ReplicaPinningMiddleware')
+
+# Load the URLconf when the app is imported, i.e. once in the gunicorn master.
+WARM_UP_ON_LOAD = True
+
+
+# Templates (admin only): compiled once per process.
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    },
+]
+
+
+# JSON only: the browsable API pulls in templates and forms on first use.
+# Client addresses for rate limiting come from the X-Forwarded-For entry of
+# the proxy in front of gunicorn; set NUM_PROXIES if there are more of them.
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+    ),
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1)),
+}
+
+
+# Cache: version tags, replica pins, rate-limit buckets and cached
+# responses must be seen by every worker process and by the management
+# commands, so the cache is shared:
+# Redis when REDIS_URL is set (needs the `redis` package), otherwise the
+# database (run `manage.py createcachetable` once). buses.startup refuses
+# to serve from a per-process cache.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'api_cache',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+REQUIRE_SHARED_CACHE = True
+
+
+# Database connections are kept open between requests.
+
+for alias in DATABASES:
+    DATABASES[alias]['CONN_MAX_AGE'] = int(os.environ.get('DJANGO_CONN_MAX_AGE', 60))
+    DATABASES[alias]['CONN_HEALTH_CHECKS'] = True
+
+
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+
+# Logging: warnings and errors to stderr. SQL is never logged (Django only
+# logs queries with DEBUG on, and the logger is capped here as well).
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.environ.get('DJANGO_LOG_LEVEL', 'WARNING'),
+    },
+    'loggers': {
+        'django.db.backends': {
+            'level': 'WARNING',
+            'propagate': True,
+        },
+    },
+}
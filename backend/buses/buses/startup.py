@@ -0,0 +1,44 @@
+"""
+Work done when a server loads buses.wsgi or buses.asgi.
+
+With WARM_UP_ON_LOAD, the URLconf and everything it imports are loaded up
+front. Under a preloading server (gunicorn `preload_app`) that happens
+once in the master process, so forked workers start with it in memory and
+their first request costs no more than any other.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.urls import get_resolver
+
+
+# Backends whose entries only the process that wrote them can see.
+PER_PROCESS_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def check_shared_cache():
+    """
+    With REQUIRE_SHARED_CACHE, fail instead of serving from a cache the other
+    workers cannot see: cache invalidation, rate limits and replica pins
+    would silently stop working across processes.
+    """
+    if not settings.REQUIRE_SHARED_CACHE:
+        return
+    for alias, config in settings.CACHES.items():
+        if config['BACKEND'] in PER_PROCESS_CACHES:
+            raise ImproperlyConfigured(
+                f"CACHES[{alias!r}] uses {config['BACKEND']}, which is private to each process; "
+                "configure Redis or the database cache."
+            )
+
+
+def warm_up():
+    if not settings.WARM_UP_ON_LOAD:
+        return
+    get_resolver().url_patterns
+    # DRF resolves its renderer, parser and authentication classes lazily.
+    from rest_framework.settings import api_settings
+    for name in ('DEFAULT_RENDERER_CLASSES', 'DEFAULT_PARSER_CLASSES', 'DEFAULT_AUTHENTICATION_CLASSES'):
+        getattr(api_settings, name)
@@ -11,6 +11,10 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from buses.startup import check_shared_cache, warm_up
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'buses.settings')
 
 application = get_wsgi_application()
+check_shared_cache()
+warm_up()
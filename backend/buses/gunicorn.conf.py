@@ -0,0 +1,38 @@
+"""
+Gunicorn launcher for the production settings.
+
+    DJANGO_SECRET_KEY=... DJANGO_ALLOWED_HOSTS=example.com gunicorn buses.wsgi
+
+(gunicorn reads ./gunicorn.conf.py automatically). For ASGI, install
+uvicorn-worker and run `gunicorn buses.asgi -k uvicorn_worker.UvicornWorker`.
+
+The app is preloaded in the master and workers are forked from it, so the
+import cost is paid once and the code is shared copy-on-write.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'buses.settings_production')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Threads per worker; keep CONCURRENCY_LIMITS below this.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+preload_app = True
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound memory growth.
+max_requests = 5000
+max_requests_jitter = 500
+
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    # Database connections must not be shared between processes.
+    from django.db import connections
+
+    connections.close_all()